@@ -0,0 +1,146 @@
+import random
+from collections import namedtuple
+
+from pdf_generator_core import PAGE_TASK_MAP, items_needed
+
+# Cohort-wide task assignment. select_unique_tasks() only keeps items unique
+# inside one document; this assigns every document of a batch at once, one
+# document per student in seat order, with constraints across documents:
+#
+#   * unique within a document - always (a pool smaller than the demand is
+#     reported as a shortfall and its cells stay "-", as before)
+#   * exclusive pools - students of the same group never share an item of
+#     the pool (hard constraint whenever group_size * demand <= pool size)
+#   * neighbouring seats - a student's items avoid the previous seat's items
+#     as far as the pool allows (overlap max(0, 2 * demand - pool size))
+#   * even usage - otherwise the least used items are taken first, so usage
+#     counts across the cohort stay within a small spread
+#
+# Each document picks the `demand` best items of its pool by
+# (used in group, used by neighbour, usage so far, seeded tie-break), i.e.
+# O(pool log pool) per document and pool: thousands of students x 15 pools
+# of ~100 items take seconds. Every pool draws from its own Random seeded
+# from (seed, task key), so the result depends only on the seed and inputs.
+
+# Per-pool outcome of an assignment. The *_bound fields are the best any
+# assignment could achieve; compare them with the measured values.
+PoolReport = namedtuple("PoolReport", [
+    "task_key", "pool_size", "demand", "exclusive",
+    "shortfall",                        # items missing per document (pool smaller than demand)
+    "group_conflicts",                  # items shared inside a group of an exclusive pool
+    "max_neighbour_overlap", "neighbour_overlap_bound",
+    "min_usage", "max_usage", "ideal_usage",
+])
+
+
+def pool_demands(tasks_data, page_task_map=None):
+    """Returns {task_key: [(page_num, item_count), ...]} in page order for keys present in tasks_data."""
+    page_task_map = PAGE_TASK_MAP if page_task_map is None else page_task_map
+    demands = {}
+    for page_num in sorted(page_task_map):
+        task_key, needed_count, structure_info, _ = page_task_map[page_num]
+        if task_key not in tasks_data:
+            print(f"Warning: Task key '{task_key}' not found in tasks data for page {page_num}. Skipping.")
+            continue
+        demands.setdefault(task_key, []).append((page_num, items_needed(needed_count, structure_info)))
+    return demands
+
+
+def assign_pool(pool_size, demand, num_documents, rng, group_size=1, exclusive=False):
+    """Picks `demand` distinct item indices per document. Returns (picks, stats).
+
+    Documents are seats in order; seats [0, group_size), [group_size, 2 * group_size), ...
+    form groups. stats holds the measured group conflicts and neighbour overlaps.
+    """
+    take = min(demand, pool_size)
+    usage = [0] * pool_size
+    # Key weights: group use dominates neighbour use, which dominates usage (< num_documents + 1)
+    neighbour_weight = num_documents + 1
+    group_weight = 2 * neighbour_weight
+    picks = []
+    previous = ()
+    group_used = set()
+    group_conflicts = 0
+    max_overlap = 0
+    for doc in range(num_documents):
+        if doc % group_size == 0:
+            group_used = set()
+        keys = [usage[i] + rng.random() for i in range(pool_size)]
+        for i in previous:
+            keys[i] += neighbour_weight
+        if exclusive:
+            for i in group_used:
+                keys[i] += group_weight
+        chosen = sorted(range(pool_size), key=keys.__getitem__)[:take]
+        if exclusive:
+            group_conflicts += sum(1 for i in chosen if i in group_used)
+            group_used.update(chosen)
+        if previous:
+            max_overlap = max(max_overlap, len(set(previous).intersection(chosen)))
+        for i in chosen:
+            usage[i] += 1
+        rng.shuffle(chosen) # Row order must not follow usage order
+        picks.append(chosen)
+        previous = chosen
+    stats = {"group_conflicts": group_conflicts, "max_neighbour_overlap": max_overlap, "usage": usage}
+    return picks, stats
+
+
+def assign_tasks(tasks_data, num_documents, seed=0, group_size=1, exclusive_keys=(), page_task_map=None):
+    """Assigns tasks to num_documents students at once.
+
+    Returns (selections, reports): selections[i] is the {page_num: tasks}
+    map for seat i, ready for DocumentGenerator.generate(); reports lists a
+    PoolReport per task key.
+    """
+    if num_documents < 1:
+        raise ValueError("num_documents must be at least 1")
+    if group_size < 1:
+        raise ValueError("group_size must be at least 1")
+    page_task_map = PAGE_TASK_MAP if page_task_map is None else page_task_map
+    demands = pool_demands(tasks_data, page_task_map)
+    unknown = set(exclusive_keys) - set(demands)
+    if unknown:
+        raise ValueError(f"Exclusive task key(s) not used by any page: {', '.join(sorted(unknown))}")
+
+    # Keys missing from tasks_data select nothing, like select_unique_tasks
+    selections = [{page_num: [] for page_num in page_task_map} for _ in range(num_documents)]
+    reports = []
+    for task_key, pages in demands.items():
+        pool = tasks_data[task_key]
+        demand = sum(count for _, count in pages)
+        exclusive = task_key in exclusive_keys
+        picks, stats = assign_pool(len(pool), demand, num_documents, random.Random(f"{seed}:{task_key}"),
+                                   group_size, exclusive)
+        for selection, chosen in zip(selections, picks):
+            start = 0
+            for page_num, count in pages: # Pages sharing a pool take consecutive slices
+                selection[page_num] = [pool[i] for i in chosen[start:start + count]]
+                start += count
+        usage = stats["usage"]
+        take = min(demand, len(pool))
+        reports.append(PoolReport(
+            task_key=task_key, pool_size=len(pool), demand=demand, exclusive=exclusive,
+            shortfall=demand - take,
+            group_conflicts=stats["group_conflicts"],
+            max_neighbour_overlap=stats["max_neighbour_overlap"],
+            neighbour_overlap_bound=max(0, 2 * take - len(pool)) if num_documents > 1 else 0,
+            min_usage=min(usage) if usage else 0, max_usage=max(usage) if usage else 0,
+            ideal_usage=num_documents * take / len(pool) if pool else 0.0,
+        ))
+    return selections, reports
+
+
+def format_report(reports, group_size=1):
+    """Returns the human-readable guarantee table printed by the CLI."""
+    lines = [f"{'pool':<12} {'size':>5} {'need':>5} {'short':>5} {'neigh. overlap':>15} {'usage min/max':>14} {'ideal':>7}"
+             f"{'  group conflicts' if any(r.exclusive for r in reports) else ''}"]
+    for r in reports:
+        line = (f"{r.task_key:<12} {r.pool_size:>5} {r.demand:>5} {r.shortfall:>5} "
+                f"{f'{r.max_neighbour_overlap} (min {r.neighbour_overlap_bound})':>15} "
+                f"{f'{r.min_usage}/{r.max_usage}':>14} {r.ideal_usage:>7.1f}")
+        if r.exclusive:
+            feasible = group_size * (r.demand - r.shortfall) <= r.pool_size
+            line += f"  {r.group_conflicts}{'' if feasible else ' (group needs more items than the pool has)'}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,389 @@
+"""Benchmarks and profiling hooks for the generation pipeline.
+
+Usage:
+    python -m pdf_generator_bench tables --count 5
+    python -m pdf_generator_bench pipeline --count 10 --save-baseline bench/baseline.json
+    python -m pdf_generator_bench pipeline --count 10 --baseline bench/baseline.json
+    python -m pdf_generator_bench startup --repeat 5
+
+Set PDF_GENERATOR_PROFILE=out.prof to run any bench or pdf_generator_cli
+command under cProfile (main process only), and PDF_GENERATOR_TRACE=1 to
+print per-document stage timings.
+"""
+import argparse
+import cProfile
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from pdf_generator_args import non_negative_float, positive_int
+from pdf_generator_cells import format_stats
+from pdf_generator_lazy import lazy_import
+from pdf_generator_core import (
+    TASKS_JSON_PATH, SOURCE_PDF_PATH, ANCHOR_INDEX_PATH, COPY_MODES, COPY_MODE_CLONE, PIPELINE_STAGES,
+    TABLE_BACKENDS, TABLE_BACKEND_REPORTLAB,
+    DocumentGenerator, PageMapError, configure_page_map, load_tasks, save_document,
+)
+
+fitz = lazy_import("fitz")  # PyMuPDF
+reportlab = lazy_import("reportlab")
+
+PROFILE_ENV = "PDF_GENERATOR_PROFILE" # cProfile output path; unset = no profiling
+BASELINE_FORMAT = 1
+NOISE_FLOOR_MS = 5.0 # Timing changes smaller than this never count as regressions
+STARTUP_MODULES = ("pdf_generator_cli", "pdf_generator_service", "pdf_generator_bench", "pdf_generator_app")
+HELP_MODULES = ("pdf_generator_cli", "pdf_generator_service", "pdf_generator_bench") # Headless tools
+STARTUP_BUDGET_MS = 200.0 # Target for `--help` and for the app window to accept input
+# Child for the window measurement: prints once the first frame is drawn, then exits without cleanup
+WINDOW_PROBE = ("import os, tkinter; root = tkinter.Tk(); import pdf_generator_app; "
+                "pdf_generator_app.PdfGeneratorApp(root); root.update(); print('ready', flush=True); os._exit(0)")
+
+
+# --- Profiling / measurement helpers ---
+
+@contextmanager
+def profile_hook():
+    """Runs the with-block under cProfile when PDF_GENERATOR_PROFILE is set."""
+    profile_path = os.environ.get(PROFILE_ENV)
+    if not profile_path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+        print(f"Wrote cProfile stats to {profile_path}")
+
+
+def peak_rss_bytes():
+    """Returns this process's peak resident set size in bytes, or None where unsupported."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports KiB
+
+
+def bench_table_backend(tasks_data, table_backend, seeds, source_pdf_path=SOURCE_PDF_PATH,
+                        anchor_index_path=ANCHOR_INDEX_PATH):
+    """Generates one document per seed with table_backend. Returns a result dict."""
+    generator = DocumentGenerator(tasks_data, source_pdf_path, anchor_index_path=anchor_index_path,
+                                  table_backend=table_backend)
+    generate_seconds = save_seconds = 0.0
+    output_bytes = 0
+    try:
+        # Warm-up document: fills template/font caches and is not counted
+        warm_doc, _ = generator.generate(seed=seeds[0])
+        warm_doc.close()
+        generator.table_seconds = 0.0
+        with tempfile.TemporaryDirectory() as out_dir:
+            for seed in seeds:
+                start = time.perf_counter()
+                output_doc, _ = generator.generate(seed=seed)
+                generate_seconds += time.perf_counter() - start
+                output_pdf_path = os.path.join(out_dir, f"variant_{seed}.pdf")
+                start = time.perf_counter()
+                try:
+                    save_document(output_doc, output_pdf_path)
+                finally:
+                    output_doc.close()
+                save_seconds += time.perf_counter() - start
+                output_bytes += os.path.getsize(output_pdf_path)
+        result = {
+            "backend": table_backend,
+            "documents": len(seeds),
+            "table_ms": generator.table_seconds * 1000 / len(seeds),
+            "generate_ms": generate_seconds * 1000 / len(seeds),
+            "save_ms": save_seconds * 1000 / len(seeds),
+            "output_bytes": output_bytes // len(seeds),
+        }
+        if generator.direct_renderer:
+            result["direct_tables"] = generator.direct_renderer.rendered
+            result["reportlab_fallbacks"] = generator.direct_renderer.fallbacks
+        return result
+    finally:
+        generator.close()
+
+
+def bench_pipeline(tasks_data, seeds, source_pdf_path=SOURCE_PDF_PATH, anchor_index_path="",
+                   copy_mode=COPY_MODE_CLONE, table_backend=TABLE_BACKEND_REPORTLAB):
+    """Generates and saves one document per seed, timing every pipeline stage. Returns a result dict.
+
+    Stage times are ms per document, except "anchors" (once per run: an
+    empty anchor_index_path forces the full-text search).
+    """
+    run_start = time.perf_counter()
+    generator = DocumentGenerator(tasks_data, source_pdf_path, copy_mode, anchor_index_path, table_backend)
+    setup_seconds = time.perf_counter() - run_start
+    output_bytes = 0
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            docs_start = time.perf_counter()
+            for seed in seeds:
+                output_doc, _ = generator.generate(seed=seed)
+                output_pdf_path = os.path.join(out_dir, f"variant_{seed}.pdf")
+                try:
+                    with generator.timed("save"):
+                        save_document(output_doc, output_pdf_path)
+                finally:
+                    output_doc.close()
+                output_bytes += os.path.getsize(output_pdf_path)
+            docs_seconds = time.perf_counter() - docs_start
+        stages_ms = {stage: generator.stage_seconds[stage] * 1000 / (1 if stage == "anchors" else len(seeds))
+                     for stage in PIPELINE_STAGES}
+        cell_cache = generator.cell_cache.stats()
+    finally:
+        generator.close()
+    return {
+        "documents": len(seeds),
+        "setup_ms": setup_seconds * 1000,
+        "stages_ms": stages_ms,
+        "document_ms": docs_seconds * 1000 / len(seeds),
+        "docs_per_s": len(seeds) / docs_seconds if docs_seconds > 0 else 0.0,
+        "output_bytes": output_bytes // len(seeds),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "cell_cache": cell_cache,
+    }
+
+
+def flatten_metrics(result):
+    """Returns {metric name: value} for every number in a pipeline result (lower is better, except docs/s)."""
+    metrics = {f"stage.{stage}_ms": ms for stage, ms in result["stages_ms"].items()}
+    for key in ("setup_ms", "document_ms", "docs_per_s", "output_bytes", "peak_rss_bytes"):
+        if result.get(key) is not None:
+            metrics[key] = result[key]
+    return metrics
+
+
+def compare_to_baseline(result, baseline, tolerance):
+    """Prints current vs baseline per metric. Returns the metrics that regressed by more than tolerance (a fraction)."""
+    current, before = flatten_metrics(result), flatten_metrics(baseline["result"])
+    regressions = []
+    print(f"{'metric':<24} {'baseline':>14} {'current':>14} {'change':>9}")
+    for name, value in current.items():
+        if name not in before:
+            continue
+        old = before[name]
+        change = (value - old) / old if old else 0.0
+        worse = -change if name == "docs_per_s" else change
+        # A few ms of jitter on a short stage is noise, not a regression
+        noise = name.endswith("_ms") and abs(value - old) < NOISE_FLOOR_MS
+        regressed = worse > tolerance and not noise
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<24} {old:>14.1f} {value:>14.1f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def run_pipeline(args):
+    """Per-stage pipeline benchmark, optionally saved as / compared with a baseline JSON."""
+    tasks_data = load_tasks(args.tasks)
+    seeds = list(range(args.seed_base, args.seed_base + args.count))
+    result = bench_pipeline(tasks_data, seeds, args.source, args.anchors, args.copy_mode, args.table_backend)
+
+    print(f"{'stage':<14} {'ms/doc':>10}")
+    for stage, ms in result["stages_ms"].items():
+        print(f"{stage:<14} {ms:>10.1f}{'  (once per run)' if stage == 'anchors' else ''}")
+    print(f"Setup {result['setup_ms']:.0f}ms, {result['document_ms']:.1f}ms/doc ({result['docs_per_s']:.2f} docs/s), "
+          f"{result['output_bytes']} bytes/doc, peak RSS "
+          f"{'n/a' if result['peak_rss_bytes'] is None else '%.1f MiB' % (result['peak_rss_bytes'] / 2**20)}")
+    print(f"Cell layout cache: {format_stats(result['cell_cache'])}")
+
+    config = {"count": args.count, "seed_base": args.seed_base, "copy_mode": args.copy_mode,
+              "table_backend": args.table_backend, "anchor_index": bool(args.anchors)}
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Warning: baseline {args.baseline} was recorded with {baseline.get('config')}, this run uses {config}.")
+        regressions = compare_to_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            status = 1
+    if args.save_baseline:
+        baseline_dir = os.path.dirname(args.save_baseline)
+        if baseline_dir:
+            os.makedirs(baseline_dir, exist_ok=True)
+        baseline = {
+            "format": BASELINE_FORMAT,
+            "recorded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                            "pymupdf": fitz.VersionBind, "reportlab": reportlab.Version},
+            "config": config,
+            "result": result,
+        }
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Wrote baseline to {args.save_baseline}")
+    return status
+
+
+def startup_env():
+    """Environment for child interpreters: this checkout importable, nothing cached in-process."""
+    env = dict(os.environ)
+    here = os.path.dirname(os.path.abspath(__file__))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [here, env.get("PYTHONPATH")]))
+    return env
+
+
+def import_times(module, env):
+    """Runs `python -X importtime -c "import module"`.
+
+    Returns (cumulative ms of module, [(self ms, name), ...] of every import).
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env,
+                               capture_output=True, text=True, check=True)
+    total_ms = None
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(self_us) / 1000, name.strip()))
+        if name.strip() == module:
+            total_ms = int(cumulative_us) / 1000
+    return total_ms, imports
+
+
+def wall_ms(command, env, ready=None):
+    """Wall time of a child command until it exits, or until it prints `ready`. None if it fails."""
+    start = time.perf_counter()
+    child = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if ready is None:
+        child.communicate()
+        ok = child.returncode == 0
+    else:
+        ok = any(line.strip() == ready for line in child.stdout) # Stops reading at the first match
+    elapsed = (time.perf_counter() - start) * 1000
+    if child.poll() is None:
+        child.kill()
+        child.communicate()
+    return elapsed if ok else None
+
+
+def bench_startup(repeat=5, modules=STARTUP_MODULES, help_modules=HELP_MODULES):
+    """Cold-start timings, best of `repeat` runs each. Returns a result dict."""
+    env = startup_env()
+    result = {"import_ms": {}, "heaviest_imports": {}, "help_ms": {}, "window_ms": None}
+    for module in modules:
+        runs = [import_times(module, env) for _ in range(repeat)]
+        total_ms, imports = min(runs, key=lambda run: run[0])
+        result["import_ms"][module] = total_ms
+        result["heaviest_imports"][module] = sorted(imports, reverse=True)[:5]
+    for module in help_modules:
+        runs = [wall_ms([sys.executable, "-m", module, "--help"], env) for _ in range(repeat)]
+        result["help_ms"][module] = None if None in runs else min(runs)
+    # Needs a display; headless machines report n/a
+    runs = []
+    for _ in range(repeat):
+        runs.append(wall_ms([sys.executable, "-c", WINDOW_PROBE], env, ready="ready"))
+        if runs[-1] is None:
+            break
+    result["window_ms"] = None if None in runs else min(runs)
+    return result
+
+
+def run_startup(args):
+    """Import-time and time-to-interactive benchmark; exit 1 when over the budget."""
+    result = bench_startup(args.repeat)
+    over_budget = []
+
+    def budget_mark(name, ms):
+        if ms is None:
+            return "n/a"
+        if ms > args.budget_ms:
+            over_budget.append(name)
+            return f"{ms:.0f}ms  (over {args.budget_ms:.0f}ms budget)"
+        return f"{ms:.0f}ms"
+
+    print(f"{'module':<24} {'import ms':>10}  heaviest imports (self ms)")
+    for module, total_ms in result["import_ms"].items():
+        heaviest = ", ".join(f"{name} {ms:.1f}" for ms, name in result["heaviest_imports"][module][:3])
+        print(f"{module:<24} {total_ms:>10.1f}  {heaviest}")
+    for module, ms in result["help_ms"].items():
+        print(f"{module} --help: {budget_mark(module + ' --help', ms)}")
+    print(f"pdf_generator_app window: {budget_mark('app window', result['window_ms'])}"
+          f"{'' if result['window_ms'] is not None else ' (no display?)'}")
+    if over_budget:
+        print(f"Over the startup budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+def run_tables(args):
+    """Compares the table backends on the same seeds."""
+    tasks_data = load_tasks(args.tasks)
+    seeds = list(range(args.seed_base, args.seed_base + args.count))
+    results = [bench_table_backend(tasks_data, backend, seeds, args.source, args.anchors)
+               for backend in TABLE_BACKENDS]
+    print(f"{'backend':<10} {'tables ms/doc':>14} {'generate ms/doc':>16} {'save ms/doc':>12} {'bytes/doc':>11}")
+    for result in results:
+        print(f"{result['backend']:<10} {result['table_ms']:>14.1f} {result['generate_ms']:>16.1f} "
+              f"{result['save_ms']:>12.1f} {result['output_bytes']:>11}")
+        if "direct_tables" in result:
+            print(f"{'':<10} direct tables: {result['direct_tables']}, ReportLab fallbacks: {result['reportlab_fallbacks']}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pdf_generator_bench", description="Generation pipeline benchmarks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tables = subparsers.add_parser("tables", help="Compare the ReportLab and direct table backends.")
+    tables.add_argument("--count", type=positive_int, default=5, help="Documents per backend.")
+    tables.add_argument("--seed-base", type=int, default=0)
+    tables.add_argument("--tasks", default=TASKS_JSON_PATH, help="Path to tasks.json or a task store.")
+    tables.add_argument("--source", default=SOURCE_PDF_PATH, help="Path to the source PDF.")
+    tables.add_argument("--anchors", default=ANCHOR_INDEX_PATH, help="Anchor index from `pdf_generator_cli analyze`.")
+    tables.set_defaults(func=run_tables)
+
+    pipeline = subparsers.add_parser("pipeline", help="Time every pipeline stage; save or compare baseline JSON.")
+    pipeline.add_argument("--count", type=positive_int, default=10, help="Documents to generate.")
+    pipeline.add_argument("--seed-base", type=int, default=0)
+    pipeline.add_argument("--tasks", default=TASKS_JSON_PATH, help="Path to tasks.json or a task store.")
+    pipeline.add_argument("--source", default=SOURCE_PDF_PATH, help="Path to the source PDF.")
+    pipeline.add_argument("--anchors", default=None,
+                          help="Anchor index to load; by default anchors are searched so the search is timed.")
+    pipeline.add_argument("--copy-mode", choices=COPY_MODES, default=COPY_MODE_CLONE)
+    pipeline.add_argument("--table-backend", choices=TABLE_BACKENDS, default=TABLE_BACKEND_REPORTLAB)
+    pipeline.add_argument("--save-baseline", metavar="JSON", help="Write this run's results as a baseline.")
+    pipeline.add_argument("--baseline", metavar="JSON", help="Compare with a saved baseline; exit 1 on regressions.")
+    pipeline.add_argument("--tolerance", type=non_negative_float, default=0.10,
+                          help="Allowed slowdown/growth per metric before it counts as a regression (default 0.10).")
+    pipeline.set_defaults(func=run_pipeline)
+
+    startup = subparsers.add_parser("startup", help="Cold-start import times, `--help` and app window latency.")
+    startup.add_argument("--repeat", type=positive_int, default=5, help="Runs per measurement; the best one counts.")
+    startup.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                         help=f"Exit 1 if `--help` or the app window takes longer (default {STARTUP_BUDGET_MS:.0f}).")
+    startup.set_defaults(func=run_startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        page_map_path = configure_page_map() # $PDF_GENERATOR_PAGES or ./pages.json, like the CLI
+    except PageMapError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    if page_map_path:
+        print(f"Using page map {page_map_path}")
+    with profile_hook():
+        return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
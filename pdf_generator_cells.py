@@ -0,0 +1,114 @@
+import functools
+from collections import OrderedDict, namedtuple
+
+from pdf_generator_lazy import lazy_import
+
+platypus = lazy_import("reportlab.platypus")
+
+# Wrapped table cells, memoized across documents. A batch draws the same
+# task strings over and over (every pool item turns up in many documents),
+# and laying a cell out - parsing the Paragraph markup, breaking it into
+# lines at the column width - gives the same result every time. Both table
+# backends keep their measured cells in one CellLayoutCache per generator
+# (so per worker process), keyed by (text, style name, available width),
+# and row heights follow from the cached cells without a Table.wrap pass.
+
+CELL_CACHE_ENTRIES = 4096 # Default size limit; 0 (or less) disables the cache
+CELL_CACHE_BYTES = 0 # Default byte limit (estimated, see layout_size); 0 (or less) = entries only
+
+# paragraph: the wrapped ReportLab Paragraph (None for the direct backend)
+# lines:     [(line text, line width), ...], or None if the cell cannot be
+#            drawn directly (the ReportLab path does not need them)
+# height:    paragraph height in points, cell paddings excluded
+CellLayout = namedtuple("CellLayout", ["paragraph", "lines", "height"])
+
+# Rough per-entry memory, measured on tasks.json cells: a wrapped Paragraph
+# holds its parsed fragments and line breaks, ~2.5 KB for a 40 character cell
+PARAGRAPH_BASE_BYTES = 1024
+PARAGRAPH_CHAR_BYTES = 40
+LINES_BASE_BYTES = 256
+LINES_CHAR_BYTES = 4
+
+
+@functools.cache
+def cached_paragraph_class():
+    """Paragraph subclass whose wrap() returns the previous result when the width is unchanged.
+
+    Paragraph.wrap depends on the width alone, but Table wraps every cell
+    again right before drawing it; a cached cell keeps its line breaks.
+    Built on first use so importing this module does not load ReportLab.
+    """
+    class CachedParagraph(platypus.Paragraph):
+        _wrapped = None # (availWidth, (width, height)) of the last wrap
+
+        def wrap(self, availWidth, availHeight):
+            if self._wrapped is None or self._wrapped[0] != availWidth:
+                self._wrapped = (availWidth, super().wrap(availWidth, availHeight))
+            return self._wrapped[1]
+
+    return CachedParagraph
+
+
+def layout_size(key, layout):
+    """Estimated bytes held by one cache entry."""
+    text_length = len(key[1])
+    if layout.paragraph is not None:
+        return PARAGRAPH_BASE_BYTES + PARAGRAPH_CHAR_BYTES * text_length
+    return LINES_BASE_BYTES + LINES_CHAR_BYTES * text_length
+
+
+class CellLayoutCache:
+    """Least recently used CellLayouts, bounded by entry count and/or estimated bytes.
+
+    Keys are (backend, text, style name, available width): both backends
+    may share one cache, but their layouts are not interchangeable.
+    """
+
+    def __init__(self, max_entries=CELL_CACHE_ENTRIES, max_bytes=CELL_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # key -> (layout, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, layout):
+        if self.max_entries <= 0:
+            return
+        size = layout_size(key, layout)
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._entries[key] = (layout, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or (self.max_bytes > 0 and self.bytes > self.max_bytes
+                                                         and len(self._entries) > 1):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        """Counters for sizing the cache: {"hits", "misses", "evictions", "entries", "bytes"}."""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(self._entries), "bytes": self.bytes}
+
+
+def format_stats(stats):
+    """One-line summary of (summed) stats() counters."""
+    lookups = stats["hits"] + stats["misses"]
+    rate = stats["hits"] / lookups if lookups else 0.0
+    return (f"{stats['hits']} hits, {stats['misses']} misses ({rate:.0%} hit rate), {stats['evictions']} evictions, "
+            f"{stats['entries']} entries (~{stats['bytes'] / 2**20:.1f} MiB)")
@@ -0,0 +1,612 @@
+"""Headless command line entry point for batch variant generation.
+
+Usage:
+    python -m pdf_generator_cli batch --count 300 --out booklets/ --seed-base 1000
+    python -m pdf_generator_cli batch --count 300 --out booklets/ --workers 8
+    python -m pdf_generator_cli batch --count 300 --out booklets/ --assign --group-size 25 --exclusive LAB6
+    python -m pdf_generator_cli analyze
+    python -m pdf_generator_cli compile
+    python -m pdf_generator_cli batch --count 300 --out booklets/ --tasks tasks.store
+    python -m pdf_generator_cli update --out booklets/
+    python -m pdf_generator_cli batch --count 300 --out booklets.zip --workers 8 --garbage 1 --no-deflate
+    python -m pdf_generator_cli batch --count 1 --out - > variant.pdf
+    python -m pdf_generator_cli batch --count 60 --out groups/ --merge combined --merge-group 30
+    python -m pdf_generator_cli --pages pages.json analyze
+    python -m pdf_generator_cli batch --count 300 --out booklets/ --cell-cache 8192 --cell-cache-mb 32
+    python -m pdf_generator_cli batch --count 300 --out booklets/ --workers 8 --verify verify.json
+    python -m pdf_generator_cli batch --count 300 --out booklets/ --workers 8 --window 40 --source big_manual.pdf
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# PyMuPDF prints its notices to stdout by default; keep them off it so that
+# `--out -` streams nothing but the document (or tar) bytes
+os.environ.setdefault("PYMUPDF_MESSAGE", "fd:2")
+
+from pdf_generator_lazy import lazy_import
+from pdf_generator_core import (
+    TASKS_JSON_PATH, TASK_STORE_PATH, SOURCE_PDF_PATH, ANCHOR_INDEX_PATH, PAGE_MAP_ENV, COPY_MODES, COPY_MODE_CLONE,
+    TABLE_BACKENDS, TABLE_BACKEND_REPORTLAB, SAVE_GARBAGE, SAVE_GARBAGE_LEVELS, SAVE_DEFLATE, WINDOW_SAVE_GARBAGE,
+    AnchorIndexError, DocumentGenerator, PageMapError, TaskStoreError, analyze_anchors, compile_tasks,
+    configure_page_map, document_bytes, load_anchor_index, load_tasks, save_anchor_index, save_document,
+    save_task_store, source_sha256,
+)
+from pdf_generator_args import non_negative_float, non_negative_int, positive_int
+from pdf_generator_assign import assign_tasks, format_report
+from pdf_generator_bench import peak_rss_bytes, profile_hook
+from pdf_generator_cells import CELL_CACHE_BYTES, CELL_CACHE_ENTRIES, CellLayoutCache, format_stats
+from pdf_generator_incremental import (
+    MANIFEST_SUFFIX, ManifestError, TableCache, build_manifest, find_manifests, load_manifest, manifest_bytes,
+    manifest_path, save_manifest,
+)
+from pdf_generator_merge import MERGE_MODES, MERGE_SHEETS, MergedOutput
+from pdf_generator_sinks import open_sink
+from pdf_generator_verify import build_report, describe_failures, save_report, verify_document
+
+fitz = lazy_import("fitz")  # PyMuPDF
+
+NAME_PATTERN_FIELDS = ("seed", "index") # What --name-pattern may use
+
+
+# --- Per-process state ---
+# Each process (the main one in serial mode, every pool worker otherwise)
+# owns exactly one generator: source PDF opened and fonts registered once.
+_worker_generator = None
+_worker_save_settings = {}
+_worker_verify = False # Read every document back and check its tables (pdf_generator_verify)
+_worker_work_dir = None # --window: where documents are built on disk
+_worker_init_error = None # Why _init_pool_worker failed; raised by _generate_one
+
+# Errors reported as "ERROR: ..." and exit status 1 instead of a traceback
+REPORTED_ERRORS = (AnchorIndexError, TaskStoreError, ManifestError, PageMapError, OSError)
+
+# `update` may meet documents built with different modes: one generator per (copy_mode, table_backend)
+_update_generators = {}
+_update_config = None
+
+
+def _init_worker(tasks_path, source_pdf_path, copy_mode=COPY_MODE_CLONE, anchor_index_path=ANCHOR_INDEX_PATH,
+                 table_backend=TABLE_BACKEND_REPORTLAB, table_cache_dir=None, garbage=SAVE_GARBAGE,
+                 deflate=SAVE_DEFLATE, cell_cache_entries=CELL_CACHE_ENTRIES, cell_cache_bytes=CELL_CACHE_BYTES,
+                 verify=False, window=0, work_dir=None):
+    """Process initializer: loads tasks, opens the source and registers fonts."""
+    global _worker_generator, _worker_save_settings, _worker_verify, _worker_work_dir
+    configure_page_map() # main() put the map it loaded in the environment; spawned workers start without it
+    _worker_save_settings = {"garbage": garbage, "deflate": deflate}
+    _worker_verify = verify
+    _worker_work_dir = work_dir
+    table_cache = TableCache(table_cache_dir) if table_cache_dir else None
+    _worker_generator = DocumentGenerator(load_tasks(tasks_path), source_pdf_path, copy_mode, anchor_index_path,
+                                          table_backend, table_cache,
+                                          CellLayoutCache(cell_cache_entries, cell_cache_bytes), window)
+
+
+def _init_pool_worker(*args):
+    """Pool initializer: _init_worker, but a failure is raised with the first result, not as a broken pool."""
+    global _worker_init_error
+    try:
+        _init_worker(*args)
+    except REPORTED_ERRORS as e:
+        _worker_init_error = e
+
+
+def _close_worker():
+    global _worker_generator
+    if _worker_generator: _worker_generator.close()
+    _worker_generator = None
+    for generator in _update_generators.values():
+        generator.close()
+    _update_generators.clear()
+
+
+def _generate_one(job):
+    """Builds and serializes one document and its manifest.
+
+    job is (seed, name, selection, assignment); selection is a cohort
+    assignment for this document or None to select tasks from the seed,
+    assignment the cohort parameters recorded in the manifest.
+    Returns (seed, name, elapsed, table_warnings, pdf, manifest_bytes,
+    pages, worker_stats, verification) for the parent to hand to the output
+    sink; pdf is the document's bytes, or with --window the path of the
+    finished file in the work directory. pages is the generator's
+    last_pages record, worker_stats {"pid", "peak_rss_bytes", "cell_cache"}
+    for this worker, verification the verify_document() report of the
+    saved document or None.
+    """
+    if _worker_init_error:
+        raise _worker_init_error
+    seed, name, selection, assignment = job
+    doc_start = time.perf_counter()
+    if _worker_generator.window:
+        pdf = os.path.join(_worker_work_dir, name.replace(os.sep, "_"))
+        table_warnings = _worker_generator.generate_to_file(pdf, seed=seed, selected_tasks_for_pages=selection,
+                                                            **_worker_save_settings)
+    else:
+        output_doc, table_warnings = _worker_generator.generate(seed=seed, selected_tasks_for_pages=selection)
+        try:
+            with _worker_generator.timed("save"):
+                pdf = document_bytes(output_doc, **_worker_save_settings)
+        finally:
+            output_doc.close()
+    manifest = manifest_bytes(build_manifest(_worker_generator, seed, assignment))
+    verification = None
+    if _worker_verify:
+        # Checked here, in the worker, so verification runs as parallel as generation
+        saved_doc = fitz.open(pdf) if _worker_generator.window else fitz.open("pdf", pdf)
+        try:
+            verification = verify_document(_worker_generator, saved_doc)
+        finally:
+            saved_doc.close()
+    worker_stats = {"pid": os.getpid(), "peak_rss_bytes": peak_rss_bytes(),
+                    "cell_cache": _worker_generator.cell_cache.stats()}
+    return (seed, name, time.perf_counter() - doc_start, table_warnings, pdf, manifest,
+            _worker_generator.last_pages, worker_stats, verification)
+
+
+def _cell_cache_summary(worker_stats):
+    """Sums the latest cell cache counters of every worker ({pid: worker_stats}) into one stats() dict."""
+    total = dict.fromkeys(("hits", "misses", "evictions", "entries", "bytes"), 0)
+    for stats in worker_stats.values():
+        for key in total:
+            total[key] += stats["cell_cache"][key]
+    return total
+
+
+def _format_rss(rss_bytes):
+    return "n/a" if rss_bytes is None else f"{rss_bytes / 2**20:.1f} MiB"
+
+
+def _bounded_map(executor, fn, jobs, window):
+    """Like executor.map, in order, but with at most `window` jobs submitted at a time.
+
+    executor.map submits everything up front, so finished documents would
+    pile up in the parent behind a slow one; this keeps one per worker.
+    """
+    pending = collections.deque()
+    for job in jobs:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, job))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _init_update_worker(tasks_path, source_pdf_path, anchor_index_path=ANCHOR_INDEX_PATH, table_cache_dir=None):
+    """Process initializer for `update`: generators are created on first use per mode pair."""
+    global _update_config
+    configure_page_map()
+    _update_config = (load_tasks(tasks_path), source_pdf_path, anchor_index_path,
+                      TableCache(table_cache_dir) if table_cache_dir else None)
+
+
+def _update_generator(copy_mode, table_backend):
+    key = (copy_mode, table_backend)
+    if key not in _update_generators:
+        tasks_data, source_pdf_path, anchor_index_path, table_cache = _update_config
+        _update_generators[key] = DocumentGenerator(tasks_data, source_pdf_path, copy_mode, anchor_index_path,
+                                                    table_backend, table_cache)
+    return _update_generators[key]
+
+
+def _update_one(job):
+    """Patches one document from its manifest. Returns (path, changed pages or None, elapsed, table_warnings).
+
+    job is (path, manifest, selection). changed is None when the document had
+    to be regenerated in full (source PDF changed, or a render-mode document).
+    Unchanged documents are not rewritten.
+    """
+    output_pdf_path, manifest, selection = job
+    doc_start = time.perf_counter()
+    generator = _update_generator(manifest["copy_mode"], manifest["table_backend"])
+    seed = manifest["seed"]
+    changed = None
+    if manifest["source_sha256"] != generator.source_sha256 or manifest["copy_mode"] != COPY_MODE_CLONE:
+        clean = True
+        output_doc, table_warnings = generator.generate(seed=seed, selected_tasks_for_pages=selection)
+    else:
+        # Redrawn pages are cleaned by update(); every other page already was when first saved
+        clean = False
+        output_doc = fitz.open(output_pdf_path)
+        changed, table_warnings = generator.update(output_doc, manifest["pages"], seed=seed,
+                                                   selected_tasks_for_pages=selection)
+        if not changed:
+            output_doc.close()
+            return output_pdf_path, changed, time.perf_counter() - doc_start, table_warnings
+    try:
+        # Never leave a half-written booklet behind: save next to it, then swap
+        tmp_path = output_pdf_path + ".tmp"
+        save_document(output_doc, tmp_path, clean)
+    finally:
+        output_doc.close()
+    os.replace(tmp_path, output_pdf_path)
+    save_manifest(manifest_path(output_pdf_path), build_manifest(generator, seed, manifest["assignment"]))
+    return output_pdf_path, changed, time.perf_counter() - doc_start, table_warnings
+
+
+def _check_anchors(source_pdf_path, anchor_index_path):
+    """Resolves anchors the same way DocumentGenerator does; raises AnchorIndexError."""
+    with open(source_pdf_path, 'rb') as f:
+        source_bytes = f.read()
+    if anchor_index_path and os.path.exists(anchor_index_path):
+        load_anchor_index(anchor_index_path, source_sha256(source_bytes))
+        return
+    source_doc = fitz.open("pdf", source_bytes)
+    try:
+        analyze_anchors(source_doc)
+    finally:
+        source_doc.close()
+
+
+def check_name_pattern(pattern):
+    """Raises ValueError unless pattern formats with the fields batch provides into a plain file name."""
+    try:
+        pattern.format(**dict.fromkeys(NAME_PATTERN_FIELDS, 1))
+    except (KeyError, IndexError, ValueError) as e:
+        fields = ", ".join("{%s}" % field for field in NAME_PATTERN_FIELDS)
+        raise ValueError(f"Bad --name-pattern {pattern!r} ({e!r}); it may use {fields}")
+    if any(sep and sep in pattern for sep in (os.sep, os.altsep)):
+        # Documents sit directly in --out: no sink creates subdirectories, and `update` would not look there
+        raise ValueError(f"Bad --name-pattern {pattern!r}: it names a file, not a path")
+
+
+def batch_save_garbage(args):
+    """The --garbage level documents are saved with: as given, else the default for --window or not."""
+    if args.garbage is not None:
+        return args.garbage
+    return WINDOW_SAVE_GARBAGE if args.window else SAVE_GARBAGE
+
+
+def run_batch(args):
+    """Generates `args.count` documents, seeds seed_base .. seed_base+count-1, into the --out sink."""
+    try:
+        check_name_pattern(args.name_pattern)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    output_count = args.count
+    if args.merge:
+        groups = -(-args.count // args.merge_group) if args.merge_group else 1
+        output_count = groups + (1 if args.merge == MERGE_SHEETS else 0)
+    try:
+        sink = open_sink(args.out, output_count)
+    except (ValueError, OSError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    # Open for the whole run: with --out -, everything printed meanwhile goes to stderr
+    try:
+        return _batch_into(args, sink)
+    finally:
+        sink.close()
+
+
+def _batch_into(args, sink):
+    selections = [None] * args.count
+    assignments = [None] * args.count
+    if args.assign:
+        try:
+            selections = run_assignment(args)
+        except ValueError as e: # Bad --group-size / --exclusive
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 1
+        assignments = [{"count": args.count, "seed": args.seed_base, "group_size": args.group_size,
+                        "exclusive": sorted(args.exclusive), "index": i}
+                       for i in range(args.count)]
+    jobs = [(args.seed_base + i, args.name_pattern.format(seed=args.seed_base + i, index=i + 1),
+             selections[i], assignments[i])
+            for i in range(args.count)]
+
+    garbage, deflate = batch_save_garbage(args), args.deflate
+    merged_output = source_doc = None
+    if args.merge:
+        # Documents only travel to the merger: hand them over cheaply, the merged files are compacted once
+        merge_garbage = SAVE_GARBAGE if args.garbage is None else args.garbage
+        garbage, deflate = 1, False
+        source_doc = fitz.open(args.source)
+        merged_output = MergedOutput(sink, source_doc, args.merge, args.merge_group, merge_garbage, args.deflate)
+
+    failures = 0
+    cell_cache_bytes = int(args.cell_cache_mb * 2**20)
+    worker_stats = {} # pid -> latest counters of that worker (see _generate_one)
+    # --window: documents are built as files here and moved into the sink when finished
+    work_dir = tempfile.TemporaryDirectory(prefix="pdf_generator_") if args.window else None
+    work_path = work_dir.name if work_dir else None
+    verifications = []
+    batch_start = time.perf_counter()
+    if args.workers > 1:
+        # Fail here with a readable error rather than as a broken pool in every worker
+        _check_anchors(args.source, args.anchors)
+        # Output is byte-identical to a serial run: every document depends only on its seed
+        print(f"Starting {args.workers} worker processes")
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_pool_worker,
+                                       initargs=(args.tasks, args.source, args.copy_mode, args.anchors,
+                                                 args.table_backend, args.table_cache, garbage, deflate,
+                                                 args.cell_cache, cell_cache_bytes, bool(args.verify), args.window,
+                                                 work_path))
+        results = _bounded_map(executor, _generate_one, jobs, args.workers)
+    else:
+        # --- Load inputs once for the whole batch ---
+        executor = None
+        load_start = time.perf_counter()
+        _init_worker(args.tasks, args.source, args.copy_mode, args.anchors, args.table_backend, args.table_cache,
+                     garbage, deflate, args.cell_cache, cell_cache_bytes, bool(args.verify), args.window, work_path)
+        print(f"Loaded {args.tasks} and {args.source} in {time.perf_counter() - load_start:.2f}s")
+        results = map(_generate_one, jobs)
+
+    try:
+        for i, (seed, name, elapsed, table_warnings, pdf, manifest, pages, stats,
+                verification) in enumerate(results):
+            if table_warnings: failures += 1
+            worker_stats[stats["pid"]] = stats
+            if merged_output:
+                # Merged files cannot be patched by `update`: no manifests
+                destination = sink.describe(merged_output.add(name, pdf, pages))
+                if isinstance(pdf, str): os.remove(pdf)
+            else:
+                if isinstance(pdf, str): sink.write_file(name, pdf) # --window: a finished file, moved
+                else: sink.write(name, pdf)
+                sink.write_extra(name + MANIFEST_SUFFIX, manifest)
+                destination = sink.describe(name)
+            print(f"[{i + 1}/{args.count}] seed={seed} -> {destination} ({elapsed:.2f}s"
+                  f"{', %d table warning(s)' % len(table_warnings) if table_warnings else ''})")
+            if verification is not None:
+                verifications.append(dict(verification, document=name, seed=seed))
+                if not verification["ok"]:
+                    if not table_warnings: failures += 1
+                    for line in describe_failures(verification):
+                        print(f"  Verify {name}: {line}")
+        if merged_output:
+            merged_output.close()
+    finally:
+        if executor: executor.shutdown(cancel_futures=True)
+        else: _close_worker()
+        if source_doc: source_doc.close()
+        if work_dir: work_dir.cleanup()
+
+    total = time.perf_counter() - batch_start
+    rate = args.count / total if total > 0 else 0.0
+    print(f"Done: {args.count} document(s) in {total:.2f}s ({rate:.2f} docs/s)")
+    if worker_stats:
+        print(f"Cell layout cache: {format_stats(_cell_cache_summary(worker_stats))}")
+        peak_rss = [stats["peak_rss_bytes"] for stats in worker_stats.values()]
+        peak_rss = max(peak_rss) if None not in peak_rss else None
+        if args.workers > 1:
+            print(f"Peak RSS: {_format_rss(peak_rss)} per worker (largest), "
+                  f"{_format_rss(peak_rss_bytes())} main process")
+        else:
+            print(f"Peak RSS: {_format_rss(peak_rss)}")
+    if args.verify:
+        report = build_report(verifications)
+        save_report(args.verify, report)
+        print(f"Verified {report['documents']} document(s), {len(report['failed'])} with problems; "
+              f"report written to {args.verify}")
+    if failures:
+        print(f"Warning: {failures} document(s) had table warnings"
+              f"{' or verification problems' if args.verify else ''}, see log above.")
+    return 1 if failures else 0
+
+
+def run_update(args):
+    """Patches every document in args.out that has a manifest, redrawing only changed tables."""
+    documents = [(pdf_path, load_manifest(path)) for pdf_path, path in find_manifests(args.out)
+                 if os.path.exists(pdf_path)]
+    if not documents:
+        print(f"No documents with manifests in {args.out}")
+        return 1
+
+    # Cohort-assigned documents: re-run each cohort's assignment once, with the current tasks
+    tasks_data = load_tasks(args.tasks)
+    cohorts = {}
+    jobs = []
+    for pdf_path, manifest in documents:
+        assignment = manifest["assignment"]
+        selection = None
+        if assignment:
+            cohort = (assignment["count"], assignment["seed"], assignment["group_size"], tuple(assignment["exclusive"]))
+            if cohort not in cohorts:
+                try:
+                    cohorts[cohort], _ = assign_tasks(tasks_data, assignment["count"], seed=assignment["seed"],
+                                                      group_size=assignment["group_size"],
+                                                      exclusive_keys=assignment["exclusive"])
+                except ValueError as e:
+                    print(f"ERROR: cannot re-assign the cohort of {pdf_path}: {e}", file=sys.stderr)
+                    return 1
+            selection = cohorts[cohort][assignment["index"]]
+        jobs.append((pdf_path, manifest, selection))
+
+    failures = 0
+    patched = regenerated = 0
+    update_start = time.perf_counter()
+    if args.workers > 1:
+        _check_anchors(args.source, args.anchors)
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_update_worker,
+                                       initargs=(args.tasks, args.source, args.anchors, args.table_cache))
+        results = executor.map(_update_one, jobs, chunksize=1)
+    else:
+        executor = None
+        _init_update_worker(args.tasks, args.source, args.anchors, args.table_cache)
+        results = map(_update_one, jobs)
+
+    try:
+        for i, (output_pdf_path, changed, elapsed, table_warnings) in enumerate(results):
+            if table_warnings: failures += 1
+            if changed is None:
+                regenerated += 1
+                what = "regenerated (source PDF or copy mode changed)"
+            elif changed:
+                patched += 1
+                what = f"redrew page(s) {', '.join(map(str, changed))}"
+            else:
+                what = "unchanged"
+            print(f"[{i + 1}/{len(jobs)}] {output_pdf_path}: {what} ({elapsed:.2f}s"
+                  f"{', %d table warning(s)' % len(table_warnings) if table_warnings else ''})")
+    finally:
+        if executor: executor.shutdown(cancel_futures=True)
+        else: _close_worker()
+
+    total = time.perf_counter() - update_start
+    print(f"Done: {patched} patched, {regenerated} regenerated, {len(jobs) - patched - regenerated} unchanged "
+          f"in {total:.2f}s")
+    if failures:
+        print(f"Warning: {failures} document(s) had table warnings, see log above.")
+    return 1 if failures else 0
+
+
+def run_assignment(args):
+    """Assigns tasks for the whole batch at once (seat i = document i). Returns the selections."""
+    assign_start = time.perf_counter()
+    selections, reports = assign_tasks(load_tasks(args.tasks), args.count, seed=args.seed_base,
+                                       group_size=args.group_size, exclusive_keys=args.exclusive)
+    print(f"Assigned tasks for {args.count} document(s) in {time.perf_counter() - assign_start:.2f}s")
+    print(format_report(reports, args.group_size))
+    if args.assignment_report:
+        report = {"documents": args.count, "seed": args.seed_base, "group_size": args.group_size,
+                  "pools": [r._asdict() for r in reports]}
+        with open(args.assignment_report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Wrote assignment report to {args.assignment_report}")
+    return selections
+
+
+def run_analyze(args):
+    """Resolves every PAGE_TASK_MAP identifier once and writes the anchor index."""
+    with open(args.source, 'rb') as f:
+        source_bytes = f.read()
+    source_doc = fitz.open("pdf", source_bytes)
+    try:
+        anchors = analyze_anchors(source_doc)
+    finally:
+        source_doc.close()
+    save_anchor_index(args.out, source_sha256(source_bytes), anchors)
+    for page_num, anchor in sorted(anchors.items()):
+        found_on = "" if anchor.anchor_page == page_num else f" (identifier on page {anchor.anchor_page})"
+        print(f"Page {page_num}: table at y={anchor.insert_y:.1f}{found_on} '{anchor.identifier[:50]}'")
+    print(f"Wrote {len(anchors)} anchor(s) to {args.out}")
+    return 0
+
+
+def run_compile(args):
+    """Validates tasks.json and writes the compiled task store."""
+    with open(args.tasks, 'rb') as f:
+        tasks_json_bytes = f.read()
+    try:
+        tasks_data = json.loads(tasks_json_bytes.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        print(f"ERROR: {args.tasks} is not valid JSON: {e}", file=sys.stderr)
+        return 1
+    tasks = compile_tasks(tasks_data)
+    save_task_store(args.out, args.tasks, tasks_json_bytes, tasks)
+    for task_key, records in tasks.items():
+        print(f"{task_key}: {len(records)} task(s)")
+    print(f"Wrote {sum(len(records) for records in tasks.values())} task(s) to {args.out}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pdf_generator_cli", description="Headless dynamic PDF generator.")
+    parser.add_argument("--pages", metavar="FILE",
+                        help="JSON page map replacing the built-in PAGE_TASK_MAP (also read from $"
+                             f"{PAGE_MAP_ENV} or ./pages.json).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="Generate N variant PDFs (serially or on a process pool).")
+    batch.add_argument("--count", type=positive_int, required=True, help="Number of documents to generate.")
+    batch.add_argument("--out", required=True,
+                       help="Output directory, a .zip / .tar[.gz] archive, a .pdf file (--count 1) or - for stdout "
+                            "(raw PDF for --count 1, else a tar stream).")
+    batch.add_argument("--seed-base", type=int, default=0, help="Seed of the first document; document i uses seed-base + i.")
+    batch.add_argument("--workers", type=positive_int, default=1,
+                       help="Worker processes; each opens the source PDF and registers fonts once.")
+    batch.add_argument("--tasks", default=TASKS_JSON_PATH, help="Path to tasks.json or a task store from `compile`.")
+    batch.add_argument("--source", default=SOURCE_PDF_PATH, help="Path to the source PDF.")
+    batch.add_argument("--anchors", default=ANCHOR_INDEX_PATH,
+                       help="Anchor index from `analyze`; anchors are searched once per process if it is missing.")
+    batch.add_argument("--copy-mode", choices=COPY_MODES, default=COPY_MODE_CLONE,
+                       help="clone: edit a copy of the source in place (fast); render: legacy show_pdf_page per page.")
+    batch.add_argument("--table-backend", choices=TABLE_BACKENDS, default=TABLE_BACKEND_REPORTLAB,
+                       help="reportlab: Table -> temp PDF -> overlay; direct: cached layout + PyMuPDF text, ReportLab only for cells it cannot lay out.")
+    batch.add_argument("--name-pattern", default="variant_{seed}.pdf",
+                       help="Output file name; may use {seed} and {index}.")
+    batch.add_argument("--assign", action="store_true",
+                       help="Assign tasks across the whole batch (document i = seat i): even pool usage, "
+                            "minimal overlap with the previous seat. Seeded by --seed-base.")
+    batch.add_argument("--group-size", type=int, default=1,
+                       help="With --assign: consecutive seats forming one group.")
+    batch.add_argument("--exclusive", action="append", default=[], metavar="TASK_KEY",
+                       help="With --assign: no two students of a group share an item of this pool (repeatable).")
+    batch.add_argument("--assignment-report", help="With --assign: write the per-pool guarantees as JSON here.")
+    batch.add_argument("--table-cache", metavar="DIR",
+                       help="Reuse rendered ReportLab tables stored here by content (shared by workers and runs).")
+    batch.add_argument("--garbage", type=int, choices=SAVE_GARBAGE_LEVELS,
+                       help=f"PDF garbage collection level; lower saves faster, files get larger "
+                            f"(default {SAVE_GARBAGE}, with --window {WINDOW_SAVE_GARBAGE}).")
+    batch.add_argument("--deflate", action=argparse.BooleanOptionalAction, default=SAVE_DEFLATE,
+                       help="Compress streams (--no-deflate: faster save, much larger files).")
+    batch.add_argument("--merge", choices=MERGE_MODES,
+                       help="combined: one PDF per group with every booklet, static pages stored once; "
+                            "sheets: common.pdf with the static pages plus one PDF per group of table pages only.")
+    batch.add_argument("--merge-group", type=non_negative_int, default=0, metavar="N",
+                       help="With --merge: students per merged file (default: the whole batch).")
+    batch.add_argument("--cell-cache", type=non_negative_int, default=CELL_CACHE_ENTRIES, metavar="N",
+                       help=f"Wrapped table cells kept per worker for reuse across documents "
+                            f"(default {CELL_CACHE_ENTRIES}, 0 disables).")
+    batch.add_argument("--cell-cache-mb", type=non_negative_float, default=CELL_CACHE_BYTES / 2**20, metavar="MB",
+                       help="Also limit the cell cache to about this much memory per worker (default: no limit).")
+    batch.add_argument("--verify", metavar="REPORT",
+                       help="Read every document back, check that each selected item landed unclipped in its "
+                            "table and write a JSON report here; documents with problems make the exit status 1.")
+    batch.add_argument("--window", type=non_negative_int, default=0, metavar="PAGES",
+                       help="Bound memory for large sources: build each document on disk this many source pages "
+                            "at a time, saving finished pages incrementally, then compact it with one full save "
+                            "(default: 0, whole documents in memory). That save rewrites the whole file, so it "
+                            f"uses --garbage {WINDOW_SAVE_GARBAGE} unless given. With --copy-mode render every "
+                            "window copies the source resources it uses again; only the much slower "
+                            f"--garbage {SAVE_GARBAGE} merges those copies.")
+    batch.set_defaults(func=run_batch)
+
+    update = subparsers.add_parser("update", help="Patch documents written by `batch` after tasks or PAGE_TASK_MAP "
+                                                  "changed, redrawing only the tables that differ.")
+    update.add_argument("--out", required=True, help="Directory of documents (and their .manifest.json files).")
+    update.add_argument("--workers", type=positive_int, default=1, help="Worker processes.")
+    update.add_argument("--tasks", default=TASKS_JSON_PATH, help="Path to tasks.json or a task store from `compile`.")
+    update.add_argument("--source", default=SOURCE_PDF_PATH, help="Path to the source PDF.")
+    update.add_argument("--anchors", default=ANCHOR_INDEX_PATH,
+                        help="Anchor index from `analyze`; anchors are searched once per process if it is missing.")
+    update.add_argument("--table-cache", metavar="DIR",
+                        help="Reuse rendered ReportLab tables stored here by content.")
+    update.set_defaults(func=run_update)
+
+    analyze = subparsers.add_parser("analyze", help="Locate table anchors once and store them keyed by the source PDF hash.")
+    analyze.add_argument("--source", default=SOURCE_PDF_PATH, help="Path to the source PDF.")
+    analyze.add_argument("--out", default=ANCHOR_INDEX_PATH, help="Where to write the anchor index.")
+    analyze.set_defaults(func=run_analyze)
+
+    compile_parser = subparsers.add_parser("compile", help="Validate tasks.json and compile it into a ready-to-render task store.")
+    compile_parser.add_argument("--tasks", default=TASKS_JSON_PATH, help="Path to tasks.json.")
+    compile_parser.add_argument("--out", default=TASK_STORE_PATH, help="Where to write the task store.")
+    compile_parser.set_defaults(func=run_compile)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        page_map_path = configure_page_map(args.pages)
+        if page_map_path:
+            os.environ[PAGE_MAP_ENV] = os.path.abspath(page_map_path) # For the worker processes
+            # stderr: with `--out -` stdout carries nothing but the document bytes
+            print(f"Using page map {page_map_path}", file=sys.stderr)
+        with profile_hook(): # PDF_GENERATOR_PROFILE=out.prof
+            return args.func(args)
+    except REPORTED_ERRORS as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1248 @@
+import ast
+import hashlib
+import json
+import marshal
+import random
+import io
+import os
+import shutil
+import tempfile
+import time
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+from html import escape as html_escape
+
+from pdf_generator_lazy import lazy_import
+fitz = lazy_import("fitz")  # PyMuPDF
+# --- ReportLab setup ---
+platypus = lazy_import("reportlab.platypus")
+canvas = lazy_import("reportlab.pdfgen.canvas")
+colors = lazy_import("reportlab.lib.colors")
+from reportlab.lib.units import mm
+# --- End ReportLab setup ---
+from pdf_generator_cells import CellLayout, CellLayoutCache, cached_paragraph_class
+from pdf_generator_direct import DirectTableRenderer, TextCell, resolve_cell_styles
+from pdf_generator_fonts import register_fonts, get_styles
+from pdf_generator_structures import HEADER_STYLE, STRUCTURES, get_structure, table_rows
+
+# Headless generation core shared by the Tk app and the batch CLI.
+# Nothing in here may import tkinter - it has to run on build servers.
+
+# --- Configuration ---
+TASKS_JSON_PATH = "tasks.json"
+SOURCE_PDF_PATH = "dynamic_sample.pdf"
+ANCHOR_INDEX_PATH = "anchors.json" # Written by `pdf_generator_cli analyze`
+TASK_STORE_PATH = "tasks.store" # Written by `pdf_generator_cli compile`; load_tasks() reads either
+TRACE_ENV = "PDF_GENERATOR_TRACE" # Set to 1 to print per-document stage timings
+
+# NEW Configuration: Map page numbers (1-based) to task details
+# Structure: page_num: (task_key, needed_count, structure_info, identifier_text_to_find)
+PAGE_TASK_MAP = {
+    # Page: (TaskKey, NeededCount, StructureInfo, IdentifierText)
+    7:  ("LAB1", 30, {"type": "3_objects"}, "Таблиця 1.1 – Варіанти завдань до лабораторної роботи № 1"),
+    22: ("LAB3", 30, {"type": "description"}, "Таблиця 3.1 – Варіанти завдань до лабораторної роботи № 3"),
+    27: ("LAB4_TASK1", 14, {"type": "description"}, "Таблиця 4.1 – Варіанти для завдання 1"),
+    29: ("LAB4_TASK2", 15, {"type": "description"}, "Таблиця 4.2 – Варіанти для завдання 2"),
+    31: ("LAB4_TASK3", 16, {"type": "description"}, "Таблиця 4.3 – Варіанти для завдання 3"),
+    44: ("LAB5_TASK1", 19, {"type": "description"}, "Таблиця 5.1 – Варіанти для завдання 1"),
+    46: ("LAB5_TASK2", 18, {"type": "description"}, "Таблиця 5.2 – Варіанти для завдання 2"),
+    58: ("LAB6", 20, {"type": "pair_description"}, "Таблиця 6.1 – Індивідуальні варіанти завдань"),
+    73: ("LAB7_TASK1", 32, {"type": "description"}, "Таблиця 7.1 – Варіанти до завдання 1"),
+    86: ("LAB9_TASK1", 30, {"type": "description"}, "Таблиця 8.1 – Варіанти до завдання 1"),
+    88: ("LAB9_TASK2", 30, {"type": "description"}, "Таблиця 8.2 – Варіанти до завдання 2"),
+    102: ("LAB10_TASK1", 27, {"type": "description"}, "Таблиця 10.1 – Варіанти для першого завдання лабораторної роботи"),
+    103: ("LAB10_TASK2", 23, {"type": "description"}, "Таблиця 10.2 – Варіанти для другого завдання"), # Inserted on p103
+    107: ("LAB11", 20, {"type": "description"}, "Таблиця 11.1 – Індивідуальні варіанти завдань"),
+    # Lab 13 is missing from the user's list? Assuming skip or was error.
+    # 107: ("LAB13", 20, {"type": "profession_pairs"}, "Таблиця 13.1 – Індивідуальні варіанти завдань"),
+    137: ("LAB16", 20, {"type": "function_pair"}, "у другому стовпці – задані функції x(t) та y(t)."), # Note: No latex=True needed
+}
+
+# The map above is the built-in default. A JSON page map replaces it without
+# code changes (e.g. to add LAB13): `--pages FILE`, else the file named by
+# PAGE_MAP_ENV, else PAGE_MAP_PATH if present. Nothing is read at import:
+# entry points call configure_page_map() where they can report a bad file.
+#   {"pages": {"7": {"task_key": "LAB1", "count": 30, "structure": "3_objects",
+#                    "identifier": "Таблиця 1.1 – Варіанти завдань до лабораторної роботи № 1"}, ...}}
+# "structure" must be a registered type (see pdf_generator_structures).
+PAGE_MAP_PATH = "pages.json"
+PAGE_MAP_ENV = "PDF_GENERATOR_PAGES"
+
+
+class PageMapError(Exception):
+    """Raised when a page map file is missing, malformed or names an unknown structure."""
+
+
+def load_page_task_map(path):
+    """Reads a JSON page map into PAGE_TASK_MAP form. Raises PageMapError listing every bad entry."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            pages = json.load(f)["pages"]
+        entries = pages.items()
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        raise PageMapError(f"Cannot read page map {path}: {e!r}")
+    page_task_map = {}
+    errors = []
+    for page, entry in entries:
+        try:
+            page_num = int(page)
+            task_key, count, structure, identifier = (entry["task_key"], entry["count"], entry["structure"],
+                                                      entry["identifier"])
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append(f"page {page}: {e!r}")
+            continue
+        if page_num < 1 or not isinstance(count, int) or count < 1:
+            errors.append(f"page {page}: page number and count must be positive integers")
+        elif structure not in STRUCTURES:
+            errors.append(f"page {page}: unknown structure '{structure}' (known: {', '.join(sorted(STRUCTURES))})")
+        elif not isinstance(task_key, str) or not isinstance(identifier, str) or not identifier.strip():
+            errors.append(f"page {page}: task_key and identifier must be non-empty strings")
+        else:
+            page_task_map[page_num] = (task_key, count, {"type": structure}, identifier)
+    if errors:
+        raise PageMapError(f"Malformed page map {path}:\n  " + "\n  ".join(errors))
+    return page_task_map
+
+
+def use_page_task_map(page_task_map):
+    """Replaces PAGE_TASK_MAP in place, so every module that imported it sees the new pages."""
+    PAGE_TASK_MAP.clear()
+    PAGE_TASK_MAP.update(page_task_map)
+
+
+def configure_page_map(path=None):
+    """Loads the page map in use: path, else $PDF_GENERATOR_PAGES, else ./pages.json if present.
+
+    Replaces PAGE_TASK_MAP (see use_page_task_map). Returns the file that was
+    loaded, or None when the built-in map stays. Raises PageMapError.
+    """
+    path = path or os.environ.get(PAGE_MAP_ENV) or (PAGE_MAP_PATH if os.path.exists(PAGE_MAP_PATH) else None)
+    if path:
+        use_page_task_map(load_page_task_map(path))
+    return path
+
+
+# How generate() produces the untouched pages:
+#   "clone"  - open a fresh copy of the source bytes and edit only the mapped
+#              pages in place; fonts/images stay shared page resources.
+#   "render" - legacy path: new page + show_pdf_page + clean_contents for
+#              every page, which wraps each page in its own Form XObject.
+COPY_MODE_CLONE = "clone"
+COPY_MODE_RENDER = "render"
+COPY_MODES = (COPY_MODE_CLONE, COPY_MODE_RENDER)
+
+# How tables are drawn:
+#   "reportlab" - build a Table of Paragraphs into a temporary PDF and reopen it
+#   "direct"    - lay cells out with cached per-structure templates and write the
+#                 text with PyMuPDF; falls back to ReportLab when a cell overflows
+TABLE_BACKEND_REPORTLAB = "reportlab"
+TABLE_BACKEND_DIRECT = "direct"
+TABLE_BACKENDS = (TABLE_BACKEND_REPORTLAB, TABLE_BACKEND_DIRECT)
+
+# Where tables go on a page. Tables are drawn at their natural size; one
+# taller than the space left is split at row boundaries onto continuation pages.
+TABLE_SIDE_MARGIN = 20*mm
+TABLE_BOTTOM_MARGIN = 10 # Points left free below a table
+
+
+# Pipeline stages timed in DocumentGenerator.stage_seconds (see pdf_generator_bench):
+#   anchors      - anchor index load, or the full-text search without an index (once per generator)
+#   select       - task selection
+#   copy         - source clone / page copy
+#   table_build  - table data + ReportLab build (direct backend: layout)
+#   table_reopen - reopening the ReportLab temp PDF with PyMuPDF
+#   overlay      - show_pdf_page of table chunks (direct backend: drawing)
+#   clean        - clean_contents of table pages
+#   subset       - font subsetting (direct backend)
+#   save         - save_document (timed by the caller)
+PIPELINE_STAGES = ("anchors", "select", "copy", "table_build", "table_reopen", "overlay", "clean", "subset", "save")
+
+# Save settings. The defaults give the smallest files; a lower garbage level
+# (0-4, see fitz.Document.save) and no deflate save faster but larger.
+# Windowed documents (generate_to_file) are compacted with one full rewrite
+# of the whole file; level 4 would also compare every stream there, which
+# makes it the slowest step, so they default to level 3 like the template.
+SAVE_GARBAGE = 4
+WINDOW_SAVE_GARBAGE = 3
+SAVE_GARBAGE_LEVELS = (0, 1, 2, 3, 4)
+SAVE_DEFLATE = True
+
+
+# --- Anchor Index ---
+# Where each PAGE_TASK_MAP identifier sits, resolved once by full-text search
+# and stored against the SHA-256 of the source PDF.
+
+# anchor_page: page the identifier was found on (the mapped page, or the one
+#              before it when the mapped page is left blank for the table)
+# rect:        identifier rect on anchor_page
+# insert_y:    top of the table on the mapped page
+Anchor = namedtuple("Anchor", ["identifier", "anchor_page", "rect", "insert_y"])
+
+ANCHOR_TABLE_GAP = 5 # Points between the identifier and the table top
+TABLE_TOP_MARGIN = 20*mm # Table top on a page whose identifier is on the previous page
+
+
+class GenerationCancelled(Exception):
+    """Raised by DocumentGenerator.generate() when its cancel_event is set between pages."""
+
+
+class AnchorIndexError(Exception):
+    """Raised when an anchor cannot be resolved or the stored index is stale."""
+
+
+def source_sha256(source_bytes):
+    return hashlib.sha256(source_bytes).hexdigest()
+
+
+def source_file_sha256(path, chunk_size=1 << 20):
+    """source_sha256() of a file, read in chunks instead of whole."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def analyze_anchors(source_doc, page_task_map=None):
+    """Searches every identifier once. Returns {page_num: Anchor}.
+
+    Raises AnchorIndexError listing every identifier that could not be found.
+    """
+    if page_task_map is None: page_task_map = PAGE_TASK_MAP
+    anchors = {}
+    missing = []
+    for page_num, (task_key, _, _, identifier_text) in sorted(page_task_map.items()):
+        if page_num > len(source_doc):
+            missing.append(f"page {page_num} ({task_key}): page is beyond the end of the source PDF ({len(source_doc)} pages)")
+            continue
+        text_instances = source_doc.load_page(page_num - 1).search_for(identifier_text, quads=True)
+        if text_instances:
+            rect = text_instances[0].rect
+            anchors[page_num] = Anchor(identifier_text, page_num, rect, rect.y1 + ANCHOR_TABLE_GAP)
+            continue
+        # Identifier at the bottom of the previous page, table on the (blank) mapped page
+        if page_num > 1:
+            text_instances = source_doc.load_page(page_num - 2).search_for(identifier_text, quads=True)
+            if text_instances:
+                anchors[page_num] = Anchor(identifier_text, page_num - 1, text_instances[0].rect, TABLE_TOP_MARGIN)
+                continue
+        missing.append(f"page {page_num} ({task_key}): '{identifier_text}' not found on page {page_num} or {page_num - 1}")
+    if missing:
+        raise AnchorIndexError("Could not locate table anchors in the source PDF:\n  " + "\n  ".join(missing))
+    return anchors
+
+
+def save_anchor_index(path, sha256, anchors):
+    """Writes the anchor index as JSON."""
+    data = {
+        "source_sha256": sha256,
+        "anchors": {str(page_num): {"identifier": anchor.identifier, "anchor_page": anchor.anchor_page,
+                                    "rect": list(anchor.rect), "insert_y": anchor.insert_y}
+                    for page_num, anchor in sorted(anchors.items())},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def load_anchor_index(path, sha256, page_task_map=None):
+    """Reads an anchor index and checks it still matches the source and PAGE_TASK_MAP.
+
+    Raises AnchorIndexError for an unreadable, malformed or stale index.
+    """
+    if page_task_map is None: page_task_map = PAGE_TASK_MAP
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get("anchors", {}), dict):
+            raise ValueError("expected an object with an \"anchors\" object")
+    except (OSError, ValueError) as e: # ValueError covers JSONDecodeError and UnicodeDecodeError
+        raise AnchorIndexError(f"Cannot read anchor index {path}: {e!r}. "
+                               f"Re-run `python -m pdf_generator_cli analyze`.")
+    if data.get("source_sha256") != sha256:
+        raise AnchorIndexError(f"Anchor index {path} was built for a different source PDF "
+                               f"(hash {str(data.get('source_sha256'))[:12]}..., source is {sha256[:12]}...). "
+                               f"Re-run `python -m pdf_generator_cli analyze`.")
+    stored = data.get("anchors", {})
+    anchors = {}
+    stale = []
+    for page_num, (task_key, _, _, identifier_text) in sorted(page_task_map.items()):
+        entry = stored.get(str(page_num))
+        if not isinstance(entry, dict) or entry.get("identifier") != identifier_text:
+            stale.append(f"page {page_num} ({task_key})")
+            continue
+        try:
+            x0, y0, x1, y1 = (float(value) for value in entry["rect"])
+            anchors[page_num] = Anchor(identifier_text, int(entry["anchor_page"]), fitz.Rect(x0, y0, x1, y1),
+                                       float(entry["insert_y"]))
+        except (KeyError, TypeError, ValueError) as e:
+            raise AnchorIndexError(f"Malformed entry for page {page_num} in anchor index {path}: {e!r}. "
+                                   f"Re-run `python -m pdf_generator_cli analyze`.")
+    if stale:
+        raise AnchorIndexError(f"Anchor index {path} does not match PAGE_TASK_MAP for: {', '.join(stale)}. "
+                               f"Re-run `python -m pdf_generator_cli analyze`.")
+    return anchors
+
+
+def items_needed(needed_count, structure_info):
+    """Returns how many pool items a table with needed_count variants consumes."""
+    structure = get_structure(structure_info.get('type'))
+    return needed_count * (structure.items_per_row if structure else 1)
+
+
+# --- Task Store ---
+# tasks.json compiled once into ready-to-render records: every task becomes a
+# tuple of Paragraph-markup fields (escaped, pairs already split, LAB1 object
+# names already extracted), validated against PAGE_TASK_MAP. The store is a
+# magic header plus a marshal dump (plain data: unlike a pickle, loading one
+# never runs code, and version 4 reads the same on every Python 3.4+), loaded
+# with one read and no per-item parsing. The tasks.json it came from is
+# checked by size and mtime; it is only hashed again when those changed.
+
+TASK_STORE_MAGIC_PREFIX = b"PDFGEN-TASKS "
+TASK_STORE_MAGIC = TASK_STORE_MAGIC_PREFIX + b"2\n"
+TASK_STORE_MARSHAL_VERSION = 4
+
+
+class TaskStoreError(Exception):
+    """Raised when tasks cannot be compiled or a stored task store is stale."""
+
+
+def task_structure_types(page_task_map=None):
+    """Returns {task_key: structure type} for every key PAGE_TASK_MAP uses."""
+    if page_task_map is None: page_task_map = PAGE_TASK_MAP
+    return {task_key: structure_info.get('type') for task_key, _, structure_info, _ in page_task_map.values()}
+
+
+def task_record(structure_type, task):
+    """Normalizes one raw tasks.json entry into a tuple of escaped markup fields. Raises ValueError."""
+    structure = get_structure(structure_type)
+    if structure and structure.fields > 1:
+        if isinstance(task, str):
+            # Older tasks.json files stored pairs as "['x = ...', 'y = ...']" or "x = ...\ny = ..."
+            if task.startswith("['") and task.endswith("']"):
+                try: task = ast.literal_eval(task)
+                except (ValueError, SyntaxError): raise ValueError(f"unparsable pair {task!r}")
+            else:
+                task = task.split('\n')
+        if not isinstance(task, (list, tuple)) or len(task) != structure.fields:
+            raise ValueError(f"expected {structure.fields} strings, got {task!r}")
+    elif isinstance(task, str):
+        if structure and structure.parse_text:
+            task = structure.parse_text(task)
+        task = (task,)
+    elif structure_type is not None or not isinstance(task, (list, tuple)):
+        raise ValueError(f"expected a string, got {task!r}")
+    if not all(isinstance(field, str) and field.strip() for field in task):
+        raise ValueError(f"expected non-empty strings, got {task!r}")
+    # quote=False: &, < and > only, like xml.sax.saxutils.escape (which drags in urllib at import)
+    return tuple(html_escape(field.strip(), quote=False) for field in task)
+
+
+def compile_tasks(tasks_data, page_task_map=None):
+    """Compiles raw tasks.json data into {task_key: [record, ...]}. Raises TaskStoreError listing every bad entry."""
+    structure_types = task_structure_types(page_task_map)
+    if not isinstance(tasks_data, dict):
+        raise TaskStoreError(f"Tasks data must be an object of task lists, got {type(tasks_data).__name__}")
+    compiled = {}
+    errors = []
+    for task_key, tasks in tasks_data.items():
+        if not isinstance(tasks, list):
+            errors.append(f"{task_key}: expected a list of tasks, got {type(tasks).__name__}")
+            continue
+        records = []
+        for index, task in enumerate(tasks):
+            try:
+                records.append(task_record(structure_types.get(task_key), task))
+            except ValueError as e:
+                errors.append(f"{task_key}[{index}]: {e}")
+        compiled[task_key] = records
+    if errors:
+        raise TaskStoreError("Malformed tasks:\n  " + "\n  ".join(errors))
+    return compiled
+
+
+def save_task_store(path, tasks_json_path, tasks_json_bytes, tasks, page_task_map=None):
+    """Writes compiled tasks, with the path, hash, size and mtime of the tasks.json they came from.
+
+    The path is stored relative to the store's directory, so the store is
+    checked the same from any working directory.
+    """
+    source_stat = os.stat(tasks_json_path)
+    try:
+        source_path = os.path.relpath(tasks_json_path, os.path.dirname(os.path.abspath(path)))
+    except ValueError: # Another drive (Windows)
+        source_path = os.path.abspath(tasks_json_path)
+    data = {
+        "source_path": source_path,
+        "source_sha256": source_sha256(tasks_json_bytes),
+        "source_size": source_stat.st_size,
+        "source_mtime_ns": source_stat.st_mtime_ns,
+        "structure_types": task_structure_types(page_task_map),
+        "tasks": tasks,
+    }
+    with open(path, 'wb') as f:
+        f.write(TASK_STORE_MAGIC)
+        marshal.dump(data, f, TASK_STORE_MARSHAL_VERSION)
+
+
+def load_task_store(path, page_task_map=None, raw=None):
+    """Reads a task store and checks it is still current.
+
+    It must match PAGE_TASK_MAP and, if the tasks.json it was compiled from
+    is still there, that file's contents (hashed only if its size or
+    mtime changed since `compile`). raw: the file's bytes, if already read.
+    """
+    if raw is None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+    if not raw.startswith(TASK_STORE_MAGIC):
+        what = "an older task store format" if raw.startswith(TASK_STORE_MAGIC_PREFIX) else "not a task store"
+        raise TaskStoreError(f"{path} is {what}. Re-run `python -m pdf_generator_cli compile`.")
+    try:
+        data = marshal.loads(memoryview(raw)[len(TASK_STORE_MAGIC):])
+        tasks = data["tasks"]
+    except (ValueError, EOFError, TypeError, KeyError) as e:
+        raise TaskStoreError(f"Task store {path} is damaged ({e!r}). Re-run `python -m pdf_generator_cli compile`.")
+    if not isinstance(tasks, dict) or data.get("structure_types") != task_structure_types(page_task_map):
+        raise TaskStoreError(f"Task store {path} was compiled for a different PAGE_TASK_MAP. "
+                             f"Re-run `python -m pdf_generator_cli compile`.")
+    source_path = data.get("source_path")
+    if source_path:
+        source_path = os.path.join(os.path.dirname(os.path.abspath(path)), source_path)
+    if source_path and os.path.exists(source_path):
+        source_stat = os.stat(source_path)
+        unchanged = (source_stat.st_size == data.get("source_size")
+                     and source_stat.st_mtime_ns == data.get("source_mtime_ns"))
+        if not unchanged:
+            with open(source_path, 'rb') as f:
+                if source_sha256(f.read()) != data.get("source_sha256"):
+                    raise TaskStoreError(f"Task store {path} is older than {source_path}. "
+                                         f"Re-run `python -m pdf_generator_cli compile`.")
+    return tasks
+
+
+def load_tasks(path=TASKS_JSON_PATH):
+    """Loads compiled tasks from a task store or a tasks.json. Raises on missing/invalid file.
+
+    tasks.json is parsed and compiled in memory, so callers always get records.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw.startswith(TASK_STORE_MAGIC_PREFIX):
+        return load_task_store(path, raw=raw)
+    return compile_tasks(json.loads(raw.decode('utf-8')))
+
+
+# --- Generator ---
+
+class DocumentGenerator:
+    """Builds variant PDFs from the source manual without any GUI.
+
+    The source PDF is opened and fonts/styles are set up once, so the same
+    instance can stream out any number of documents.
+
+    With window > 0 nothing the size of the manual is held in memory: the
+    source stays file-backed, the clone template is kept in a temp file and
+    generate_to_file() builds each document on disk, `window` source pages
+    at a time (see there).
+    """
+
+    def __init__(self, tasks_data, source_pdf_path=SOURCE_PDF_PATH, copy_mode=COPY_MODE_CLONE,
+                 anchor_index_path=ANCHOR_INDEX_PATH, table_backend=TABLE_BACKEND_REPORTLAB, table_cache=None,
+                 cell_cache=None, window=0):
+        if copy_mode not in COPY_MODES:
+            raise ValueError(f"Unknown copy mode '{copy_mode}', expected one of {COPY_MODES}")
+        if table_backend not in TABLE_BACKENDS:
+            raise ValueError(f"Unknown table backend '{table_backend}', expected one of {TABLE_BACKENDS}")
+        if window < 0:
+            raise ValueError(f"window must be 0 (in memory) or a number of source pages, got {window}")
+        if not os.path.exists(source_pdf_path):
+            raise FileNotFoundError(f"Source PDF not found: {source_pdf_path}")
+        self.tasks_data = tasks_data
+        self.copy_mode = copy_mode
+        self.table_backend = table_backend
+        # Rendered ReportLab tables by table_key(); any object with get(key) / put(key, bytes)
+        self.table_cache = table_cache
+        # Wrapped cells by (text, style, width), shared by all documents of this generator (pdf_generator_cells)
+        self.cell_cache = CellLayoutCache() if cell_cache is None else cell_cache
+        # {page_num: {"task_key", "table_key", "start", "count"}} for the last generated/updated document
+        self.last_pages = {}
+        # {page_num: selected task records} the last generated/updated document was built from
+        self.last_selection = {}
+        self.stage_seconds = dict.fromkeys(PIPELINE_STAGES, 0.0) # Summed over all documents
+        self.trace = os.environ.get(TRACE_ENV, "") not in ("", "0")
+        # Fonts are registered and the stylesheet built once per process (pdf_generator_fonts)
+        self.font_regular, self.font_bold = register_fonts()
+        self.styles = get_styles(self.font_regular, self.font_bold)
+        self.direct_renderer = DirectTableRenderer(self.cell_cache) if table_backend == TABLE_BACKEND_DIRECT else None
+        self.source_pdf_path = source_pdf_path
+        self.window = window # Source pages per generate_to_file() window; 0: documents are built in memory
+        if window:
+            self.source_bytes = None
+            self.source_sha256 = source_file_sha256(source_pdf_path)
+            self.source_doc = fitz.open(source_pdf_path)
+        else:
+            # Keep the raw bytes: cloning the whole document from memory is far
+            # cheaper than rebuilding ~140 pages through show_pdf_page
+            with open(source_pdf_path, 'rb') as f:
+                self.source_bytes = f.read()
+            self.source_sha256 = source_sha256(self.source_bytes)
+            self.source_doc = fitz.open("pdf", self.source_bytes)
+        with self.timed("anchors"):
+            self.anchors = self.resolve_anchors(anchor_index_path)
+        self.table_seconds = 0.0 # Time spent in draw_table, summed over all documents
+        self.clone_template = self.clone_template_path = None
+        if copy_mode == COPY_MODE_CLONE and window:
+            fd, self.clone_template_path = tempfile.mkstemp(prefix="pdf_generator_template_", suffix=".pdf")
+            os.close(fd)
+            self.build_clone_template(self.clone_template_path)
+        elif copy_mode == COPY_MODE_CLONE:
+            self.clone_template = self.build_clone_template()
+
+    def resolve_anchors(self, anchor_index_path):
+        """Loads table anchors from the index, or searches the source once if there is none (or no path)."""
+        if anchor_index_path and os.path.exists(anchor_index_path):
+            return load_anchor_index(anchor_index_path, self.source_sha256)
+        if anchor_index_path:
+            print(f"Anchor index {anchor_index_path} not found, locating anchors in the source PDF once.")
+        return analyze_anchors(self.source_doc)
+
+    @contextmanager
+    def timed(self, stage):
+        """Adds the time spent in the with-block to stage_seconds[stage]."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage] += time.perf_counter() - start
+
+    def close(self):
+        if self.source_doc: self.source_doc.close()
+        self.source_doc = None
+        if self.clone_template_path and os.path.exists(self.clone_template_path):
+            os.remove(self.clone_template_path)
+        self.clone_template_path = None
+
+    def create_reportlab_table(self, data, col_widths=None, style_commands=None, row_heights=None, repeat_rows=0):
+        """Creates a ReportLab Table object with basic styling."""
+        table = platypus.Table(data, colWidths=col_widths, rowHeights=row_heights, repeatRows=repeat_rows)
+        table.setStyle(platypus.TableStyle(self.table_style_commands(style_commands)))
+        return table
+
+    def cell_layout(self, text, style, width):
+        """Returns the CellLayout of a Paragraph cell, parsing and wrapping it only on a cache miss.
+
+        Paragraph.wrap depends on the width alone, so one wrapped Paragraph
+        can stand in every table (and every cell) that shows this text; it
+        is not re-broken when Table wraps it again to draw it.
+        """
+        key = ("reportlab", text, style.name, width)
+        layout = self.cell_cache.get(key)
+        if layout is None:
+            paragraph = cached_paragraph_class()(text, style)
+            _, height = paragraph.wrap(width, 0x7fffffff)
+            layout = CellLayout(paragraph, None, height)
+            self.cell_cache.put(key, layout)
+        return layout
+
+    def wrap_cells(self, table_data, col_widths, style_commands):
+        """Turns rows of TextCells into cached Paragraphs plus the row heights Table.wrap would compute.
+
+        With explicit row heights ReportLab never measures the cells itself
+        (not even again after each split); it only wraps each one once to draw it.
+        Returns (table_data, row_heights).
+        """
+        cell_styles = resolve_cell_styles(style_commands, len(col_widths), len(table_data))
+        rows = []
+        row_heights = []
+        for cells, row_styles in zip(table_data, cell_styles):
+            row = []
+            row_height = 0
+            for cell, width, cell_style in zip(cells, col_widths, row_styles):
+                layout = self.cell_layout(cell.text, cell.style,
+                                          width - cell_style['LEFTPADDING'] - cell_style['RIGHTPADDING'])
+                row.append(layout.paragraph)
+                # Summed in Table._calc_height's order, so the heights (and the output) are identical
+                row_height = max(row_height, layout.height + (cell_style['BOTTOMPADDING'] + cell_style['TOPPADDING']))
+            rows.append(row)
+            row_heights.append(row_height)
+        return rows, row_heights
+
+    def table_style_commands(self, style_commands=None):
+        """Returns the base TableStyle commands plus any per-structure extras."""
+        # Base font uses self.font_regular (hopefully MyDejaVuSans)
+        # Bold font uses self.font_bold (hopefully MyDejaVuSans-Bold or Times-Bold fallback)
+        base_style = [
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, -1), self.font_regular),
+            # Header style
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), self.font_bold),
+            ('FONTSIZE', (0, 0), (-1, 0), 19), # Larger header font (e.g., 19pt)
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 5*mm),
+            # First column style (variant number)
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            # Use determined bold font for variant numbers
+            ('FONTNAME', (0, 1), (0, -1), self.font_bold),
+        ]
+        if style_commands:
+            base_style.extend(style_commands)
+        return base_style
+
+    def select_unique_tasks(self, all_tasks_data, seed=None):
+        """Selects unique tasks for all configured pages.
+
+        With a seed the selection is reproducible, and every pool shuffles
+        with its own Random seeded from (seed, task key): editing one pool or
+        page leaves every other page's selection unchanged, which is what
+        lets `pdf_generator_cli update` redraw only the affected pages.
+        Without a seed the global `random` module is used.
+        """
+        pool_rngs = {} # task_key -> random.Random
+        selected_tasks_map = {} # Key: page_num, Value: list of selected tasks
+        # Use a single pool for overall uniqueness check
+        overall_used_tasks = set() # Key: (task_key, index)
+
+        # Prepare available indices for each task key
+        available_tasks = {}
+        for key, tasks in all_tasks_data.items():
+            available_tasks[key] = list(range(len(tasks)))
+
+        # Iterate through the page configuration
+        for page_num, (task_key, needed_count, structure_info, _) in PAGE_TASK_MAP.items():
+            if task_key not in available_tasks:
+                print(f"Warning: Task key '{task_key}' not found in {TASKS_JSON_PATH} for page {page_num}. Skipping.")
+                selected_tasks_map[page_num] = []
+                continue
+
+            current_selection_indices = []
+            potential_indices = available_tasks[task_key][:] # Use a copy
+            if seed is None:
+                rng = random
+            else:
+                if task_key not in pool_rngs: pool_rngs[task_key] = random.Random(f"{seed}:{task_key}")
+                rng = pool_rngs[task_key]
+            rng.shuffle(potential_indices)
+
+            count = 0
+            actual_needed = items_needed(needed_count, structure_info)
+
+            for index in potential_indices:
+                task_tuple = (task_key, index)
+                if task_tuple not in overall_used_tasks:
+                    current_selection_indices.append(index)
+                    overall_used_tasks.add(task_tuple)
+                    count += 1
+                    if count >= actual_needed:
+                        break
+
+            if count < actual_needed:
+                 print(f"Warning: Could only select {count}/{actual_needed} unique tasks for page {page_num} ('{task_key}'). Not enough unique tasks available overall.")
+                 # Proceeding with the selection made
+
+            # Get the actual task strings/data
+            selected_tasks = [all_tasks_data[task_key][i] for i in current_selection_indices]
+            selected_tasks_map[page_num] = selected_tasks # Store tasks against page number
+
+        return selected_tasks_map
+
+    def build_table_data(self, page_num, needed_count, structure_info, selected_tasks, cell=None):
+        """Builds (table_data, col_widths, table_style_cmds, row_heights) for one page.
+
+        `selected_tasks` are compiled task records (see compile_tasks), so
+        their fields are ready-to-use Paragraph markup. `cell(text, style)`
+        creates each cell: a ReportLab Paragraph by default, or a lightweight
+        text cell for the direct backend.
+        """
+        if cell is None:
+            cell = platypus.Paragraph
+        structure = get_structure(structure_info.get('type'))
+        if structure is None:
+            print(f"Warning: Unhandled table structure type '{structure_info.get('type')}' for page {page_num}")
+            return [[cell("Error: Unhandled Table Type", self.styles['Normal_UA'])]], [170*mm], [], None
+
+        styles = self.styles
+        table_data = [[cell(header, styles[HEADER_STYLE]) for header in structure.headers]]
+        table_data += [[cell(text, styles[style_name]) for text, style_name in row]
+                       for row in table_rows(structure, needed_count, selected_tasks)]
+        return table_data, list(structure.col_widths), list(structure.style_commands), None
+
+    def table_key(self, output_page, page_num, needed_count, structure_info, selected_tasks, insert_y_pos):
+        """Content address of one page's table: equal keys draw identical tables.
+
+        Covers the structure type, column widths, styles, the selected items
+        (as cell markup) and where the table goes on the page.
+        """
+        table_data, col_widths, table_style_cmds, row_heights = self.build_table_data(
+            page_num, needed_count, structure_info, selected_tasks, cell=TextCell)
+        payload = [structure_info.get('type'), col_widths, row_heights, repr(self.table_style_commands(table_style_cmds)),
+                   [[(cell.text, cell.style.name) for cell in row] for row in table_data],
+                   round(insert_y_pos, 3), list(output_page.rect)]
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+    def draw_table(self, output_page, page_num, needed_count, structure_info, selected_tasks, insert_y_pos,
+                   table_key=None):
+        """Draws one table from insert_y_pos (below its identifier) down.
+
+        A table taller than the space left on output_page is split at row
+        boundaries; the rest goes onto continuation pages inserted right after
+        it, each repeating the header row. table_key (see table_key()) lets
+        the ReportLab path reuse a cached rendering.
+        """
+        if self.direct_renderer:
+            # Fast path: lay the table out from cached templates and write it with PyMuPDF
+            with self.timed("table_build"):
+                table_data, col_widths, table_style_cmds, row_heights = self.build_table_data(
+                    page_num, needed_count, structure_info, selected_tasks, cell=TextCell)
+                layout = None
+                if table_data:
+                    layout = self.direct_renderer.layout(structure_info['type'], table_data, col_widths,
+                                                         self.table_style_commands(table_style_cmds))
+            if not table_data:
+                 print(f"Warning: No table data generated for page {page_num}, skipping draw.")
+                 return
+            if layout is not None:
+                with self.timed("overlay"):
+                    self.draw_direct_layout(output_page, page_num, layout, insert_y_pos)
+                return
+            # A cell needs ReportLab's markup parser or cannot be wrapped: let ReportLab handle it
+
+        table_pdf, starts_on_next_page = self.render_table_reportlab(output_page, page_num, needed_count,
+                                                                     structure_info, selected_tasks, insert_y_pos,
+                                                                     table_key)
+        if table_pdf is None:
+            return
+        try:
+            with self.timed("overlay"):
+                self.place_table(output_page, page_num, table_pdf, insert_y_pos, starts_on_next_page)
+        finally:
+            table_pdf.close()
+
+    def table_frame(self, page, top):
+        """Returns the rect a table may fill on page: between the side margins, from top to the bottom margin."""
+        return fitz.Rect(page.rect.x0 + TABLE_SIDE_MARGIN, top,
+                         page.rect.x1 - TABLE_SIDE_MARGIN, page.rect.height - TABLE_BOTTOM_MARGIN)
+
+    def continuation_page(self, page, page_index):
+        """Inserts a blank page of the same size right after page (at page_index) and returns it.
+
+        Inserting invalidates the page numbers PyMuPDF cached on open pages,
+        so callers track indexes themselves.
+        """
+        return page.parent.new_page(pno=page_index + 1, width=page.rect.width, height=page.rect.height)
+
+    @staticmethod
+    def split_rows(row_heights, first_height, next_height):
+        """Greedily packs data rows (row 0 is the header) into chunks of at most the given heights.
+
+        Every chunk repeats the header. The first chunk may be empty when not
+        even one row fits below the identifier; a single row taller than a
+        whole page still gets a chunk of its own. Returns lists of row indices.
+        """
+        header_height = row_heights[0]
+        chunks = [[]]
+        used, limit = header_height, first_height
+        for r in range(1, len(row_heights)):
+            if used + row_heights[r] > limit and (chunks[-1] or len(chunks) == 1):
+                chunks.append([])
+                used, limit = header_height, next_height
+            chunks[-1].append(r)
+            used += row_heights[r]
+        return chunks
+
+    def fit_scale(self, page_num, frame, width, height):
+        """Returns the scale (never above 1) that fits a width x height block into frame."""
+        scale = min(1.0, frame.width / width, frame.height / height)
+        if scale < 1.0:
+            print(f"Warning: Part of the table for page {page_num} ({width:.1f} x {height:.1f} pts) does not fit "
+                  f"a page ({frame.width:.1f} x {frame.height:.1f} pts). It will be scaled down to {scale:.2f}.")
+        return scale
+
+    def draw_direct_layout(self, output_page, page_num, layout, insert_y_pos):
+        """Draws a measured direct-backend table, splitting it across continuation pages."""
+        first_frame = self.table_frame(output_page, insert_y_pos)
+        next_frame = self.table_frame(output_page, TABLE_TOP_MARGIN)
+        chunks = self.split_rows(layout.row_heights, first_frame.height, next_frame.height)
+        table_width = layout.col_x[-1]
+        page, page_index, frame = output_page, output_page.number, first_frame
+        for i, rows in enumerate(chunks):
+            if i > 0:
+                page = self.continuation_page(page, page_index)
+                page_index += 1
+                frame = self.table_frame(page, TABLE_TOP_MARGIN)
+            if not rows and len(chunks) > 1:
+                continue # Nothing fits below the identifier: the table starts on the next page
+            height = layout.row_heights[0] + sum(layout.row_heights[r] for r in rows)
+            scale = self.fit_scale(page_num, frame, table_width, height)
+            origin = fitz.Point(frame.x0 + (frame.width - table_width * scale) / 2.0, frame.y0)
+            self.direct_renderer.draw(page, layout, rows, origin, scale)
+
+    def render_table_reportlab(self, output_page, page_num, needed_count, structure_info, selected_tasks, insert_y_pos,
+                               table_key=None):
+        """Builds the table with ReportLab, one PDF page per page-sized chunk.
+
+        The table is measured with Table.wrap and split with Table.split, so
+        each chunk is rendered on a page exactly its own size. Returns
+        (fitz doc or None, whether the table starts on a continuation page).
+        """
+        use_cache = self.table_cache is not None and table_key is not None
+        cached = self.table_cache.get(table_key) if use_cache else None
+        if cached is not None:
+            # Cache entries are the starts_on_next_page flag byte + the table PDF
+            table_pdf_bytes, starts_on_next_page = cached[1:], cached[:1] == b"1"
+        else:
+            with self.timed("table_build"):
+                table_pdf_bytes, starts_on_next_page = self.build_table_pdf(
+                    output_page, page_num, needed_count, structure_info, selected_tasks, insert_y_pos)
+            if use_cache and table_pdf_bytes is not None:
+                self.table_cache.put(table_key, (b"1" if starts_on_next_page else b"0") + table_pdf_bytes)
+        if table_pdf_bytes is None:
+            return None, False
+        # Open the generated table PDF
+        with self.timed("table_reopen"):
+            return fitz.open("pdf", table_pdf_bytes), starts_on_next_page
+
+    def build_table_pdf(self, output_page, page_num, needed_count, structure_info, selected_tasks, insert_y_pos):
+        """ReportLab half of render_table_reportlab. Returns (PDF bytes or None, starts_on_next_page)."""
+        table_data, col_widths, table_style_cmds, row_heights = self.build_table_data(
+            page_num, needed_count, structure_info, selected_tasks, cell=TextCell)
+
+        # --- Draw Table using ReportLab ---
+        if not table_data:
+             print(f"Warning: No table data generated for page {page_num}, skipping draw.")
+             return None, False
+        if row_heights is None:
+            table_data, row_heights = self.wrap_cells(table_data, col_widths, self.table_style_commands(table_style_cmds))
+
+        first_frame = self.table_frame(output_page, insert_y_pos)
+        next_frame = self.table_frame(output_page, TABLE_TOP_MARGIN)
+        avail_width = first_frame.width
+        remaining = self.create_reportlab_table(table_data, col_widths, table_style_cmds, row_heights, repeat_rows=1)
+        chunks = []
+        starts_on_next_page = False
+        avail_height = first_frame.height
+        while True:
+            width, height = remaining.wrap(avail_width, avail_height)
+            if height <= avail_height:
+                chunks.append((remaining, width, height))
+                break
+            parts = remaining.split(avail_width, avail_height)
+            if len(parts) < 2:
+                if chunks or starts_on_next_page or avail_height == next_frame.height:
+                    chunks.append((remaining, width, height)) # A single row taller than a page: scaled to fit
+                    break
+                starts_on_next_page = True # Not even one row fits below the identifier
+            else:
+                first, remaining = parts
+                chunks.append((first, *first.wrap(avail_width, avail_height)))
+            avail_height = next_frame.height
+
+        # Create table in memory
+        temp_buffer = io.BytesIO()
+        try:
+            table_canvas = canvas.Canvas(temp_buffer)
+            for table, width, height in chunks:
+                table_canvas.setPageSize((width, height))
+                table.drawOn(table_canvas, 0, 0)
+                table_canvas.showPage()
+            table_canvas.save()
+            return temp_buffer.getvalue(), starts_on_next_page
+        finally:
+            temp_buffer.close()
+
+    def place_table(self, output_page, page_num, table_pdf, insert_y_pos, starts_on_next_page=False):
+        """Overlays each page of a rendered table document, adding continuation pages as needed."""
+        if len(table_pdf) == 0:
+             print(f"Warning: Generated table PDF for page {page_num} has no pages.")
+             return
+        page, page_index, frame = output_page, output_page.number, self.table_frame(output_page, insert_y_pos)
+        for chunk_num in range(len(table_pdf)):
+            if chunk_num > 0 or starts_on_next_page:
+                page = self.continuation_page(page, page_index)
+                page_index += 1
+                frame = self.table_frame(page, TABLE_TOP_MARGIN)
+            chunk_rect = table_pdf.load_page(chunk_num).rect
+            scale = self.fit_scale(page_num, frame, chunk_rect.width, chunk_rect.height)
+            width, height = chunk_rect.width * scale, chunk_rect.height * scale
+            x0 = frame.x0 + (frame.width - width) / 2.0
+            target_rect = fitz.Rect(x0, frame.y0, x0 + width, frame.y0 + height)
+            # Draw the table chunk onto the output page
+            page.show_pdf_page(target_rect, table_pdf, chunk_num)
+
+    def build_clone_template(self, path=None):
+        """Returns compacted source bytes that every clone-mode document starts from.
+
+        With a path they are saved there instead (and the path is returned).
+        """
+        if self.source_bytes is None:
+            template_doc = fitz.open(self.source_pdf_path)
+        else:
+            template_doc = fitz.open("pdf", self.source_bytes)
+        try:
+            # The tagged-PDF structure tree (thousands of objects in Word exports)
+            # would go stale once tables are overlaid, and the render path never
+            # carried it either - drop it so clones stay small and save fast.
+            catalog_xref = template_doc.pdf_catalog()
+            for key in ("StructTreeRoot", "MarkInfo"):
+                template_doc.xref_set_key(catalog_xref, key, "null")
+            # no_new_id: a fresh /ID here would differ per process and leak into every clone
+            if path:
+                template_doc.save(path, garbage=3, deflate=True, no_new_id=True)
+                return path
+            return template_doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+        finally:
+            template_doc.close()
+
+    def open_clone_template(self):
+        if self.clone_template_path:
+            return fitz.open(self.clone_template_path)
+        return fitz.open("pdf", self.clone_template)
+
+    def restore_source_page(self, page, template_doc, source_index):
+        """Resets page's contents to the untouched source page, dropping any table drawn on it."""
+        xrefs = page.get_contents()
+        if not xrefs:
+            return
+        page.parent.update_stream(xrefs[0], template_doc[source_index].read_contents())
+        if len(xrefs) > 1:
+            page.set_contents(xrefs[0])
+
+    def copy_source(self):
+        """Returns a new document holding every source page, per self.copy_mode."""
+        if self.copy_mode == COPY_MODE_CLONE:
+            return self.open_clone_template()
+
+        output_doc = fitz.open() # Create a new empty PDF for output
+        try:
+            self.copy_source_pages(output_doc, 0, len(self.source_doc) - 1)
+        except Exception:
+            output_doc.close()
+            raise
+        return output_doc
+
+    def copy_source_pages(self, output_doc, first, last):
+        """Render mode: appends 0-based source pages first..last to output_doc."""
+        source_doc = self.source_doc
+        for page_num in range(first, last + 1):
+            page = source_doc.load_page(page_num)
+            output_page = output_doc.new_page(width=page.rect.width, height=page.rect.height)
+            # Copy the entire source page content first
+            output_page.show_pdf_page(output_page.rect, source_doc, page_num)
+            if page_num + 1 not in PAGE_TASK_MAP:
+                output_page.clean_contents() # Mapped pages are cleaned after their table is drawn
+
+    def generate(self, seed=None, selected_tasks_for_pages=None, progress=None, cancel_event=None):
+        """Builds one variant document. Returns (output_doc, warnings).
+
+        `selected_tasks_for_pages` ({page_num: tasks}, e.g. from
+        pdf_generator_assign) overrides the per-document random selection.
+        `progress(done, total, page_num, task_key)` is called before each
+        mapped page; setting `cancel_event` (a threading.Event) stops the
+        build before the next page with GenerationCancelled.
+        The caller owns `output_doc` and must close it. `warnings` lists
+        per-table failures that were skipped instead of aborting the run.
+        """
+        stages_before = dict(self.stage_seconds) if self.trace else None
+        if selected_tasks_for_pages is None:
+            # --- Select ALL tasks needed across all pages first ---
+            with self.timed("select"):
+                selected_tasks_for_pages = self.select_unique_tasks(self.tasks_data, seed)
+        self.last_selection = selected_tasks_for_pages
+
+        warnings = []
+        with self.timed("copy"):
+            output_doc = self.copy_source()
+        try:
+            # --- Only the mapped pages change: overlay their tables ---
+            # (every page in PAGE_TASK_MAP has a resolved anchor, see resolve_anchors)
+            inserted_pages = 0 # Continuation pages added so far shift every later page
+            self.last_pages = {}
+            mapped_pages = sorted(PAGE_TASK_MAP)
+            for done, current_page_1_based in enumerate(mapped_pages):
+                self.check_progress(done, len(mapped_pages), current_page_1_based, progress, cancel_event)
+                inserted_pages += self.draw_mapped_page(output_doc, current_page_1_based, inserted_pages,
+                                                        selected_tasks_for_pages.get(current_page_1_based),
+                                                        warnings) - 1
+
+            self.subset_table_fonts(output_doc)
+        except Exception:
+            output_doc.close()
+            raise
+        if self.trace:
+            print(f"[trace] seed={seed} " + " ".join(
+                f"{stage}={(self.stage_seconds[stage] - stages_before[stage]) * 1000:.1f}ms"
+                for stage in PIPELINE_STAGES if self.stage_seconds[stage] != stages_before[stage]))
+        return output_doc, warnings
+
+    def subset_table_fonts(self, output_doc):
+        """Direct backend: strips the embedded table fonts of output_doc down to the glyphs used.
+
+        Each document embeds whole TTFs, and subset_fonts() walks every page,
+        so this runs exactly once per saved file, after its last table: at
+        the end of generate() and update(), and in compact_file() for
+        windowed builds. Counted as table time - the ReportLab path subsets
+        inside each table build.
+        """
+        if not self.direct_renderer:
+            return
+        subset_start = time.perf_counter()
+        with self.timed("subset"):
+            output_doc.subset_fonts()
+        self.table_seconds += time.perf_counter() - subset_start
+
+    def check_progress(self, done, total, page_num, progress=None, cancel_event=None):
+        """Reports the next mapped page to progress(); raises GenerationCancelled once cancel_event is set."""
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled(f"Generation cancelled before page {page_num}.")
+        if progress:
+            progress(done, total, page_num, PAGE_TASK_MAP[page_num][0])
+
+    def draw_mapped_page(self, output_doc, current_page_1_based, inserted_pages, selected_tasks, warnings):
+        """Draws the table of one mapped page, which sits inserted_pages pages later in output_doc.
+
+        Records the page in last_pages and appends drawing failures to
+        warnings. Returns how many pages the table takes (1 + continuations).
+        """
+        task_key, needed_count, structure_info, identifier_text = PAGE_TASK_MAP[current_page_1_based]
+        page_index = current_page_1_based - 1 + inserted_pages
+        output_page = output_doc.load_page(page_index)
+        page_count = len(output_doc)
+        table_key = None
+        if selected_tasks:
+            # --- Prepare & Draw New Table ---
+            table_start = time.perf_counter()
+            insert_y = self.anchors[current_page_1_based].insert_y
+            try:
+                table_key = self.table_key(output_page, current_page_1_based, needed_count,
+                                           structure_info, selected_tasks, insert_y)
+                self.draw_table(output_page, current_page_1_based, needed_count,
+                                structure_info, selected_tasks, insert_y, table_key)
+            except Exception as e: # Catch drawing errors
+                table_key = None # Not drawn: a later update retries it
+                tb_str = traceback.format_exc()
+                print(f"ERROR generating/drawing table for page {current_page_1_based}: {e}\n{tb_str}")
+                warnings.append(f"Could not generate/draw table for page {current_page_1_based}.\nIdentifier: '{identifier_text}'\nError: {e}")
+            finally:
+                self.table_seconds += time.perf_counter() - table_start
+
+        # No redaction needed or applied here
+        table_pages = len(output_doc) - page_count + 1 # The mapped page plus its continuations
+        with self.timed("clean"):
+            for table_page_index in range(page_index, page_index + table_pages):
+                output_doc[table_page_index].clean_contents() # Clean page contents
+        self.last_pages[current_page_1_based] = {"task_key": task_key, "table_key": table_key,
+                                                 "start": page_index, "count": table_pages}
+        return table_pages
+
+    def generate_to_file(self, output_pdf_path, seed=None, selected_tasks_for_pages=None, progress=None,
+                         cancel_event=None, garbage=WINDOW_SAVE_GARBAGE, deflate=SAVE_DEFLATE):
+        """Builds one variant document straight into output_pdf_path, self.window source pages at a time.
+
+        Clone mode starts from a copy of the template file; render mode
+        appends each window's source pages. Every window is opened from
+        the file, gets its tables, is flushed with an incremental save and
+        closed again, so only one window's pages and objects are ever in
+        memory. The direct backend embeds its fonts in the first window and
+        later windows reference them. The file is compacted once at the end
+        (see compact_file) with the given save settings. Returns warnings like generate();
+        last_pages/last_selection are set the same way.
+        """
+        if self.window <= 0:
+            raise ValueError("generate_to_file() needs a generator created with window > 0")
+        stages_before = dict(self.stage_seconds) if self.trace else None
+        if selected_tasks_for_pages is None:
+            with self.timed("select"):
+                selected_tasks_for_pages = self.select_unique_tasks(self.tasks_data, seed)
+        self.last_selection = selected_tasks_for_pages
+
+        warnings = []
+        self.last_pages = {}
+        mapped_pages = sorted(PAGE_TASK_MAP)
+        source_page_count = len(self.source_doc)
+        inserted_pages = 0
+        done = 0
+        opened = False # Whether a window of this file was opened (and saved) before
+        try:
+            if self.copy_mode == COPY_MODE_CLONE:
+                with self.timed("copy"):
+                    shutil.copyfile(self.clone_template_path, output_pdf_path)
+            for first in range(0, source_page_count, self.window):
+                last = min(first + self.window, source_page_count) - 1
+                window_pages = [page_num for page_num in mapped_pages if first < page_num <= last + 1]
+                if self.copy_mode == COPY_MODE_CLONE and not window_pages:
+                    continue # Untouched pages are already in the file
+                new_file = first == 0 and self.copy_mode != COPY_MODE_CLONE
+                output_doc = fitz.open() if new_file else fitz.open(output_pdf_path)
+                if self.direct_renderer:
+                    self.direct_renderer.start_document(output_doc, reopened=opened)
+                opened = True
+                try:
+                    if self.copy_mode != COPY_MODE_CLONE:
+                        with self.timed("copy"):
+                            self.copy_source_pages(output_doc, first, last)
+                    for current_page_1_based in window_pages:
+                        self.check_progress(done, len(mapped_pages), current_page_1_based, progress, cancel_event)
+                        inserted_pages += self.draw_mapped_page(output_doc, current_page_1_based, inserted_pages,
+                                                                selected_tasks_for_pages.get(current_page_1_based),
+                                                                warnings) - 1
+                        done += 1
+                    with self.timed("save"):
+                        # no_new_id: as in save_document, the same seed gives the same bytes
+                        if new_file:
+                            output_doc.save(output_pdf_path, no_new_id=True)
+                        else:
+                            output_doc.save(output_pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP,
+                                            no_new_id=True)
+                finally:
+                    output_doc.close()
+            self.compact_file(output_pdf_path, garbage, deflate)
+        except BaseException:
+            if os.path.exists(output_pdf_path):
+                os.remove(output_pdf_path)
+            raise
+        if self.trace:
+            print(f"[trace] seed={seed} " + " ".join(
+                f"{stage}={(self.stage_seconds[stage] - stages_before[stage]) * 1000:.1f}ms"
+                for stage in PIPELINE_STAGES if self.stage_seconds[stage] != stages_before[stage]))
+        return warnings
+
+    def compact_file(self, output_pdf_path, garbage=WINDOW_SAVE_GARBAGE, deflate=SAVE_DEFLATE):
+        """Rewrites a generate_to_file() result without its dead and duplicated objects.
+
+        The incremental saves keep every object a later window replaced; one
+        full save drops them, and the direct backend's fonts (embedded in
+        the first window only) are subset once, over the whole document, as
+        generate() does. Render mode copies the source page resources again
+        in every window: only garbage level 4, which compares every stream,
+        merges those copies, and it dominates the time on large sources -
+        hence the default level 3.
+        """
+        tmp_path = f"{output_pdf_path}.{os.getpid()}.tmp"
+        output_doc = fitz.open(output_pdf_path)
+        try:
+            self.subset_table_fonts(output_doc)
+            with self.timed("save"):
+                # Table pages were cleaned when drawn: cleaning twice is not lossless (see save_document)
+                save_document(output_doc, tmp_path, clean=False, garbage=garbage, deflate=deflate)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            output_doc.close()
+        os.replace(tmp_path, output_pdf_path)
+
+    def update(self, output_doc, previous_pages, seed=None, selected_tasks_for_pages=None):
+        """Patches a previously generated document in place, redrawing only changed tables.
+
+        previous_pages is the last_pages record of the run that produced
+        output_doc (see pdf_generator_incremental manifests). Every mapped
+        page whose table_key differs - new selection, PAGE_TASK_MAP entry or
+        anchor - goes back to its source contents, loses its old continuation
+        pages and gets the new table; pages dropped from PAGE_TASK_MAP just
+        go back to the source. Only clone-mode output can be patched, and
+        output_doc must be opened from the saved file: fonts embedded (and
+        subset) by an earlier in-memory pass would be reused by the direct
+        backend.
+        Returns (changed page numbers, warnings); last_pages then describes
+        the patched document.
+        """
+        if self.copy_mode != COPY_MODE_CLONE:
+            raise ValueError("Only clone-mode documents can be updated in place")
+        if selected_tasks_for_pages is None:
+            with self.timed("select"):
+                selected_tasks_for_pages = self.select_unique_tasks(self.tasks_data, seed)
+        self.last_selection = selected_tasks_for_pages
+
+        def old_start(page_num):
+            """Index of page_num in output_doc as it was generated."""
+            if page_num in previous_pages:
+                return previous_pages[page_num]["start"]
+            return page_num - 1 + sum(info["count"] - 1 for p, info in previous_pages.items() if p < page_num)
+
+        warnings = []
+        changed = []
+        new_pages = {}
+        template_doc = self.open_clone_template()
+        try:
+            # Back to front: patching a page never moves the pages before it
+            for page_num in sorted(set(previous_pages) | set(PAGE_TASK_MAP), reverse=True):
+                old = previous_pages.get(page_num)
+                start = old_start(page_num)
+                old_count = old["count"] if old else 1
+                output_page = output_doc[start]
+                table_key = None
+                if page_num in PAGE_TASK_MAP:
+                    task_key, needed_count, structure_info, identifier_text = PAGE_TASK_MAP[page_num]
+                    selected_tasks = selected_tasks_for_pages.get(page_num)
+                    insert_y = self.anchors[page_num].insert_y
+                    if selected_tasks:
+                        table_key = self.table_key(output_page, page_num, needed_count, structure_info,
+                                                   selected_tasks, insert_y)
+                    if old and old["table_key"] == table_key:
+                        new_pages[page_num] = {"task_key": task_key, "table_key": table_key, "count": old_count}
+                        continue
+                elif not old:
+                    continue
+
+                # --- Patch: back to the source page, then draw the new table ---
+                changed.append(page_num)
+                table_start = time.perf_counter()
+                if old_count > 1:
+                    output_doc.delete_pages(start + 1, start + old_count - 1)
+                output_page = output_doc[start]
+                self.restore_source_page(output_page, template_doc, page_num - 1)
+                page_count = len(output_doc)
+                if table_key:
+                    try:
+                        self.draw_table(output_page, page_num, needed_count, structure_info, selected_tasks,
+                                        insert_y, table_key)
+                    except Exception as e:
+                        tb_str = traceback.format_exc()
+                        print(f"ERROR generating/drawing table for page {page_num}: {e}\n{tb_str}")
+                        warnings.append(f"Could not generate/draw table for page {page_num}.\nIdentifier: '{identifier_text}'\nError: {e}")
+                        table_key = None
+                self.table_seconds += time.perf_counter() - table_start
+                table_pages = len(output_doc) - page_count + 1
+                with self.timed("clean"):
+                    for table_page_index in range(start, start + table_pages):
+                        output_doc[table_page_index].clean_contents()
+                if page_num in PAGE_TASK_MAP:
+                    new_pages[page_num] = {"task_key": task_key, "table_key": table_key, "count": table_pages}
+        finally:
+            template_doc.close()
+
+        inserted_pages = 0
+        for page_num in sorted(new_pages):
+            new_pages[page_num]["start"] = page_num - 1 + inserted_pages
+            inserted_pages += new_pages[page_num]["count"] - 1
+        if changed:
+            self.subset_table_fonts(output_doc)
+        self.last_pages = new_pages
+        return sorted(changed), warnings
+
+
+def save_document(output_doc, output_pdf_path, clean=True, garbage=SAVE_GARBAGE, deflate=SAVE_DEFLATE):
+    """Saves a generated document with the standard compaction settings.
+
+    Pass clean=False when re-saving a document that was saved cleaned
+    before (DocumentGenerator.update): sanitizing already sanitized
+    content streams again is not lossless on every source page.
+    """
+    # no_new_id keeps the trailer free of a random /ID, so the same seed
+    # always gives a byte-identical file (serial or pooled)
+    output_doc.save(output_pdf_path, garbage=garbage, deflate=deflate, clean=clean, no_new_id=True)
+
+
+def document_bytes(output_doc, garbage=SAVE_GARBAGE, deflate=SAVE_DEFLATE, clean=True):
+    """Serializes a generated document in memory, byte-identical to save_document() with the same settings.
+
+    Call it once per document: cleaning rewrites the page contents in place
+    (and pages assembled from cleaned documents want clean=False, see save_document).
+    """
+    return output_doc.tobytes(garbage=garbage, deflate=deflate, clean=clean, no_new_id=True)
@@ -0,0 +1,419 @@
+import html
+import re
+from collections import namedtuple
+
+from pdf_generator_cells import CellLayout, CellLayoutCache
+from pdf_generator_lazy import lazy_import
+fitz = lazy_import("fitz")  # PyMuPDF
+pdfmetrics = lazy_import("reportlab.pdfbase.pdfmetrics")
+platypus = lazy_import("reportlab.platypus")
+
+# Direct table backend: lays tables out the way ReportLab's Table/Paragraph
+# would (same column widths, paddings, leading and first-baseline offset) and
+# writes the cells straight onto the output page with PyMuPDF, skipping the
+# Table build -> BytesIO -> fitz.open("pdf", ...) -> show_pdf_page round trip.
+# Anything it cannot reproduce faithfully makes layout() return None so the
+# caller falls back to ReportLab.
+#
+# Each drawn chunk becomes one content stream of plain PDF operators
+# (backgrounds, grid, then every line of text as glyph ids), appended to the
+# page once. Going through Shape/TextWriter instead costs a Python-level
+# transform per point and ~160us per text line.
+
+# A table cell for the direct backend: same (text, style) as Paragraph(text, style)
+# but without running the Paragraph markup parser.
+TextCell = namedtuple("TextCell", ["text", "style"])
+
+# ReportLab defaults we have to mirror
+DEFAULT_PADDING = {'LEFTPADDING': 6, 'RIGHTPADDING': 6, 'TOPPADDING': 3, 'BOTTOMPADDING': 3}
+
+# Page resource names of the embedded table fonts: /DTF0, /DTF1, ...
+FONT_RESOURCE_PREFIX = "DTF"
+
+_BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+
+# Per-template layout kept in memory: column x offsets, header row lines and height
+TableTemplate = namedtuple("TableTemplate", ["col_x", "header_lines", "header_height"])
+
+# One measured table: wrapped lines and height of every row (row 0 is the header),
+# ready to be drawn whole or split into page-sized chunks of rows
+TableLayout = namedtuple("TableLayout", ["table_data", "col_widths", "col_x", "cell_styles", "lines", "row_heights"])
+
+
+def _pdf_number(value):
+    """Formats a number for a content stream: fixed point, no exponent, no trailing zeros."""
+    text = "%.3f" % value
+    text = text.rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _font_dict(doc, page):
+    """Returns (xref, key prefix) of the dict holding page's /Font resources, or None if they are inherited."""
+    kind, value = doc.xref_get_key(page.xref, "Resources")
+    if kind == "xref":
+        xref, prefix = int(value.split()[0]), ""
+    elif kind == "dict":
+        xref, prefix = page.xref, "Resources/"
+    else:
+        return None
+    kind, value = doc.xref_get_key(xref, prefix + "Font")
+    if kind == "xref":
+        return int(value.split()[0]), ""
+    return xref, prefix + "Font/"
+
+
+def _cell_range(start, stop, ncols, nrows):
+    c0, r0 = start
+    c1, r1 = stop
+    if c0 < 0: c0 += ncols
+    if c1 < 0: c1 += ncols
+    if r0 < 0: r0 += nrows
+    if r1 < 0: r1 += nrows
+    return c0, r0, c1, r1
+
+
+def resolve_cell_styles(style_commands, ncols, nrows):
+    """Resolves TableStyle commands into per-cell padding/valign/background dicts."""
+    cells = [[dict(DEFAULT_PADDING, VALIGN='BOTTOM', BACKGROUND=None) for _ in range(ncols)] for _ in range(nrows)]
+    for command in style_commands:
+        name = command[0]
+        if name not in DEFAULT_PADDING and name not in ('VALIGN', 'BACKGROUND'):
+            continue # FONTNAME/ALIGN/... do not affect Paragraph cells
+        c0, r0, c1, r1 = _cell_range(command[1], command[2], ncols, nrows)
+        for r in range(max(r0, 0), min(r1, nrows - 1) + 1):
+            for c in range(max(c0, 0), min(c1, ncols - 1) + 1):
+                cells[r][c][name] = command[3]
+    return cells
+
+
+class DirectTableRenderer:
+    """Lays out tables of TextCells and draws them straight onto PyMuPDF pages."""
+
+    def __init__(self, cell_cache=None):
+        self.cell_cache = CellLayoutCache() if cell_cache is None else cell_cache
+        self._fonts = {} # ReportLab font name -> fitz.Font (or None if unsupported)
+        self._font_files = {} # ReportLab font name -> TTF/OTF path
+        self._glyphs = {} # ReportLab font name -> {char: glyph id as 4 hex digits}
+        self._font_doc = None # Document the fonts in _font_xrefs are embedded in
+        self._font_xrefs = {} # ReportLab font name -> font xref in _font_doc
+        self._templates = {} # (structure_type, col_widths, header texts) -> TableTemplate
+        self._cell_styles = {} # (style commands, ncols, nrows) -> per-cell style dicts
+        self.rendered = 0
+        self.fallbacks = 0
+
+    # --- Fonts / text measurement ---
+
+    def font_for(self, font_name):
+        """Returns the fitz.Font matching a ReportLab font name, or None if unsupported.
+
+        Only TrueType/OpenType fonts are drawn directly (as Identity-H glyph
+        ids); the standard Type1 fallbacks go through ReportLab.
+        """
+        if font_name not in self._fonts:
+            font = None
+            try:
+                rl_font = pdfmetrics.getFont(font_name)
+                font_file = getattr(getattr(rl_font, 'face', None), 'filename', None)
+                if font_file and str(font_file).lower().endswith(('.ttf', '.otf')):
+                    font = fitz.Font(fontfile=font_file)
+                    self._font_files[font_name] = str(font_file)
+            except Exception as e:
+                print(f"Warning: Direct table backend cannot load font '{font_name}': {e}")
+            self._fonts[font_name] = font
+        return self._fonts[font_name]
+
+    def start_document(self, doc, reopened=False):
+        """Makes doc the document fonts are embedded in, forgetting those of the last one.
+
+        reopened=True: doc is the file the last document was saved to
+        incrementally (see DocumentGenerator.generate_to_file). Object numbers
+        survive that save, so its fonts are referenced, not embedded again.
+        """
+        if not reopened:
+            self._font_xrefs = {}
+        self._font_doc = doc
+
+    def font_resource(self, page, font_name):
+        """Returns the resource name of font_name on page, embedding the font once per document.
+
+        Later pages of the same document just get a reference to that copy;
+        DocumentGenerator subsets it before the document is saved. The name
+        is one the page does not use yet: a page patched by update() still
+        lists the old table's (subset) font.
+        """
+        doc = page.parent
+        if self._font_doc is not doc:
+            # Documents cannot be weakly referenced: hold the current one and start over on the next
+            self.start_document(doc)
+        xref = self._font_xrefs.get(font_name)
+        page_fonts = {name: font_xref for font_xref, _, _, _, name, _ in page.get_fonts()}
+        for name, font_xref in page_fonts.items():
+            if font_xref == xref:
+                return name
+        index = 0
+        while f"{FONT_RESOURCE_PREFIX}{index}" in page_fonts:
+            index += 1
+        name = f"{FONT_RESOURCE_PREFIX}{index}"
+        target = None if xref is None else _font_dict(doc, page)
+        if target is None: # First use in this document, or inherited resources (rare, slow)
+            self._font_xrefs[font_name] = page.insert_font(fontname=name, fontfile=self._font_files[font_name])
+        else:
+            doc.xref_set_key(target[0], target[1] + name, f"{xref} 0 R")
+        return name
+
+    def encode(self, font_name, text):
+        """Returns text as the hex glyph ids of font_name (the font is embedded with Identity-H)."""
+        glyphs = self._glyphs.setdefault(font_name, {})
+        codes = []
+        for ch in text:
+            code = glyphs.get(ch)
+            if code is None:
+                code = glyphs[ch] = "%04x" % self.font_for(font_name).has_glyph(ord(ch))
+            codes.append(code)
+        return "".join(codes)
+
+    def wrap(self, text, style, width):
+        """Breaks Paragraph-style text into lines no wider than width.
+
+        Widths come from ReportLab's own metrics (stringWidth), so the breaks
+        match what Paragraph.wrap would produce, including splitLongWords.
+        Returns a list of (line text, line width), or None if the cell would
+        overflow and ReportLab has to handle it.
+        """
+        if self.font_for(style.fontName) is None:
+            return None
+        font_name, size = style.fontName, style.fontSize
+        space_width = pdfmetrics.stringWidth(" ", font_name, size)
+        # ReportLab lets each inter-word space shrink a little to make a line fit
+        space_shrink = getattr(style, 'spaceShrinkage', 0) * space_width
+        lines = []
+        hard_lines = _BR_RE.split(str(text))
+        if any('<' in hard_line for hard_line in hard_lines):
+            return None # Other Paragraph markup: only ReportLab's parser knows what it renders
+        for hard_line in hard_lines:
+            words = html.unescape(hard_line).split()
+            current = []
+            current_width = 0
+            for word in words:
+                word_width = pdfmetrics.stringWidth(word, font_name, size)
+                if word_width > width:
+                    if not getattr(style, 'splitLongWords', 1):
+                        return None
+                    start_width = current_width + space_width if current else 0
+                    pieces = self.split_long_word(word, font_name, size, start_width, width)
+                    if len(pieces) < 2:
+                        return None # A single glyph wider than the column
+                    # First piece finishes the current line, the last one starts the next
+                    first_text, first_width = pieces[0]
+                    if first_text:
+                        current.append(first_text)
+                        current_width = start_width + first_width
+                    if current:
+                        lines.append((" ".join(current), current_width))
+                    lines.extend(pieces[1:-1])
+                    current_width = pieces[-1][1]
+                    current = [pieces[-1][0]]
+                elif current and current_width + space_width + word_width > width + space_shrink * len(current):
+                    lines.append((" ".join(current), current_width))
+                    current, current_width = [word], word_width
+                else:
+                    current_width = current_width + space_width + word_width if current else word_width
+                    current.append(word)
+            if current:
+                lines.append((" ".join(current), current_width))
+        return lines
+
+    def split_long_word(self, word, font_name, size, start_width, width):
+        """Splits a too-wide word character-wise like ReportLab's _splitWord.
+
+        The first piece fills the rest of the current line (it may be empty);
+        every following piece gets a full line. Returns [(text, width), ...].
+        """
+        pieces = []
+        piece = ''
+        piece_width = 0
+        line_width = start_width
+        for ch in word:
+            char_width = pdfmetrics.stringWidth(ch, font_name, size)
+            if line_width + char_width > width and (piece or char_width <= width):
+                pieces.append((piece, piece_width))
+                piece, piece_width, line_width = '', 0, 0
+            piece += ch
+            piece_width += char_width
+            line_width += char_width
+        pieces.append((piece, piece_width))
+        return pieces
+
+    # --- Layout caches ---
+
+    def cell_styles(self, style_commands, ncols, nrows):
+        """Resolves TableStyle commands into per-cell padding/valign/background dicts."""
+        key = (repr(style_commands), ncols, nrows)
+        cached = self._cell_styles.get(key)
+        if cached is not None:
+            return cached
+        cells = resolve_cell_styles(style_commands, ncols, nrows)
+        self._cell_styles[key] = cells
+        return cells
+
+    def template_for(self, structure_type, header_row, col_widths, header_styles):
+        """Returns the cached TableTemplate for this structure, building it on first use.
+
+        The header row is wrapped once by ReportLab itself, so headers that
+        need long-word splitting (e.g. "No." in a 15mm column) still match.
+        """
+        key = (structure_type, tuple(col_widths), tuple(cell.text for cell in header_row))
+        template = self._templates.get(key)
+        if template is None:
+            col_x = [0]
+            for width in col_widths:
+                col_x.append(col_x[-1] + width)
+            header_lines = []
+            header_height = 0
+            for cell, width, cell_style in zip(header_row, col_widths, header_styles):
+                avail = width - cell_style['LEFTPADDING'] - cell_style['RIGHTPADDING']
+                paragraph = platypus.Paragraph(cell.text, cell.style)
+                paragraph.wrap(avail, 1e6)
+                if paragraph.blPara.kind != 0 or self.font_for(cell.style.fontName) is None:
+                    return None # Styled fragments: leave it to ReportLab
+                lines = [(" ".join(words), avail - extra_space) for extra_space, words in paragraph.blPara.lines]
+                header_lines.append(lines)
+                header_height = max(header_height, len(lines) * cell.style.leading
+                                    + cell_style['TOPPADDING'] + cell_style['BOTTOMPADDING'])
+            template = TableTemplate(col_x, header_lines, header_height)
+            self._templates[key] = template
+        return template
+
+    def cell_layout(self, text, style, width):
+        """wrap() through the cell cache: the CellLayout of one cell (lines None if it cannot be drawn directly)."""
+        key = ("direct", text, style.name, width)
+        layout = self.cell_cache.get(key)
+        if layout is None:
+            lines = self.wrap(text, style, width)
+            layout = CellLayout(None, lines, 0 if lines is None else len(lines) * style.leading)
+            self.cell_cache.put(key, layout)
+        return layout
+
+    def layout_row(self, row, col_widths, row_styles):
+        """Wraps every cell of a row. Returns (lines per cell, row height) or (None, 0) on overflow."""
+        row_lines = []
+        row_height = 0
+        for cell, width, cell_style in zip(row, col_widths, row_styles):
+            avail = width - cell_style['LEFTPADDING'] - cell_style['RIGHTPADDING']
+            layout = self.cell_layout(cell.text, cell.style, avail)
+            if layout.lines is None:
+                return None, 0
+            row_lines.append(layout.lines)
+            height = layout.height + cell_style['TOPPADDING'] + cell_style['BOTTOMPADDING']
+            row_height = max(row_height, height)
+        return row_lines, row_height
+
+    # --- Rendering ---
+
+    def layout(self, structure_type, table_data, col_widths, style_commands):
+        """Wraps every cell of table_data. Returns a TableLayout, or None to fall back to ReportLab."""
+        if (not table_data or not col_widths or any(len(row) != len(col_widths) for row in table_data)
+                or not all(isinstance(cell, TextCell) for row in table_data for cell in row)):
+            self.fallbacks += 1
+            return None
+        ncols, nrows = len(col_widths), len(table_data)
+        cell_styles = self.cell_styles(style_commands, ncols, nrows)
+        template = self.template_for(structure_type, table_data[0], col_widths, cell_styles[0])
+        if template is None:
+            self.fallbacks += 1
+            return None
+
+        # --- Measure data rows ---
+        all_lines = [template.header_lines]
+        row_heights = [template.header_height]
+        for r in range(1, nrows):
+            row_lines, row_height = self.layout_row(table_data[r], col_widths, cell_styles[r])
+            if row_lines is None:
+                self.fallbacks += 1
+                return None
+            all_lines.append(row_lines)
+            row_heights.append(row_height)
+        self.rendered += 1
+        return TableLayout(table_data, col_widths, template.col_x, cell_styles, all_lines, row_heights)
+
+    def draw(self, page, layout, rows, origin, scale=1.0):
+        """Draws the header row plus layout rows `rows` onto page, top-left corner at origin.
+
+        Every chunk of a split table repeats the header, like Table(repeatRows=1).
+        Everything is written in table units (y down from the table's top-left
+        corner); a single cm maps them onto the page.
+        """
+        rows = [0] + [r for r in rows if r != 0]
+        col_x, col_widths, cell_styles = layout.col_x, layout.col_widths, layout.cell_styles
+        table_width = col_x[-1]
+        ncols = len(col_widths)
+        num = _pdf_number
+
+        row_y = [0]
+        for r in rows:
+            row_y.append(row_y[-1] + layout.row_heights[r])
+
+        matrix = fitz.Matrix(scale, 0, 0, scale, origin.x, origin.y) * ~page.transformation_matrix
+        ops = ["q", " ".join(num(v) for v in matrix) + " cm"]
+
+        # --- Backgrounds and grid ---
+        for i, r in enumerate(rows):
+            for c in range(ncols):
+                background = cell_styles[r][c]['BACKGROUND']
+                if background is not None:
+                    ops.append(" ".join(num(v) for v in background.rgb()) + " rg "
+                               f"{num(col_x[c])} {num(row_y[i])} {num(col_widths[c])} {num(row_y[i + 1] - row_y[i])} re f")
+        ops.append("0 0 0 RG 1 w")
+        for y in row_y:
+            ops.append(f"0 {num(y)} m {num(table_width)} {num(y)} l")
+        for x in col_x:
+            ops.append(f"{num(x)} 0 m {num(x)} {num(row_y[-1])} l")
+        ops.append("S")
+
+        # --- Cell text ---
+        ops.append("BT 0 g") # All table paragraph styles use black text
+        resources = {} # ReportLab font name -> resource name on this page
+        current_font = None
+        for i, r in enumerate(rows):
+            for c in range(ncols):
+                cell, cell_style, lines = layout.table_data[r][c], cell_styles[r][c], layout.lines[r][c]
+                if not lines:
+                    continue
+                style = cell.style
+                if style.fontName not in resources:
+                    resources[style.fontName] = self.font_resource(page, style.fontName)
+                font = (resources[style.fontName], style.fontSize)
+                if font != current_font:
+                    ops.append(f"/{font[0]} {num(font[1])} Tf")
+                    current_font = font
+                para_height = len(lines) * style.leading
+                if cell_style['VALIGN'] == 'TOP':
+                    para_top = row_y[i] + cell_style['TOPPADDING']
+                elif cell_style['VALIGN'] == 'BOTTOM':
+                    para_top = row_y[i + 1] - cell_style['BOTTOMPADDING'] - para_height
+                else:
+                    para_top = row_y[i] + (layout.row_heights[r] - cell_style['BOTTOMPADDING'] + cell_style['TOPPADDING'] - para_height) / 2.0
+                left = col_x[c] + cell_style['LEFTPADDING']
+                avail = col_widths[c] - cell_style['LEFTPADDING'] - cell_style['RIGHTPADDING']
+                baseline = para_top + style.fontSize # First baseline sits fontSize below the paragraph top
+                for text, width in lines:
+                    if style.alignment == 1: x = left + (avail - width) / 2.0
+                    elif style.alignment == 2: x = left + avail - width
+                    else: x = left
+                    # Flip y back up so the glyphs stand upright
+                    ops.append(f"1 0 0 -1 {num(x)} {num(baseline)} Tm <{self.encode(style.fontName, text)}> Tj")
+                    baseline += style.leading
+        ops.append("ET")
+        ops.append("Q")
+        self.write_content(page, "\n".join(ops).encode("ascii"))
+
+    def write_content(self, page, content):
+        """Appends content as a new content stream of page, after balancing the page's own q/Q."""
+        doc = page.parent
+        if not page.is_wrapped:
+            page.wrap_contents()
+        xref = doc.get_new_xref()
+        doc.update_object(xref, "<<>>")
+        doc.update_stream(xref, content)
+        contents = page.get_contents() + [xref]
+        doc.xref_set_key(page.xref, "Contents", "[" + " ".join(f"{x} 0 R" for x in contents) + "]")
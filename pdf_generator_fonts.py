@@ -0,0 +1,158 @@
+import os
+import shutil
+import subprocess
+import sys
+
+from pdf_generator_lazy import lazy_import
+rl_styles = lazy_import("reportlab.lib.styles")
+pdfmetrics = lazy_import("reportlab.pdfbase.pdfmetrics")
+ttfonts = lazy_import("reportlab.pdfbase.ttfonts")
+
+# Font resolution and the shared stylesheet. Both are module-level and built
+# once per process: every DocumentGenerator (and every pool worker's single
+# generator) reuses the same registered TTFonts and ParagraphStyles.
+
+# Extra font directories, searched first; os.pathsep-separated like PATH
+FONT_PATH_ENV = "PDF_GENERATOR_FONT_PATH"
+
+# (ReportLab name, file name, fontconfig pattern) for the fonts we embed
+REGULAR_FONT = ('MyDejaVuSans', "DejaVuSans.ttf", "DejaVu Sans:style=Book")
+BOLD_FONT = ('MyDejaVuSans-Bold', "DejaVuSans-Bold.ttf", "DejaVu Sans:style=Bold")
+
+# Standard Type1 fallbacks - they cannot encode Cyrillic
+FALLBACK_REGULAR = 'Times-Roman'
+FALLBACK_BOLD = 'Times-Bold'
+
+_registered_fonts = None # (regular_name, bold_name) once register_fonts() has run
+_styles = {} # (regular_name, bold_name) -> stylesheet
+_font_files = {} # file name -> resolved path (or None)
+
+
+def font_search_path():
+    """Returns the directories searched for font files, most specific first."""
+    dirs = [d for d in os.environ.get(FONT_PATH_ENV, "").split(os.pathsep) if d]
+    user_profile = os.environ.get('USERPROFILE')
+    if user_profile:
+        dirs.append(os.path.join(user_profile, 'AppData', 'Local', 'Microsoft', 'Windows', 'Fonts'))
+    if sys.platform == 'win32':
+        dirs.append(os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'))
+    elif sys.platform == 'darwin':
+        dirs += [os.path.expanduser('~/Library/Fonts'), '/Library/Fonts', '/System/Library/Fonts']
+    else:
+        data_home = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+        dirs += [os.path.join(data_home, 'fonts'), os.path.expanduser('~/.fonts'),
+                 '/usr/local/share/fonts', '/usr/share/fonts']
+    return dirs
+
+
+def fc_match(pattern):
+    """Asks fontconfig for the file matching pattern. Returns a path or None."""
+    fc_match_bin = shutil.which('fc-match')
+    if not fc_match_bin:
+        return None
+    try:
+        result = subprocess.run([fc_match_bin, '--format=%{file}', pattern],
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    path = result.stdout.strip()
+    return path if result.returncode == 0 and os.path.isfile(path) else None
+
+
+def find_font_file(file_name, fc_pattern=None):
+    """Resolves a font file name through the search path, then fontconfig. Cached per process."""
+    if file_name in _font_files:
+        return _font_files[file_name]
+    found = None
+    for font_dir in font_search_path():
+        if not os.path.isdir(font_dir):
+            continue
+        candidate = os.path.join(font_dir, file_name)
+        if os.path.isfile(candidate):
+            found = candidate
+            break
+        # System font trees keep files in per-family subdirectories (truetype/dejavu/...)
+        for root, _, files in os.walk(font_dir):
+            if file_name in files:
+                found = os.path.join(root, file_name)
+                break
+        if found:
+            break
+    if found is None and fc_pattern:
+        path = fc_match(fc_pattern)
+        # fontconfig substitutes the closest family; only accept the exact file
+        if path and os.path.basename(path) == file_name:
+            found = path
+    _font_files[file_name] = found
+    return found
+
+
+def register_fonts():
+    """Registers DejaVu TTFs with ReportLab once per process. Returns (regular_name, bold_name)."""
+    global _registered_fonts
+    if _registered_fonts is not None:
+        return _registered_fonts
+
+    font_regular_name = FALLBACK_REGULAR
+    font_bold_name = FALLBACK_BOLD
+    try:
+        paths = [find_font_file(file_name, pattern) for _, file_name, pattern in (REGULAR_FONT, BOLD_FONT)]
+        if all(paths):
+            for (registered_name, _, _), font_path in zip((REGULAR_FONT, BOLD_FONT), paths):
+                print(f"Registering TTF: {font_path} as {registered_name}")
+                pdfmetrics.registerFont(ttfonts.TTFont(registered_name, font_path))
+            # Fails here if registration didn't truly work
+            pdfmetrics.getFont(REGULAR_FONT[0])
+            pdfmetrics.getFont(BOLD_FONT[0])
+            font_regular_name, font_bold_name = REGULAR_FONT[0], BOLD_FONT[0]
+        else:
+            print(f"!!! WARNING: DejaVuSans TTF files not found in {font_search_path()} or via fontconfig "
+                  f"(set {FONT_PATH_ENV} to add a directory). Using fallback {FALLBACK_REGULAR}/{FALLBACK_BOLD} "
+                  f"(Encoding WILL likely fail).")
+    except Exception as e:
+        print(f"!!! ERROR during font registration: {e}. Using fallback {FALLBACK_REGULAR}/{FALLBACK_BOLD} "
+              f"(Encoding WILL likely fail).")
+        font_regular_name, font_bold_name = FALLBACK_REGULAR, FALLBACK_BOLD
+    _registered_fonts = (font_regular_name, font_bold_name)
+    return _registered_fonts
+
+
+def create_styles(font_name_regular, font_name_bold):
+    """Creates ParagraphStyles, inheriting regular font where possible."""
+    # Use the font names determined by register_fonts()
+    ParagraphStyle = rl_styles.ParagraphStyle
+    styles = rl_styles.getSampleStyleSheet()
+    base_size = 14 # Keep this for potential non-table text if needed
+    table_font_size = 18 # Increase Paragraph font size for table cells to 18pt
+    table_leading = table_font_size * 1.2 # Set leading based on font size (e.g., 21.6)
+
+    # Define base styles using the determined regular font
+    styles.add(ParagraphStyle(name='Normal_UA', parent=styles['Normal'], fontName=font_name_regular, fontSize=base_size))
+    styles.add(ParagraphStyle(name='BodyText_UA', parent=styles['BodyText'], fontName=font_name_regular, fontSize=base_size))
+    styles.add(ParagraphStyle(name='Italic_UA', parent=styles['Italic'], fontName=font_name_regular, fontSize=base_size))
+
+    # Headings using determined bold font
+    styles.add(ParagraphStyle(name='Heading1_UA', parent=styles['h1'], fontName=font_name_bold, fontSize=base_size+4))
+    styles.add(ParagraphStyle(name='Heading2_UA', parent=styles['h2'], fontName=font_name_bold, fontSize=table_font_size+1)) # e.g., 19pt for table headers
+
+    # Table cell paragraph styles - add explicit leading
+    # Inherit regular font from Normal_UA
+    styles.add(ParagraphStyle(name='TableCell', parent=styles['Normal_UA'], fontSize=table_font_size, alignment=1, leading=table_leading))
+    # Use determined bold font
+    styles.add(ParagraphStyle(name='TableCellBold', parent=styles['Normal_UA'], fontName=font_name_bold, fontSize=table_font_size, alignment=1, leading=table_leading))
+    # Inherit regular font from Normal_UA
+    styles.add(ParagraphStyle(name='TableCellLatex', parent=styles['Normal_UA'], fontSize=table_font_size, alignment=1, leading=table_leading))
+    # Inherit regular font from Normal_UA
+    styles.add(ParagraphStyle(name='TableCellLeft', parent=styles['Normal_UA'], fontSize=table_font_size, alignment=0, leading=table_leading))
+    return styles
+
+
+def get_styles(font_name_regular, font_name_bold):
+    """Returns the shared stylesheet for these fonts, creating it on first use.
+
+    Callers must treat it as read-only: it is shared by every document.
+    """
+    key = (font_name_regular, font_name_bold)
+    if key not in _styles:
+        _styles[key] = create_styles(font_name_regular, font_name_bold)
+    return _styles[key]
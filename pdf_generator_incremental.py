@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+
+# Incremental regeneration support. Every document written by `batch` gets a
+# manifest next to it recording how it was built (seed or cohort assignment,
+# source hash, modes) and, per mapped page, the table_key of the table drawn
+# there plus where that table's pages sit in the output. `update` recomputes
+# the keys from the current tasks / PAGE_TASK_MAP and redraws only pages whose
+# key changed (DocumentGenerator.update). Rendered ReportLab tables are also
+# stored by key in an optional on-disk TableCache, so a table shared by many
+# documents - or unchanged since the last run - is laid out once.
+
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_FORMAT = 1
+
+
+class ManifestError(Exception):
+    """A manifest is missing, unreadable or from another manifest format."""
+
+
+def manifest_path(output_pdf_path):
+    return output_pdf_path + MANIFEST_SUFFIX
+
+
+def build_manifest(generator, seed, assignment=None):
+    """Returns the manifest of the document generator.generate()/update() just built.
+
+    assignment is None for seed-selected documents, else the cohort
+    parameters {"count", "seed", "group_size", "exclusive", "index"}.
+    """
+    return {
+        "format": MANIFEST_FORMAT,
+        "seed": seed,
+        "assignment": assignment,
+        "source_sha256": generator.source_sha256,
+        "copy_mode": generator.copy_mode,
+        "table_backend": generator.table_backend,
+        "pages": {str(page_num): info for page_num, info in sorted(generator.last_pages.items())},
+    }
+
+
+def manifest_bytes(manifest):
+    """Serialized manifest, for writing into an output sink."""
+    return json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+def save_manifest(path, manifest):
+    with open(path, 'wb') as f:
+        f.write(manifest_bytes(manifest))
+
+
+def load_manifest(path):
+    """Reads a manifest; pages come back keyed by int page number."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Cannot read manifest {path}: {e}")
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        raise ManifestError(f"{path} is not a format {MANIFEST_FORMAT} manifest")
+    manifest["pages"] = {int(page_num): info for page_num, info in manifest["pages"].items()}
+    return manifest
+
+
+def find_manifests(out_dir):
+    """Returns [(output_pdf_path, manifest_path)] for every manifest in out_dir, sorted by name."""
+    found = []
+    for name in sorted(os.listdir(out_dir)):
+        if name.endswith(MANIFEST_SUFFIX):
+            found.append((os.path.join(out_dir, name[:-len(MANIFEST_SUFFIX)]), os.path.join(out_dir, name)))
+    return found
+
+
+class TableCache:
+    """Rendered tables on disk, one file per table_key.
+
+    Safe to share between worker processes: entries are written to a temp
+    file and renamed into place, and equal keys always hold equal bytes.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".bin")
+
+    def get(self, key):
+        try:
+            with open(self.entry_path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,30 @@
+import importlib.util
+import sys
+
+# PyMuPDF and the ReportLab platypus stack take most of a cold start
+# (~150 ms together) but are only needed once a document is built. Modules
+# bind them with lazy_import() so `--help`, argument errors and the app
+# window never pay for them; the first attribute access (fitz.open,
+# platypus.Table, ...) performs the real import.
+
+
+def lazy_import(name):
+    """Returns module `name`, executed on first attribute access instead of now."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load(module):
+    """Executes a lazy_import() module now instead of on first use, so import errors surface here. Returns it."""
+    vars(module) # Reading __dict__ is an attribute access like any other
+    return module
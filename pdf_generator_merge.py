@@ -0,0 +1,178 @@
+import os
+
+from pdf_generator_lazy import lazy_import
+from pdf_generator_core import PAGE_TASK_MAP, SAVE_DEFLATE, SAVE_GARBAGE, document_bytes
+
+fitz = lazy_import("fitz")  # PyMuPDF
+
+# Merged output for a group of students printed together. Generated
+# documents are taken apart again by page: static source pages (not in
+# PAGE_TASK_MAP) are copied from the one open source document, the table
+# pages (mapped page + continuation pages) from each student's document.
+#
+#   combined - one PDF holding every student's full booklet in seat order.
+#              Static pages are inserted with a shared graft map, so their
+#              contents, fonts and images exist once however many students
+#              the file holds; only the table pages are per student.
+#   sheets   - a common part (the static pages, once per batch) plus one
+#              variants PDF per group holding only each student's table pages.
+#
+# Both carry bookmarks: one top-level entry per student, with the source
+# outline (combined) or one entry per table page (sheets) below it.
+
+MERGE_COMBINED = "combined"
+MERGE_SHEETS = "sheets"
+MERGE_MODES = (MERGE_COMBINED, MERGE_SHEETS)
+COMMON_PART_NAME = "common.pdf"
+
+
+def output_index(pages, page_num):
+    """0-based index of source page page_num in a generated document.
+
+    pages is the generator's last_pages record ({page_num: {"start", "count", ...}}).
+    """
+    if page_num in pages:
+        return pages[page_num]["start"]
+    return page_num - 1 + sum(info["count"] - 1 for p, info in pages.items() if p < page_num)
+
+
+def static_ranges(page_count, mapped_pages):
+    """Returns 0-based inclusive (first, last) runs of source pages not in mapped_pages."""
+    ranges = []
+    first = None
+    for index in range(page_count):
+        if index + 1 in mapped_pages:
+            if first is not None:
+                ranges.append((first, index - 1))
+            first = None
+        elif first is None:
+            first = index
+    if first is not None:
+        ranges.append((first, page_count - 1))
+    return ranges
+
+
+class GroupMerger:
+    """Collects generated documents of one group into a single merged PDF."""
+
+    def __init__(self, source_doc, mode=MERGE_COMBINED, page_task_map=None):
+        if mode not in MERGE_MODES:
+            raise ValueError(f"Unknown merge mode '{mode}', expected one of {', '.join(MERGE_MODES)}")
+        self.source_doc = source_doc
+        self.mode = mode
+        self.page_task_map = PAGE_TASK_MAP if page_task_map is None else page_task_map
+        self.source_toc = [entry for entry in source_doc.get_toc(simple=True) if entry[2] >= 1]
+        self.merged = fitz.open()
+        self.toc = []
+        self.students = 0
+
+    def add(self, label, doc, pages):
+        """Appends one student: doc is their generated document, pages its last_pages record."""
+        student_start = len(self.merged)
+        self.toc.append([1, label, student_start + 1])
+        if self.mode == MERGE_COMBINED:
+            self.add_booklet(doc, pages)
+            self.toc += [[level + 1, title, student_start + output_index(pages, page_num) + 1]
+                         for level, title, page_num in self.source_toc]
+        else:
+            for page_num in sorted(pages):
+                info = pages[page_num]
+                task_key = info["task_key"]
+                self.toc.append([2, f"Page {page_num} ({task_key})", len(self.merged) + 1])
+                self.merged.insert_pdf(doc, from_page=info["start"], to_page=info["start"] + info["count"] - 1)
+        self.students += 1
+
+    def add_booklet(self, doc, pages):
+        """Rebuilds doc page by page: static runs from the shared source, table pages from doc."""
+        static = {first: last for first, last in static_ranges(len(self.source_doc), self.page_task_map)}
+        index = 0
+        while index < len(self.source_doc):
+            if index in static:
+                # final=0 keeps the graft map: objects already copied from the source are reused
+                self.merged.insert_pdf(self.source_doc, from_page=index, to_page=static[index], final=0)
+                index = static[index] + 1
+                continue
+            info = pages.get(index + 1)
+            if info:
+                self.merged.insert_pdf(doc, from_page=info["start"], to_page=info["start"] + info["count"] - 1)
+            else: # Mapped page that was not generated (task key missing): as in the source
+                self.merged.insert_pdf(self.source_doc, from_page=index, to_page=index, final=0)
+            index += 1
+
+    def finish(self):
+        """Returns the merged document with its bookmarks set."""
+        self.merged.set_toc(self.toc)
+        return self.merged
+
+
+def build_common_part(source_doc, page_task_map=None):
+    """Returns the static source pages (not in PAGE_TASK_MAP) as one document.
+
+    Source bookmarks pointing at a table page move to the next static page.
+    """
+    page_task_map = PAGE_TASK_MAP if page_task_map is None else page_task_map
+    common_doc = fitz.open()
+    for first, last in static_ranges(len(source_doc), page_task_map):
+        common_doc.insert_pdf(source_doc, from_page=first, to_page=last, final=0)
+    toc = []
+    for level, title, page_num in source_doc.get_toc(simple=True):
+        if page_num < 1:
+            continue
+        index = page_num - 1 - sum(1 for p in page_task_map if p < page_num)
+        toc.append([level, title, min(index, len(common_doc) - 1) + 1])
+    common_doc.set_toc(toc)
+    return common_doc
+
+
+class MergedOutput:
+    """Feeds generated documents, in seat order, into merged files of group_size students each.
+
+    Files go to an output sink (pdf_generator_sinks): group_<n>.pdf
+    (combined) or common.pdf plus group_<n>_variants.pdf (sheets).
+    """
+
+    def __init__(self, sink, source_doc, mode=MERGE_COMBINED, group_size=0, garbage=SAVE_GARBAGE,
+                 deflate=SAVE_DEFLATE):
+        self.sink = sink
+        self.source_doc = source_doc
+        self.mode = mode
+        self.group_size = group_size # 0: the whole batch in one file
+        self.save_settings = {"garbage": garbage, "deflate": deflate}
+        self.merger = None
+        self.groups = 0
+        if mode == MERGE_SHEETS:
+            self.write_merged(COMMON_PART_NAME, build_common_part(source_doc))
+
+    def group_name(self):
+        return f"group_{self.groups}_variants.pdf" if self.mode == MERGE_SHEETS else f"group_{self.groups}.pdf"
+
+    def add(self, name, pdf, pages):
+        """Adds one generated document (bytes, or the path of a finished file); returns the merged file's name."""
+        if self.merger is None:
+            self.merger = GroupMerger(self.source_doc, self.mode)
+            self.groups += 1
+        doc = fitz.open(pdf) if isinstance(pdf, str) else fitz.open("pdf", pdf)
+        try:
+            self.merger.add(os.path.splitext(name)[0], doc, pages)
+        finally:
+            doc.close()
+        group_name = self.group_name()
+        if self.group_size and self.merger.students == self.group_size:
+            self.flush()
+        return group_name
+
+    def flush(self):
+        """Writes the group being collected, if any."""
+        if self.merger is not None:
+            self.write_merged(self.group_name(), self.merger.finish())
+            self.merger = None
+
+    def write_merged(self, name, merged_doc):
+        try:
+            # Pages come from already cleaned documents: cleaning twice is not lossless (see save_document)
+            self.sink.write(name, document_bytes(merged_doc, clean=False, **self.save_settings))
+        finally:
+            merged_doc.close()
+
+    def close(self):
+        self.flush()
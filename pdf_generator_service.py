@@ -0,0 +1,381 @@
+"""Local HTTP generation service with a warm worker pool (stdlib asyncio only).
+
+Usage:
+    python -m pdf_generator_service --port 8080 --workers 4
+    curl -X POST localhost:8080/generate -d '{"seed": 17, "student_id": "KN-21-05"}' -o variant.pdf
+    curl localhost:8080/metrics
+
+Endpoints:
+    POST /generate  {"seed": int, "student_id": str} -> application/pdf.
+                    Either field may be omitted; without a seed it is derived
+                    from student_id, so a student always gets the same booklet.
+    GET  /metrics   request counters, queue depth and p50/p99 latency (JSON)
+    GET  /health    200 once the worker pool is warm
+
+Every worker process loads tasks, the source PDF, fonts and anchors once at
+startup (before the port opens). Requests for a seed that is already being
+generated share that generation. At most --queue-size distinct documents
+wait for a worker; beyond that the service answers 503 with Retry-After
+instead of queueing without bound. Runs fully offline; binds to 127.0.0.1
+unless --host says otherwise.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import signal
+import sys
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pdf_generator_args import positive_int
+from pdf_generator_core import (
+    TASKS_JSON_PATH, SOURCE_PDF_PATH, ANCHOR_INDEX_PATH, PAGE_MAP_ENV, COPY_MODES, COPY_MODE_CLONE,
+    TABLE_BACKENDS, TABLE_BACKEND_REPORTLAB,
+    DocumentGenerator, PageMapError, configure_page_map, document_bytes, load_tasks,
+)
+
+MAX_BODY_BYTES = 64 * 1024
+REQUEST_TIMEOUT_SECONDS = 10 # For the whole request to arrive; a stalled client must not hold its connection
+LATENCY_WINDOW = 2048 # Requests kept for the percentiles
+RETRY_AFTER_SECONDS = 1
+# Content-Disposition: an ASCII fallback name plus the real one as RFC 5987 filename*
+FILENAME_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]+")
+RFC5987_SAFE = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789!#$&+-.^_`|~")
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 408: "Request Timeout",
+                413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+                503: "Service Unavailable"}
+
+
+# --- Worker processes ---
+_service_generator = None
+
+
+def _init_service_worker(tasks_path, source_pdf_path, copy_mode, anchor_index_path, table_backend):
+    """Process initializer: everything a request needs is loaded here, once."""
+    global _service_generator
+    configure_page_map() # As loaded by main(), which put it in the environment
+    _service_generator = DocumentGenerator(load_tasks(tasks_path), source_pdf_path, copy_mode, anchor_index_path,
+                                           table_backend)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _render(seed):
+    """Generates one document. Returns (pdf_bytes, table_warnings, elapsed)."""
+    start = time.perf_counter()
+    output_doc, table_warnings = _service_generator.generate(seed=seed)
+    try:
+        pdf_bytes = document_bytes(output_doc)
+    finally:
+        output_doc.close()
+    return pdf_bytes, table_warnings, time.perf_counter() - start
+
+
+def student_seed(student_id):
+    """Stable seed for a student id (31 bits, so it fits every seed consumer)."""
+    return int.from_bytes(hashlib.sha256(student_id.encode('utf-8')).digest()[:4], 'big') >> 1
+
+
+def content_disposition(file_name):
+    """attachment header for file_name: a latin-1 safe slug for old clients, UTF-8 filename* for the rest."""
+    fallback = FILENAME_UNSAFE_RE.sub("_", file_name).strip("_") or "variant.pdf"
+    # Percent-encoding by hand: urllib.parse would add its import to every startup
+    encoded = "".join(chr(b) if b in RFC5987_SAFE else f"%{b:02X}" for b in file_name.encode('utf-8'))
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{encoded}"
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+# --- Service ---
+
+class GenerationService:
+    """Coalesces requests per seed and feeds a bounded queue to the worker pool."""
+
+    def __init__(self, executor, workers, queue_size, request_timeout=REQUEST_TIMEOUT_SECONDS):
+        self.executor = executor
+        self.workers = workers
+        self.request_timeout = request_timeout
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.in_flight = {} # seed -> asyncio.Future shared by every request for it
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = dict.fromkeys(("requests", "generated", "coalesced", "rejected", "errors"), 0)
+        self.dispatchers = []
+
+    def start(self):
+        # One dispatcher per worker: a document leaves the queue only when a worker is free for it
+        self.dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            seed, future = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.executor, _render, seed)
+            except Exception as e:
+                self.counters["errors"] += 1
+                if not future.done(): future.set_exception(e)
+            else:
+                self.counters["generated"] += 1
+                if not future.done(): future.set_result(result)
+            finally:
+                self.in_flight.pop(seed, None)
+                self.queue.task_done()
+
+    async def generate(self, seed):
+        """Returns (pdf_bytes, table_warnings, elapsed) for seed; raises HttpError(503) when full."""
+        future = self.in_flight.get(seed)
+        if future is not None:
+            self.counters["coalesced"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                self.queue.put_nowait((seed, future))
+            except asyncio.QueueFull:
+                self.counters["rejected"] += 1
+                raise HttpError(503, f"Queue full ({self.queue.maxsize} documents waiting), retry later",
+                                {"Retry-After": str(RETRY_AFTER_SECONDS)})
+            self.in_flight[seed] = future
+        # shield: a client hanging up must not cancel the generation others wait for
+        return await asyncio.shield(future)
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        return dict(self.counters,
+                    queue_depth=self.queue.qsize(), queue_size=self.queue.maxsize,
+                    in_flight=len(self.in_flight), workers=self.workers,
+                    latency_samples=len(latencies),
+                    p50_ms=None if not latencies else round(percentile(latencies, 0.50) * 1000, 1),
+                    p99_ms=None if not latencies else round(percentile(latencies, 0.99) * 1000, 1))
+
+    # --- HTTP ---
+
+    async def handle_connection(self, reader, writer):
+        start = time.perf_counter()
+        status, headers, body = 500, {}, b""
+        try:
+            try:
+                method, path, request_body = await asyncio.wait_for(read_request(reader), self.request_timeout)
+            except asyncio.TimeoutError:
+                raise HttpError(408, f"Request not received within {self.request_timeout}s")
+            status, headers, body = await self.route(method, path, request_body)
+        except HttpError as e:
+            status, headers = e.status, dict(e.headers)
+            headers["Content-Type"] = "application/json"
+            body = json.dumps({"error": str(e)}).encode('utf-8')
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        except Exception as e:
+            self.counters["errors"] += 1
+            headers = {"Content-Type": "application/json"}
+            body = json.dumps({"error": f"{type(e).__name__}: {e}"}).encode('utf-8')
+        try:
+            try:
+                await write_response(writer, status, headers, body)
+            except ValueError as e: # Headers that cannot be sent (see write_response): nothing was written yet
+                self.counters["errors"] += 1
+                status, headers = 500, {"Content-Type": "application/json"}
+                await write_response(writer, status, headers,
+                                     json.dumps({"error": f"Cannot send response: {e}"}).encode('utf-8'))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+        if status == 200 and headers.get("Content-Type") == "application/pdf":
+            self.latencies.append(time.perf_counter() - start)
+
+    async def route(self, method, path, body):
+        path = path.split('?', 1)[0]
+        if path == "/generate":
+            if method != "POST": raise HttpError(405, "Use POST")
+            return await self.handle_generate(body)
+        if path in ("/metrics", "/health"):
+            if method != "GET": raise HttpError(405, "Use GET")
+            payload = self.metrics() if path == "/metrics" else {"status": "ok"}
+            return 200, {"Content-Type": "application/json"}, json.dumps(payload).encode('utf-8')
+        raise HttpError(404, f"No route for {path}")
+
+    async def handle_generate(self, body):
+        self.counters["requests"] += 1
+        try:
+            request = json.loads(body.decode('utf-8') or "{}")
+        except ValueError as e: # JSONDecodeError, UnicodeDecodeError, or an integer over the digit limit
+            raise HttpError(400, f"Body is not JSON: {e}")
+        if not isinstance(request, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        seed = request.get("seed")
+        student_id = request.get("student_id")
+        if student_id is not None and not isinstance(student_id, str):
+            raise HttpError(400, "student_id must be a string")
+        if student_id and any(unicodedata.category(ch) == "Cc" for ch in student_id):
+            raise HttpError(400, "student_id must not contain control characters")
+        if seed is None:
+            if not student_id: raise HttpError(400, "Give a seed, a student_id or both")
+            seed = student_seed(student_id)
+        elif not isinstance(seed, int) or isinstance(seed, bool):
+            raise HttpError(400, "seed must be an integer")
+        try:
+            pdf_bytes, table_warnings, elapsed = await self.generate(seed)
+        except BrokenProcessPool:
+            raise HttpError(500, "Worker pool is broken; restart the service")
+        return 200, {"Content-Type": "application/pdf",
+                     "Content-Disposition": content_disposition(f"{student_id or 'variant'}_{seed}.pdf"),
+                     "X-Seed": str(seed),
+                     "X-Generation-Ms": f"{elapsed * 1000:.0f}",
+                     "X-Table-Warnings": str(len(table_warnings))}, pdf_bytes
+
+
+async def read_line(reader):
+    """Reads one CRLF-terminated line; a line over the reader's limit is an HttpError(431)."""
+    try:
+        return (await reader.readuntil(b"\r\n")).decode('latin-1').strip()
+    except asyncio.LimitOverrunError:
+        raise HttpError(431, "Request line or header field too long")
+
+
+async def read_request(reader):
+    """Reads one HTTP/1.1 request. Returns (method, path, body).
+
+    A request cut off part way is an HttpError(400); a connection closed
+    before sending anything raises IncompleteReadError (nothing to answer).
+    """
+    try:
+        request_line = await read_line(reader)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            raise
+        raise HttpError(400, "Request line cut off")
+    try:
+        method, path, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HttpError(400, f"Malformed request line {request_line[:80]!r}")
+    content_length = 0
+    while True:
+        try:
+            line = await read_line(reader)
+        except asyncio.IncompleteReadError:
+            raise HttpError(400, "Headers cut off")
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            try: content_length = int(value.strip())
+            except ValueError: raise HttpError(400, "Bad Content-Length")
+    if content_length < 0:
+        raise HttpError(400, "Bad Content-Length")
+    if content_length > MAX_BODY_BYTES:
+        raise HttpError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+    try:
+        body = await reader.readexactly(content_length) if content_length else b""
+    except asyncio.IncompleteReadError as e:
+        raise HttpError(400, f"Body cut off after {len(e.partial)} of {content_length} bytes")
+    return method.upper(), path, body
+
+
+async def write_response(writer, status, headers, body):
+    """Sends one response. Raises ValueError, before writing anything, for headers that cannot be sent."""
+    head = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            f"Content-Length: {len(body)}", "Connection: close"]
+    for name, value in headers.items():
+        if any(ch in f"{name}{value}" for ch in "\r\n"):
+            raise ValueError(f"line break in header {name!r}")
+        head.append(f"{name}: {value}")
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+
+
+async def serve(args):
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_service_worker,
+                                   initargs=(args.tasks, args.source, args.copy_mode, args.anchors,
+                                             args.table_backend))
+    try:
+        # Warm-up: every worker runs its initializer before the port opens
+        warm_start = time.perf_counter()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(executor, _worker_ready) for _ in range(args.workers)))
+        except BrokenProcessPool:
+            print("ERROR: worker processes failed to start; see the errors above.", file=sys.stderr)
+            return 1
+        print(f"{args.workers} worker(s) warm in {time.perf_counter() - warm_start:.2f}s")
+
+        service = GenerationService(executor, args.workers, args.queue_size)
+        service.start()
+        server = await asyncio.start_server(service.handle_connection, args.host, args.port)
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try: loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError: pass # Windows: Ctrl+C still raises KeyboardInterrupt
+        print(f"Serving on http://{args.host}:{args.port} (queue size {args.queue_size})")
+        async with server:
+            await stop.wait()
+        await service.stop()
+        print(f"Stopped. {json.dumps(service.metrics())}")
+        return 0
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pdf_generator_service", description="Local booklet generation service.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: local only).")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=positive_int, default=os.cpu_count() or 1, help="Warm worker processes.")
+    parser.add_argument("--queue-size", type=positive_int, default=None,
+                        help="Documents that may wait for a worker before requests get 503 (default: 4 per worker).")
+    parser.add_argument("--pages", metavar="FILE",
+                        help=f"JSON page map replacing the built-in PAGE_TASK_MAP (also read from ${PAGE_MAP_ENV} "
+                             "or ./pages.json).")
+    parser.add_argument("--tasks", default=TASKS_JSON_PATH, help="Path to tasks.json or a task store from `compile`.")
+    parser.add_argument("--source", default=SOURCE_PDF_PATH, help="Path to the source PDF.")
+    parser.add_argument("--anchors", default=ANCHOR_INDEX_PATH,
+                        help="Anchor index from `pdf_generator_cli analyze`; searched per worker if missing.")
+    parser.add_argument("--copy-mode", choices=COPY_MODES, default=COPY_MODE_CLONE)
+    parser.add_argument("--table-backend", choices=TABLE_BACKENDS, default=TABLE_BACKEND_REPORTLAB)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.queue_size is None:
+        args.queue_size = 4 * args.workers
+    try:
+        page_map_path = configure_page_map(args.pages)
+    except PageMapError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    if page_map_path:
+        os.environ[PAGE_MAP_ENV] = os.path.abspath(page_map_path) # For the worker processes
+        print(f"Using page map {page_map_path}")
+    try:
+        return asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
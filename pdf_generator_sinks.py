@@ -0,0 +1,230 @@
+import io
+import os
+import shutil
+import sys
+import tarfile
+import time
+import zipfile
+
+# Output sinks for finished documents. A sink receives each document as
+# bytes (DocumentGenerator output serialized with document_bytes()) the
+# moment it is done, so a batch holds at most one serialized document per
+# worker in memory, whatever the target:
+#
+#   FileSink      - exactly one document, written to the given .pdf path
+#   DirectorySink - one file per document (the classic batch layout)
+#   ZipSink       - one .zip archive, entries stored (PDFs are already deflated)
+#   TarSink       - one .tar / .tar.gz archive
+#   StdoutSink    - raw PDF for a single document, otherwise a tar stream
+#
+# Extra files (e.g. manifests) go through write_extra(); sinks that cannot
+# hold them next to the document drop them. Documents built on disk
+# (`batch --window`) go through write_file(), which moves or streams the
+# finished file instead of reading it into memory.
+
+
+class OutputSink:
+    """Base class: write(name, data) per document, close() when the batch is done."""
+
+    def write(self, name, data):
+        raise NotImplementedError
+
+    def write_extra(self, name, data):
+        self.write(name, data)
+
+    def write_file(self, name, path):
+        """Like write(), from a finished file; the file is consumed (moved or deleted)."""
+        with open(path, 'rb') as f:
+            self.write(name, f.read())
+        os.remove(path)
+
+    def close(self):
+        pass
+
+    def describe(self, name):
+        """Where write(name, ...) puts a document, for progress output."""
+        return name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class DirectorySink(OutputSink):
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+
+    def describe(self, name):
+        return os.path.join(self.out_dir, name)
+
+    def write(self, name, data):
+        # Temp file + rename: readers never see a half-written booklet
+        # (opened normally rather than with mkstemp, so the file gets the usual umask permissions)
+        path = self.describe(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def write_file(self, name, path):
+        target = self.describe(name)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        try:
+            shutil.move(path, tmp_path) # A rename when both are on one file system
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class FileSink(DirectorySink):
+    """A single document at a fixed path; extras are written next to it."""
+
+    def __init__(self, path):
+        super().__init__(os.path.dirname(path) or ".")
+        self.path = path
+        self.document_name = None
+
+    def describe(self, name):
+        if name == self.document_name or self.document_name is None:
+            return self.path
+        return self.path + name[len(self.document_name):] # Extras keep their suffix
+
+    def write(self, name, data):
+        self.check_name(name)
+        super().write(name, data)
+
+    def write_file(self, name, path):
+        self.check_name(name)
+        super().write_file(name, path)
+
+    def check_name(self, name):
+        if self.document_name is None:
+            self.document_name = name
+        elif name != self.document_name:
+            raise ValueError(f"{self.path} holds a single document; got a second one ({name})")
+
+    def write_extra(self, name, data):
+        if self.document_name is not None and name.startswith(self.document_name):
+            DirectorySink.write(self, name, data)
+
+
+class ZipSink(OutputSink):
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED)
+
+    def describe(self, name):
+        return f"{self.path}:{name}"
+
+    def write(self, name, data):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        self.archive.writestr(info, data)
+
+    def write_file(self, name, path):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        with open(path, 'rb') as source, self.archive.open(info, 'w', force_zip64=True) as entry:
+            shutil.copyfileobj(source, entry)
+        os.remove(path)
+
+    def close(self):
+        self.archive.close()
+
+
+class TarSink(OutputSink):
+    def __init__(self, path=None, fileobj=None, mode='w'):
+        self.path = path or "-"
+        self.archive = tarfile.open(path, mode, fileobj=fileobj)
+
+    def describe(self, name):
+        return f"{self.path}:{name}"
+
+    def write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.archive.addfile(info, io.BytesIO(data))
+
+    def write_file(self, name, path):
+        info = tarfile.TarInfo(name)
+        info.size = os.path.getsize(path)
+        info.mtime = int(time.time())
+        with open(path, 'rb') as f:
+            self.archive.addfile(info, f)
+        os.remove(path)
+
+    def close(self):
+        self.archive.close()
+
+
+class StdoutSink(OutputSink):
+    """Streams to stdout; everything else printed meanwhile goes to stderr.
+
+    File descriptor 1 is pointed at stderr for the sink's lifetime, so
+    progress lines - including those of pool workers - cannot corrupt the
+    stream. One document is written as raw PDF, more as a tar stream.
+    """
+
+    def __init__(self, single_document):
+        sys.stdout.flush()
+        self.saved_fd = os.dup(1)
+        self.stream = os.fdopen(os.dup(1), 'wb')
+        os.dup2(sys.stderr.fileno(), 1)
+        self.tar = None if single_document else TarSink(fileobj=self.stream, mode='w|')
+
+    def describe(self, name):
+        return f"<stdout>:{name}"
+
+    def write(self, name, data):
+        if self.tar:
+            self.tar.write(name, data)
+        else:
+            self.stream.write(data)
+
+    def write_file(self, name, path):
+        if self.tar:
+            self.tar.write_file(name, path)
+            return
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.stream)
+        os.remove(path)
+
+    def write_extra(self, name, data):
+        if self.tar:
+            self.tar.write(name, data)
+
+    def close(self):
+        if self.tar:
+            self.tar.close()
+        self.stream.close()
+        sys.stdout.flush()
+        os.dup2(self.saved_fd, 1)
+        os.close(self.saved_fd)
+
+
+def open_sink(target, document_count):
+    """Picks the sink for an --out value: '-', *.zip, *.tar[.gz|.bz2|.xz], *.tgz, *.pdf or a directory."""
+    lowered = target.lower()
+    if target == "-":
+        return StdoutSink(single_document=document_count == 1)
+    if lowered.endswith(".zip"):
+        return ZipSink(target)
+    for suffix, mode in ((".tar", "w"), (".tar.gz", "w:gz"), (".tgz", "w:gz"), (".tar.bz2", "w:bz2"),
+                         (".tar.xz", "w:xz")):
+        if lowered.endswith(suffix):
+            return TarSink(target, mode=mode)
+    if lowered.endswith(".pdf"):
+        if document_count != 1:
+            raise ValueError(f"--out {target} is a single file; use a directory or archive for {document_count} documents")
+        return FileSink(target)
+    return DirectorySink(target)
@@ -0,0 +1,109 @@
+from collections import namedtuple
+
+from reportlab.lib.units import mm
+
+# Table structure registry. Every structure type a PAGE_TASK_MAP entry can
+# name is declared here once: its headers, column widths, how many pool
+# items one row takes and how a row's items become cells. Everything else -
+# task compilation, how many items a page consumes, table building for both
+# backends - reads it from the registry, so a new type is one
+# register_structure() call.
+#
+# Building a table is one pass: the selected items are padded to
+# rows * items_per_row (missing items become "-") and cut into rows of
+# items_per_row, each formatted by row_cells(number, items).
+
+HEADER_STYLE = 'Heading2_UA'
+MISSING = "-" # Cell text for items a short pool could not supply
+
+# headers:        header row texts
+# col_widths:     column widths in points
+# items_per_row:  pool items one row (one variant) takes
+# fields:         markup fields per compiled task record (2 for "x / y" pairs)
+# row_cells:      f(number, items) -> [(text, style name), ...]; items is a tuple
+#                 of items_per_row records, None where the pool ran short
+# style_commands: extra TableStyle commands for the body
+# parse_text:     optional f(raw string) -> field text, applied when compiling tasks
+TableStructure = namedtuple("TableStructure", [
+    "headers", "col_widths", "items_per_row", "fields", "row_cells", "style_commands", "parse_text",
+])
+
+STRUCTURES = {}
+
+
+def register_structure(name, headers, col_widths, row_cells, items_per_row=1, fields=1, style_commands=(),
+                       parse_text=None):
+    """Registers (or replaces) a table structure type. Returns the TableStructure."""
+    if len(headers) != len(col_widths):
+        raise ValueError(f"Structure '{name}': {len(headers)} header(s) but {len(col_widths)} column width(s)")
+    structure = TableStructure(tuple(headers), tuple(col_widths), items_per_row, fields, row_cells,
+                               tuple(style_commands), parse_text)
+    STRUCTURES[name] = structure
+    return structure
+
+
+def get_structure(name):
+    """Returns the registered TableStructure for a type name, or None."""
+    return STRUCTURES.get(name)
+
+
+def field(item, index=0):
+    """Field `index` of a record, or the placeholder for a missing item."""
+    return MISSING if item is None else item[index]
+
+
+def table_rows(structure, row_count, selected_tasks):
+    """Returns the body rows [(text, style name), ...] for row_count variants."""
+    per_row = structure.items_per_row
+    items = list(selected_tasks[:row_count * per_row])
+    items += [None] * (row_count * per_row - len(items))
+    return [structure.row_cells(number, tuple(items[start:start + per_row]))
+            for number, start in enumerate(range(0, len(items), per_row), 1)]
+
+
+# --- Built-in structures ---
+
+def object_names_row(number, items):
+    return [(str(number), 'TableCellBold')] + [(field(item), 'TableCell') for item in items]
+
+
+def function_pair_row(number, items):
+    (item,) = items
+    text = MISSING if item is None else f"{item[0]}<br/>{item[1]}"
+    return [(str(number), 'TableCellBold'), (text, 'TableCellLeft')]
+
+
+def pair_description_row(number, items):
+    (item,) = items
+    return [(str(number), 'TableCellBold'), (field(item, 0), 'TableCellLeft'), (field(item, 1), 'TableCellLeft')]
+
+
+def profession_pairs_row(number, items):
+    # Both columns are numbered by variant: variant n takes profession 1 and profession 2 of row n
+    first, second = items
+    return [(str(number), 'TableCellBold'), (field(first), 'TableCellLeft'),
+            (str(number), 'TableCellBold'), (field(second), 'TableCellLeft')]
+
+
+def description_row(number, items):
+    (item,) = items
+    return [(str(number), 'TableCellBold'), (field(item), 'TableCellLeft')]
+
+
+def object_name(text):
+    """"... Об'єкт <name> за допомогою ..." -> "<name>"; bare names pass through."""
+    return text.split("Об'єкт ")[-1].split(" за допомогою")[0]
+
+
+register_structure('3_objects', ["No.", "Об'єкт 1", "Об'єкт 2", "Об'єкт 3"], [15*mm, 51*mm, 52*mm, 52*mm],
+                   object_names_row, items_per_row=3, parse_text=object_name)
+register_structure('function_pair', ['No.', 'Функції x(t) та y(t)'], [15*mm, 150*mm],
+                   function_pair_row, fields=2,
+                   style_commands=[('ALIGN', (1, 1), (1, -1), 'LEFT'), ('VALIGN', (1, 1), (1, -1), 'TOP')])
+register_structure('pair_description', ["No.", "Параметр", "Опис"], [15*mm, 70*mm, 85*mm],
+                   pair_description_row, fields=2, style_commands=[('ALIGN', (1, 1), (-1, -1), 'LEFT')])
+register_structure('profession_pairs', ["No.", "Професія 1", "No.", "Професія 2"], [15*mm, 70*mm, 15*mm, 70*mm],
+                   profession_pairs_row, items_per_row=2,
+                   style_commands=[('ALIGN', (1, 1), (1, -1), 'LEFT'), ('ALIGN', (3, 1), (3, -1), 'LEFT')])
+register_structure('description', ['No.', 'Завдання'], [15*mm, 150*mm],
+                   description_row, style_commands=[('ALIGN', (1, 1), (1, -1), 'LEFT')])
@@ -0,0 +1,169 @@
+import html
+import json
+import re
+from bisect import bisect
+
+from pdf_generator_core import PAGE_TASK_MAP, TABLE_TOP_MARGIN, items_needed
+from pdf_generator_lazy import lazy_import
+from pdf_generator_structures import get_structure, table_rows
+
+fitz = lazy_import("fitz")  # PyMuPDF
+
+# Output verification. A generated document is reopened and only its table
+# pages are read back: the words inside the table frame (the area
+# draw_table may fill, see DocumentGenerator.table_frame) are sorted into
+# the cells of the drawn grid, and the cell each field of each selected
+# task record was drawn in must be there with exactly that text. A field
+# that only occurs inside some longer cell ("x" in "x^2") does not count.
+# Whitespace is ignored, so line breaks and split long words do not
+# matter. A cell found on the page but outside the frame (or past the page
+# edge) counts as clipped.
+#
+# Besides missing/clipped items a page reports problems: no items selected
+# (task key missing from the tasks), a table that was not drawn (drawing
+# failed, see the generate() warnings), a pool that ran short ("-"
+# placeholder cells) and error cells ("Error: Unhandled Table Type").
+
+VERIFY_FORMAT = 1
+ERROR_CELL_TEXT = "Error:"
+
+_BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+GRID_TOLERANCE = 0.5 # Points a grid line may lean and still count as horizontal/vertical
+
+
+def plain(text):
+    """Cell markup or extracted text reduced to what can be compared: unescaped, without whitespace."""
+    return "".join(html.unescape(_BR_RE.sub(" ", text)).split())
+
+
+def grid_lines(page):
+    """Returns the sorted x positions of the page's vertical lines and y positions of its horizontal ones."""
+    xs, ys = set(), set()
+    for path in page.get_drawings():
+        for item in path["items"]:
+            if item[0] != "l":
+                continue
+            start, end = item[1], item[2]
+            if abs(start.x - end.x) <= GRID_TOLERANCE:
+                xs.add(start.x)
+            elif abs(start.y - end.y) <= GRID_TOLERANCE:
+                ys.add(start.y)
+    return sorted(xs), sorted(ys)
+
+
+def page_cells(page, clip=None):
+    """plain() text of every grid cell on page holding words, inside clip or (None) anywhere."""
+    xs, ys = grid_lines(page)
+    if clip is None:
+        words = page.get_text("words", flags=fitz.TEXTFLAGS_WORDS & ~fitz.TEXT_MEDIABOX_CLIP)
+    else:
+        words = page.get_text("words", clip=clip)
+    cells = {}
+    for x0, y0, x1, y1, word, *_ in words:
+        cells.setdefault((bisect(ys, (y0 + y1) / 2), bisect(xs, (x0 + x1) / 2)), []).append(word)
+    return [plain("".join(cell_words)) for cell_words in cells.values()]
+
+
+def table_cells(generator, doc, page_num, info, clip=True):
+    """Cell texts (plain()) of a table's pages in doc, inside the table frames or (clip=False) anywhere."""
+    cells = []
+    for page_index in range(info["start"], info["start"] + info["count"]):
+        page = doc[page_index]
+        frame = None
+        if clip:
+            top = generator.anchors[page_num].insert_y if page_index == info["start"] else TABLE_TOP_MARGIN
+            frame = generator.table_frame(page, top)
+        cells += page_cells(page, frame)
+    return set(cells)
+
+
+def field_cells(structure_info, needed_count, selected_tasks):
+    """Returns [(field, plain() text of the cell it is drawn in)] for every field of selected_tasks.
+
+    Most cells hold one field; a function_pair cell holds both of its
+    record's fields, one per line.
+    """
+    structure = get_structure(structure_info.get('type'))
+    rows = table_rows(structure, needed_count, selected_tasks) if structure else []
+    per_row = structure.items_per_row if structure else 1
+    pairs = []
+    for index, record in enumerate(selected_tasks):
+        row = rows[index // per_row] if index // per_row < len(rows) else []
+        for field in record:
+            cell = next((text for text, style in row if style != 'TableCellBold' and field in _BR_RE.split(text)),
+                        field)
+            pairs.append((field, plain(cell)))
+    return pairs
+
+
+def verify_page(generator, doc, page_num, info, selected_tasks):
+    """Checks one mapped page. Returns its report entry."""
+    task_key, needed_count, structure_info, _ = PAGE_TASK_MAP[page_num]
+    selected_tasks = selected_tasks or []
+    report = {"page": page_num, "task_key": task_key, "items": len(selected_tasks), "missing": [], "clipped": [],
+              "placeholders": max(0, items_needed(needed_count, structure_info) - len(selected_tasks)),
+              "problems": []}
+    if not selected_tasks:
+        report["problems"].append("no items selected")
+        return report
+    if info is None or info.get("table_key") is None:
+        report["problems"].append("table not drawn")
+        return report
+    if report["placeholders"]:
+        report["problems"].append(f"pool ran short: {report['placeholders']} placeholder cell(s)")
+
+    cells = table_cells(generator, doc, page_num, info)
+    if any(plain(ERROR_CELL_TEXT) in cell for cell in cells):
+        report["problems"].append("error cell in table")
+    not_found = [(field, cell) for field, cell in field_cells(structure_info, needed_count, selected_tasks)
+                 if cell not in cells]
+    if not_found:
+        # Only now read the pages again without the frame: found there means clipped
+        page_cells_anywhere = table_cells(generator, doc, page_num, info, clip=False)
+        for field, cell in not_found:
+            report["clipped" if cell in page_cells_anywhere else "missing"].append(html.unescape(field))
+    return report
+
+
+def verify_document(generator, doc, selected_tasks_for_pages=None, pages=None):
+    """Checks every mapped page of doc, a document generator just built (or one built the same way).
+
+    selected_tasks_for_pages and pages default to the generator's
+    last_selection and last_pages. Returns {"ok", "pages": [page report, ...]}.
+    """
+    selection = generator.last_selection if selected_tasks_for_pages is None else selected_tasks_for_pages
+    pages = generator.last_pages if pages is None else pages
+    page_reports = [verify_page(generator, doc, page_num, pages.get(page_num), selection.get(page_num))
+                    for page_num in sorted(PAGE_TASK_MAP)]
+    return {"ok": all(page_ok(report) for report in page_reports), "pages": page_reports}
+
+
+def page_ok(report):
+    return not (report["missing"] or report["clipped"] or report["problems"])
+
+
+def describe_failures(document_report):
+    """One line per failed page of a verify_document() report, for console output."""
+    lines = []
+    for report in document_report["pages"]:
+        if page_ok(report):
+            continue
+        details = list(report["problems"])
+        if report["missing"]:
+            details.append(f"{len(report['missing'])} item(s) missing")
+        if report["clipped"]:
+            details.append(f"{len(report['clipped'])} item(s) clipped")
+        lines.append(f"page {report['page']} ({report['task_key']}): {', '.join(details)}")
+    return lines
+
+
+def build_report(document_reports):
+    """Batch report: verify_document() results, each with its "document" name (and "seed")."""
+    failed = [report["document"] for report in document_reports if not report["ok"]]
+    return {"format": VERIFY_FORMAT, "documents": len(document_reports), "failed": failed,
+            "reports": document_reports}
+
+
+def save_report(path, report):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
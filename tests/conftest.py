@@ -0,0 +1,83 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The pdf_generator_* modules sit flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from pdf_generator_core import PAGE_TASK_MAP, DocumentGenerator, compile_tasks, use_page_task_map
+
+# A four-page stand-in for the manual: tests that build documents use it
+# instead of the real source, with a page map of two tables. The second
+# identifier sits near the bottom of its page, so that table always runs
+# onto continuation pages.
+FIRST_IDENTIFIER = "Table 1.1 - Variants of the first task"
+SECOND_IDENTIFIER = "Table 2.1 - Variants of the second task"
+SYNTHETIC_PAGE_MAP = {
+    2: ("FIRST", 4, {"type": "description"}, FIRST_IDENTIFIER),
+    4: ("SECOND", 12, {"type": "description"}, SECOND_IDENTIFIER),
+}
+SYNTHETIC_TASKS = {
+    "FIRST": [f"First task, variant {i}" for i in range(10)],
+    "SECOND": [f"Second task, variant {i} with a longer description" for i in range(30)],
+}
+
+
+def build_source_pdf(path):
+    doc = fitz.open()
+    for number in range(1, 5):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((72, 72), f"Synthetic manual, page {number}", fontsize=11)
+    doc[1].insert_text((72, 120), FIRST_IDENTIFIER, fontsize=11)
+    doc[3].insert_text((72, 700), SECOND_IDENTIFIER, fontsize=11)
+    doc.set_toc([[1, "Part one", 1], [1, "Part two", 3]])
+    doc.save(path)
+    doc.close()
+
+
+def write_inputs(directory):
+    """Writes tasks.json and pages.json (SYNTHETIC_PAGE_MAP) into directory. Returns their paths."""
+    tasks_path, pages_path = os.path.join(directory, "tasks.json"), os.path.join(directory, "pages.json")
+    pages = {str(page_num): {"task_key": task_key, "count": count, "structure": structure["type"],
+                             "identifier": identifier}
+             for page_num, (task_key, count, structure, identifier) in SYNTHETIC_PAGE_MAP.items()}
+    for path, data in ((tasks_path, SYNTHETIC_TASKS), (pages_path, {"pages": pages})):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    return tasks_path, pages_path
+
+
+@pytest.fixture
+def page_map():
+    """Swaps SYNTHETIC_PAGE_MAP in as PAGE_TASK_MAP for one test."""
+    saved = dict(PAGE_TASK_MAP)
+    use_page_task_map(SYNTHETIC_PAGE_MAP)
+    yield SYNTHETIC_PAGE_MAP
+    use_page_task_map(saved)
+
+
+@pytest.fixture
+def source_pdf(tmp_path, page_map):
+    path = str(tmp_path / "source.pdf")
+    build_source_pdf(path)
+    return path
+
+
+@pytest.fixture
+def make_generator(source_pdf):
+    """Factory for DocumentGenerators over the synthetic source; closed after the test."""
+    generators = []
+
+    def make(tasks=None, **options):
+        options.setdefault("anchor_index_path", None)
+        generator = DocumentGenerator(compile_tasks(tasks or SYNTHETIC_TASKS), source_pdf, **options)
+        generators.append(generator)
+        return generator
+
+    yield make
+    for generator in generators:
+        generator.close()
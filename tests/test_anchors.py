@@ -0,0 +1,110 @@
+"""Anchor index: built once, refused when it no longer matches the source or the page map."""
+import json
+
+import pytest
+
+from conftest import FIRST_IDENTIFIER, SECOND_IDENTIFIER
+from pdf_generator_core import (
+    TABLE_TOP_MARGIN, AnchorIndexError, analyze_anchors, load_anchor_index, save_anchor_index, source_sha256,
+    use_page_task_map,
+)
+
+import fitz  # PyMuPDF
+
+
+@pytest.fixture
+def index(source_pdf, tmp_path):
+    """(index path, source hash) of a fresh index of the synthetic source."""
+    with open(source_pdf, 'rb') as f:
+        sha256 = source_sha256(f.read())
+    doc = fitz.open(source_pdf)
+    try:
+        anchors = analyze_anchors(doc)
+    finally:
+        doc.close()
+    path = str(tmp_path / "anchors.json")
+    save_anchor_index(path, sha256, anchors)
+    return path, sha256
+
+
+def test_analyze_finds_every_identifier(source_pdf):
+    doc = fitz.open(source_pdf)
+    try:
+        anchors = analyze_anchors(doc)
+    finally:
+        doc.close()
+    assert sorted(anchors) == [2, 4]
+    assert anchors[2].identifier == FIRST_IDENTIFIER and anchors[2].anchor_page == 2
+    assert anchors[2].insert_y > anchors[2].rect.y1 > 100
+
+
+def test_identifier_on_the_previous_page_anchors_at_the_top(page_map, source_pdf):
+    use_page_task_map({3: ("FIRST", 4, {"type": "description"}, FIRST_IDENTIFIER)})
+    doc = fitz.open(source_pdf)
+    try:
+        anchor = analyze_anchors(doc)[3]
+    finally:
+        doc.close()
+    assert (anchor.anchor_page, anchor.insert_y) == (2, TABLE_TOP_MARGIN)
+
+
+def test_missing_identifiers_are_all_listed(page_map, source_pdf):
+    use_page_task_map({2: ("FIRST", 4, {"type": "description"}, "No such table"),
+                       9: ("SECOND", 4, {"type": "description"}, SECOND_IDENTIFIER)})
+    doc = fitz.open(source_pdf)
+    try:
+        with pytest.raises(AnchorIndexError) as error:
+            analyze_anchors(doc)
+    finally:
+        doc.close()
+    assert "page 2 (FIRST)" in str(error.value) and "page 9 (SECOND)" in str(error.value)
+
+
+def test_index_round_trips(index, source_pdf):
+    path, sha256 = index
+    doc = fitz.open(source_pdf)
+    try:
+        assert load_anchor_index(path, sha256) == analyze_anchors(doc)
+    finally:
+        doc.close()
+
+
+def test_index_of_another_source_is_stale(index):
+    path, _ = index
+    with pytest.raises(AnchorIndexError, match="different source PDF"):
+        load_anchor_index(path, "0" * 64)
+
+
+def test_index_of_another_page_map_is_stale(page_map, index):
+    path, sha256 = index
+    use_page_task_map({**page_map, 2: ("FIRST", 4, {"type": "description"}, "Table 1.1 - Renamed")})
+    with pytest.raises(AnchorIndexError, match=r"page 2 \(FIRST\)"):
+        load_anchor_index(path, sha256)
+    use_page_task_map({**page_map, 3: ("FIRST", 4, {"type": "description"}, FIRST_IDENTIFIER)})
+    with pytest.raises(AnchorIndexError, match=r"page 3 \(FIRST\)"):
+        load_anchor_index(path, sha256)
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda text: text[:len(text) // 2], # Truncated
+    lambda text: "not json",
+    lambda text: "[]",
+    lambda text: '{"anchors": []}',
+    lambda text: text.replace('"insert_y"', '"insert_at"'),
+    lambda text: text.replace('"rect": [', '"rect": [[], '),
+])
+def test_malformed_index_raises_anchor_index_error(index, corrupt):
+    path, sha256 = index
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(corrupt(text))
+    with pytest.raises(AnchorIndexError, match="analyze"):
+        load_anchor_index(path, sha256)
+
+
+def test_saved_index_is_plain_json(index):
+    path, sha256 = index
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    assert data["source_sha256"] == sha256 and sorted(data["anchors"]) == ["2", "4"]
@@ -0,0 +1,113 @@
+"""Cohort assignment (pdf_generator_assign): every PoolReport guarantee, recounted from the selections."""
+from itertools import combinations
+
+import pytest
+
+from pdf_generator_assign import assign_tasks
+
+# Pages 2 and 3 share pool "B" (consecutive slices); "P" is a pair structure
+PAGE_MAP = {
+    1: ("A", 5, {"type": "description"}, "Table A"),
+    2: ("B", 3, {"type": "description"}, "Table B.1"),
+    3: ("B", 2, {"type": "description"}, "Table B.2"),
+    4: ("P", 2, {"type": "function_pair"}, "Table P"),
+}
+
+
+def pool(prefix, size):
+    return [f"{prefix}{i}" for i in range(size)]
+
+
+def pool_items(selection, task_key, page_map=PAGE_MAP):
+    """The items one seat got from task_key's pool, over every page using it."""
+    return [item for page_num, (key, *_) in page_map.items() if key == task_key for item in selection[page_num]]
+
+
+def report_for(reports, task_key):
+    return next(r for r in reports if r.task_key == task_key)
+
+
+@pytest.mark.parametrize("pool_size, group_size", [(10, 2), (12, 2), (25, 5), (40, 4)])
+def test_exclusive_groups_never_share_items_when_feasible(pool_size, group_size):
+    tasks = {"A": pool("a", pool_size)}
+    selections, reports = assign_tasks(tasks, 20, seed=3, group_size=group_size, exclusive_keys=("A",),
+                                       page_task_map=PAGE_MAP)
+    report = report_for(reports, "A")
+    assert group_size * report.demand <= pool_size
+    assert report.group_conflicts == 0
+    for start in range(0, len(selections), group_size):
+        group = [set(pool_items(s, "A")) for s in selections[start:start + group_size]]
+        for first, second in combinations(group, 2):
+            assert not first & second
+
+
+def test_exclusive_conflicts_are_counted_when_infeasible():
+    tasks = {"A": pool("a", 8)}
+    _, reports = assign_tasks(tasks, 6, seed=1, group_size=3, exclusive_keys=("A",), page_task_map=PAGE_MAP)
+    assert report_for(reports, "A").group_conflicts > 0
+
+
+@pytest.mark.parametrize("pool_size", [5, 6, 7, 9, 10, 30])
+def test_neighbour_overlap_meets_its_bound(pool_size):
+    tasks = {"A": pool("a", pool_size)}
+    selections, reports = assign_tasks(tasks, 15, seed=7, page_task_map=PAGE_MAP)
+    report = report_for(reports, "A")
+    assert report.neighbour_overlap_bound == max(0, 2 * report.demand - pool_size)
+    assert report.max_neighbour_overlap == report.neighbour_overlap_bound
+    overlaps = [len(set(pool_items(a, "A")) & set(pool_items(b, "A"))) for a, b in zip(selections, selections[1:])]
+    assert max(overlaps) == report.max_neighbour_overlap
+
+
+@pytest.mark.parametrize("pool_size, documents", [(7, 10), (12, 9), (50, 31), (100, 3)])
+def test_usage_spread_is_at_most_one(pool_size, documents):
+    tasks = {"A": pool("a", pool_size), "B": pool("b", pool_size)}
+    selections, reports = assign_tasks(tasks, documents, seed=11, page_task_map=PAGE_MAP)
+    for task_key in tasks:
+        report = report_for(reports, task_key)
+        assert report.max_usage - report.min_usage <= 1
+        assert report.min_usage <= report.ideal_usage <= report.max_usage
+        usage = {item: 0 for item in tasks[task_key]}
+        for selection in selections:
+            for item in pool_items(selection, task_key):
+                usage[item] += 1
+        assert (min(usage.values()), max(usage.values())) == (report.min_usage, report.max_usage)
+
+
+def test_items_are_unique_within_a_document_and_pages_slice_the_pool():
+    tasks = {"A": pool("a", 9), "B": pool("b", 9)}
+    selections, _ = assign_tasks(tasks, 8, seed=5, page_task_map=PAGE_MAP)
+    for selection in selections:
+        assert len(selection[2]) == 3 and len(selection[3]) == 2
+        for task_key in tasks:
+            items = pool_items(selection, task_key)
+            assert len(items) == len(set(items))
+
+
+def test_small_pool_reports_a_shortfall():
+    selections, reports = assign_tasks({"A": pool("a", 3)}, 4, page_task_map=PAGE_MAP)
+    assert report_for(reports, "A").shortfall == 2
+    assert all(sorted(s[1]) == pool("a", 3) for s in selections)
+
+
+def test_missing_task_keys_select_nothing():
+    selections, reports = assign_tasks({"A": pool("a", 10)}, 2, page_task_map=PAGE_MAP)
+    assert [r.task_key for r in reports] == ["A"]
+    assert all(s[2] == [] and s[4] == [] for s in selections)
+
+
+def test_assignment_depends_only_on_the_seed():
+    tasks = {"A": pool("a", 20), "B": pool("b", 15)}
+    arguments = dict(group_size=3, exclusive_keys=("A",), page_task_map=PAGE_MAP)
+    first = assign_tasks(tasks, 12, seed=42, **arguments)
+    assert assign_tasks(tasks, 12, seed=42, **arguments) == first
+    assert assign_tasks(tasks, 12, seed=43, **arguments)[0] != first[0]
+
+
+@pytest.mark.parametrize("arguments, message", [
+    (dict(num_documents=0), "num_documents"),
+    (dict(num_documents=2, group_size=0), "group_size"),
+    (dict(num_documents=2, exclusive_keys=("NOPE",)), "NOPE"),
+])
+def test_assignment_rejects_bad_arguments(arguments, message):
+    with pytest.raises(ValueError, match=message):
+        assign_tasks({"A": pool("a", 10)}, page_task_map=PAGE_MAP, **arguments)
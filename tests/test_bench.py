@@ -0,0 +1,31 @@
+"""Benchmark command line: counts that would leave nothing to measure are usage errors."""
+import pytest
+
+from pdf_generator_bench import build_parser, main
+from pdf_generator_core import PAGE_MAP_ENV
+
+
+@pytest.mark.parametrize("argv", [["tables", "--count", "0"], ["pipeline", "--count", "0"],
+                                  ["pipeline", "--count", "-1"], ["startup", "--repeat", "0"]])
+def test_empty_runs_are_usage_errors(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args(argv)
+    assert exit_info.value.code == 2
+    assert argv[1] in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("value", ["-0.1", "nan"])
+def test_bad_tolerance_is_a_usage_error(value, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args(["pipeline", "--tolerance", value])
+    assert exit_info.value.code == 2
+    assert "--tolerance" in capsys.readouterr().err
+
+
+def test_bad_page_map_is_reported_on_stderr(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "pages.json"
+    path.write_text("not json", encoding='utf-8')
+    monkeypatch.setenv(PAGE_MAP_ENV, str(path))
+    assert main(["tables", "--count", "1"]) == 1
+    out, err = capsys.readouterr()
+    assert out == "" and err.startswith("ERROR: Cannot read page map")
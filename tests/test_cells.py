@@ -0,0 +1,72 @@
+"""Cell layout cache: least recently used entries go first, limits are honoured, 0 turns it off."""
+import pytest
+
+from pdf_generator_cells import LINES_BASE_BYTES, LINES_CHAR_BYTES, CellLayout, CellLayoutCache, layout_size
+from pdf_generator_cli import build_parser
+
+LAYOUT = CellLayout(None, [("text", 10.0)], 12.0)
+
+
+def key(text):
+    return ("direct", text, "Cell", 100.0)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = CellLayoutCache(max_entries=2)
+    cache.put(key("a"), LAYOUT)
+    cache.put(key("b"), LAYOUT)
+    assert cache.get(key("a")) is LAYOUT # "b" is now the oldest
+    cache.put(key("c"), LAYOUT)
+    assert cache.get(key("b")) is None
+    assert cache.get(key("a")) is LAYOUT and cache.get(key("c")) is LAYOUT
+    assert cache.stats() == {"hits": 3, "misses": 1, "evictions": 1, "entries": 2,
+                             "bytes": 2 * layout_size(key("a"), LAYOUT)}
+
+
+def test_replacing_an_entry_keeps_the_byte_count():
+    cache = CellLayoutCache(max_entries=2)
+    cache.put(key("a"), LAYOUT)
+    cache.put(key("a"), LAYOUT)
+    assert (len(cache), cache.bytes, cache.evictions) == (1, layout_size(key("a"), LAYOUT), 0)
+
+
+def test_byte_limit_evicts_but_keeps_the_newest_entry():
+    entry_bytes = LINES_BASE_BYTES + LINES_CHAR_BYTES * len("aaaa")
+    cache = CellLayoutCache(max_entries=100, max_bytes=2 * entry_bytes)
+    for text in ("aaaa", "bbbb", "cccc"):
+        cache.put(key(text), LAYOUT)
+    assert (len(cache), cache.bytes, cache.evictions) == (2, 2 * entry_bytes, 1)
+    assert cache.get(key("aaaa")) is None
+    huge = "x" * 10000 # Larger than the whole limit on its own
+    cache.put(key(huge), LAYOUT)
+    assert len(cache) == 1 and cache.get(key(huge)) is LAYOUT
+
+
+@pytest.mark.parametrize("max_entries", [0, -3])
+def test_zero_or_negative_size_disables_the_cache(max_entries):
+    cache = CellLayoutCache(max_entries=max_entries)
+    cache.put(key("a"), LAYOUT)
+    assert cache.get(key("a")) is None
+    assert cache.stats() == {"hits": 0, "misses": 1, "evictions": 0, "entries": 0, "bytes": 0}
+
+
+def test_negative_byte_limit_means_no_byte_limit():
+    cache = CellLayoutCache(max_entries=10, max_bytes=-1)
+    for text in "abc":
+        cache.put(key(text), LAYOUT)
+    assert (len(cache), cache.evictions) == (3, 0)
+
+
+def test_negative_cell_cache_is_a_usage_error(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args(["batch", "--cell-cache", "-3"])
+    assert exit_info.value.code == 2
+    assert "--cell-cache" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("value", ["-1", "nan", "inf", "lots"])
+def test_bad_cell_cache_mb_is_a_usage_error(value, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args(["batch", "--cell-cache-mb", value])
+    assert exit_info.value.code == 2
+    assert "--cell-cache-mb" in capsys.readouterr().err
@@ -0,0 +1,54 @@
+"""Command line: batch and update over the synthetic source, and missing inputs reported without a traceback."""
+import os
+import re
+
+import pytest
+
+from conftest import write_inputs
+from pdf_generator_cli import main
+from pdf_generator_core import PAGE_MAP_ENV
+from pdf_generator_incremental import MANIFEST_SUFFIX
+
+
+@pytest.fixture
+def inputs(tmp_path, source_pdf, monkeypatch):
+    """Files for a run in tmp_path: tasks.json, pages.json for the synthetic map and the source."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(PAGE_MAP_ENV, "") # main() sets it for the workers; restored afterwards
+    write_inputs(str(tmp_path))
+    return ["--pages", "pages.json"], ["--tasks", "tasks.json", "--source", source_pdf, "--anchors", "anchors.json"]
+
+
+def test_batch_writes_documents_and_manifests(inputs, tmp_path):
+    pages, files = inputs
+    assert main(pages + ["batch", "--count", "2", "--out", "out", "--seed-base", "5"] + files) == 0
+    assert sorted(os.listdir(tmp_path / "out")) == [
+        "variant_5.pdf", "variant_5.pdf" + MANIFEST_SUFFIX, "variant_6.pdf", "variant_6.pdf" + MANIFEST_SUFFIX,
+    ]
+    assert main(pages + ["update", "--out", "out"] + files) == 0
+
+
+@pytest.mark.parametrize("argv", [
+    ["batch", "--count", "1", "--out", "out", "--tasks", "missing.json"],
+    ["batch", "--count", "1", "--out", "out", "--source", "missing.pdf"],
+    ["batch", "--count", "2", "--out", "out", "--workers", "2", "--source", "missing.pdf"],
+    ["batch", "--count", "2", "--out", "out", "--workers", "2", "--tasks", "missing.json"],
+    ["compile", "--tasks", "missing.json"],
+    ["analyze", "--source", "missing.pdf"],
+    ["update", "--out", "nowhere/"],
+], ids=["batch-tasks", "batch-source", "workers-source", "workers-tasks", "compile", "analyze", "update"])
+def test_missing_input_is_an_error_message(inputs, capsys, argv):
+    pages, files = inputs
+    # The options given last win: only the one input named in argv is missing
+    command, options = argv[0], argv[1:]
+    defaults = files if command in ("batch", "update") else []
+    assert main(pages + [command] + defaults + options) == 1
+    assert re.search(r"^ERROR: .*(missing|nowhere)", capsys.readouterr().err, re.MULTILINE)
+
+
+@pytest.mark.parametrize("pattern", ["{seed", "{name}.pdf", "sub/{seed}.pdf"])
+def test_bad_name_pattern_is_an_error_message(inputs, tmp_path, capsys, pattern):
+    pages, files = inputs
+    assert main(pages + ["batch", "--count", "1", "--out", "out", "--name-pattern", pattern] + files) == 1
+    assert "ERROR: Bad --name-pattern" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
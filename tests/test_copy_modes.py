@@ -0,0 +1,32 @@
+"""Copy modes: editing a clone of the source and rendering every page anew give the same document text."""
+import pytest
+
+import fitz  # PyMuPDF
+
+from pdf_generator_core import COPY_MODE_CLONE, COPY_MODE_RENDER, TABLE_BACKENDS, document_bytes
+
+SEED = 11
+
+
+def build(generator):
+    """Page texts of the generated document, saved and reopened."""
+    output_doc, warnings = generator.generate(seed=SEED)
+    assert warnings == []
+    doc = fitz.open("pdf", document_bytes(output_doc))
+    output_doc.close()
+    try:
+        return [page.get_text() for page in doc]
+    finally:
+        doc.close()
+
+
+@pytest.mark.parametrize("table_backend", TABLE_BACKENDS)
+def test_clone_and_render_give_the_same_text(make_generator, table_backend):
+    clone = make_generator(copy_mode=COPY_MODE_CLONE, table_backend=table_backend)
+    render = make_generator(copy_mode=COPY_MODE_RENDER, table_backend=table_backend)
+    clone_texts, render_texts = build(clone), build(render)
+    assert clone_texts == render_texts
+    assert clone.last_pages == render.last_pages
+    assert clone.last_selection == render.last_selection
+    # The tables are there, continuation pages included
+    assert len(clone_texts) > 4 and "Second task, variant" in clone_texts[-1]
@@ -0,0 +1,128 @@
+"""Merged output: pages and bookmarks land at the right offsets for every student."""
+import pytest
+
+import fitz  # PyMuPDF
+
+from pdf_generator_cli import build_parser
+from pdf_generator_core import document_bytes
+from pdf_generator_merge import (
+    COMMON_PART_NAME, MERGE_COMBINED, MERGE_SHEETS, MergedOutput, output_index, static_ranges,
+)
+from pdf_generator_sinks import DirectorySink
+
+SEEDS = (1, 2, 3)
+
+
+def test_static_ranges():
+    assert static_ranges(6, {2: None, 4: None}) == [(0, 0), (2, 2), (4, 5)]
+    assert static_ranges(3, {1: None, 2: None, 3: None}) == []
+    assert static_ranges(3, {}) == [(0, 2)]
+
+
+def test_output_index_counts_continuation_pages():
+    pages = {2: {"start": 1, "count": 2}, 4: {"start": 4, "count": 3}}
+    assert [output_index(pages, page_num) for page_num in range(1, 6)] == [0, 1, 3, 4, 7]
+
+
+@pytest.fixture
+def students(make_generator):
+    """[(name, pdf bytes, last_pages)] for SEEDS; the second table runs onto continuation pages."""
+    generator = make_generator()
+    built = []
+    for seed in SEEDS:
+        output_doc, warnings = generator.generate(seed=seed)
+        assert warnings == []
+        try:
+            built.append((f"variant_{seed}.pdf", document_bytes(output_doc), generator.last_pages))
+        finally:
+            output_doc.close()
+    assert built[0][2][4]["count"] > 1
+    return built
+
+
+def merge(tmp_path, source_pdf, students, mode, group_size=0):
+    """Runs MergedOutput into a directory; returns {name: open document}."""
+    out_dir = tmp_path / "out"
+    source_doc = fitz.open(source_pdf)
+    try:
+        with DirectorySink(str(out_dir)) as sink:
+            merged_output = MergedOutput(sink, source_doc, mode, group_size)
+            for name, pdf, pages in students:
+                merged_output.add(name, pdf, pages)
+            merged_output.close()
+    finally:
+        source_doc.close()
+    return {path.name: fitz.open(str(path)) for path in out_dir.iterdir()}
+
+
+def page_texts(doc, first=0, count=None):
+    return [doc[index].get_text() for index in range(first, first + (len(doc) - first if count is None else count))]
+
+
+def test_combined_holds_every_booklet_in_seat_order(tmp_path, source_pdf, students):
+    merged = merge(tmp_path, source_pdf, students, MERGE_COMBINED)
+    assert sorted(merged) == ["group_1.pdf"]
+    doc = merged["group_1.pdf"]
+    try:
+        expected_toc = []
+        start = 0
+        for name, pdf, pages in students:
+            student_doc = fitz.open("pdf", pdf)
+            try:
+                assert page_texts(doc, start, len(student_doc)) == page_texts(student_doc)
+                expected_toc += [[1, name[:-4], start + 1], [2, "Part one", start + 1],
+                                 [2, "Part two", start + output_index(pages, 3) + 1]]
+                start += len(student_doc)
+            finally:
+                student_doc.close()
+        assert len(doc) == start
+        assert doc.get_toc(simple=True) == expected_toc
+    finally:
+        doc.close()
+
+
+def test_group_size_splits_the_batch(tmp_path, source_pdf, students):
+    merged = merge(tmp_path, source_pdf, students, MERGE_COMBINED, group_size=2)
+    try:
+        assert sorted(merged) == ["group_1.pdf", "group_2.pdf"]
+        assert [entry[1] for entry in merged["group_2.pdf"].get_toc() if entry[0] == 1] == ["variant_3"]
+    finally:
+        for doc in merged.values():
+            doc.close()
+
+
+def test_sheets_split_static_pages_from_table_pages(tmp_path, source_pdf, students):
+    merged = merge(tmp_path, source_pdf, students, MERGE_SHEETS)
+    try:
+        assert sorted(merged) == [COMMON_PART_NAME, "group_1_variants.pdf"]
+        common = merged[COMMON_PART_NAME]
+        assert len(common) == 2 # Source pages 1 and 3
+        assert common.get_toc(simple=True) == [[1, "Part one", 1], [1, "Part two", 2]]
+        variants = merged["group_1_variants.pdf"]
+        expected_toc = []
+        start = 0
+        for name, pdf, pages in students:
+            expected_toc.append([1, name[:-4], start + 1])
+            student_doc = fitz.open("pdf", pdf)
+            try:
+                for page_num in sorted(pages):
+                    info = pages[page_num]
+                    expected_toc.append([2, f"Page {page_num} ({info['task_key']})", start + 1])
+                    assert page_texts(variants, start, info["count"]) == page_texts(student_doc, info["start"],
+                                                                                      info["count"])
+                    start += info["count"]
+            finally:
+                student_doc.close()
+        assert len(variants) == start
+        assert variants.get_toc(simple=True) == expected_toc
+    finally:
+        for doc in merged.values():
+            doc.close()
+
+
+@pytest.mark.parametrize("value", ["-1", "x"])
+def test_negative_merge_group_is_a_usage_error(value, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args(["batch", "--merge", MERGE_COMBINED, "--merge-group", value])
+    assert exit_info.value.code == 2
+    assert "--merge-group" in capsys.readouterr().err
@@ -0,0 +1,91 @@
+"""Page map files: loaded when asked for, every bad entry reported, never half applied."""
+import json
+
+import pytest
+
+from pdf_generator_core import (
+    PAGE_MAP_ENV, PAGE_MAP_PATH, PAGE_TASK_MAP, PageMapError, configure_page_map, load_page_task_map,
+    use_page_task_map,
+)
+
+ENTRY = {"task_key": "FIRST", "count": 4, "structure": "description", "identifier": "Table 1.1"}
+
+
+def write_map(path, pages):
+    path.write_text(json.dumps({"pages": pages}), encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def restore_page_map(monkeypatch):
+    """configure_page_map() swaps PAGE_TASK_MAP; put the built-in map back afterwards."""
+    saved = dict(PAGE_TASK_MAP)
+    monkeypatch.delenv(PAGE_MAP_ENV, raising=False)
+    yield
+    use_page_task_map(saved)
+
+
+def test_load_converts_entries(tmp_path):
+    path = write_map(tmp_path / "pages.json", {"2": ENTRY, "7": dict(ENTRY, task_key="SECOND", count=1)})
+    assert load_page_task_map(path) == {
+        2: ("FIRST", 4, {"type": "description"}, "Table 1.1"),
+        7: ("SECOND", 1, {"type": "description"}, "Table 1.1"),
+    }
+
+
+@pytest.mark.parametrize("content", ["not json", "[]", '{"tables": {}}', '{"pages": []}'])
+def test_unreadable_file_raises_page_map_error(tmp_path, content):
+    path = tmp_path / "pages.json"
+    path.write_text(content, encoding='utf-8')
+    with pytest.raises(PageMapError, match="Cannot read page map"):
+        load_page_task_map(str(path))
+
+
+def test_missing_file_raises_page_map_error(tmp_path):
+    with pytest.raises(PageMapError, match="Cannot read page map"):
+        load_page_task_map(str(tmp_path / "missing.json"))
+
+
+def test_every_bad_entry_is_listed(tmp_path):
+    path = write_map(tmp_path / "pages.json", {
+        "2": ENTRY,
+        "x": ENTRY,
+        "3": {"task_key": "FIRST"},
+        "4": dict(ENTRY, count=0),
+        "5": dict(ENTRY, structure="no-such-structure"),
+        "6": dict(ENTRY, identifier=" "),
+    })
+    with pytest.raises(PageMapError) as error:
+        load_page_task_map(path)
+    message = str(error.value)
+    for page in ("x", "3", "4", "6"):
+        assert f"page {page}:" in message
+    assert "unknown structure 'no-such-structure'" in message
+    assert "page 2:" not in message
+
+
+def test_bad_map_leaves_the_current_map_alone(tmp_path):
+    before = dict(PAGE_TASK_MAP)
+    with pytest.raises(PageMapError):
+        configure_page_map(write_map(tmp_path / "pages.json", {"2": dict(ENTRY, count=-1)}))
+    assert PAGE_TASK_MAP == before
+
+
+def test_configure_prefers_path_then_environment_then_working_directory(tmp_path, monkeypatch):
+    explicit = write_map(tmp_path / "explicit.json", {"2": ENTRY})
+    from_env = write_map(tmp_path / "env.json", {"3": ENTRY})
+    write_map(tmp_path / PAGE_MAP_PATH, {"4": ENTRY})
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(PAGE_MAP_ENV, from_env)
+
+    assert configure_page_map(explicit) == explicit and sorted(PAGE_TASK_MAP) == [2]
+    assert configure_page_map() == from_env and sorted(PAGE_TASK_MAP) == [3]
+    monkeypatch.delenv(PAGE_MAP_ENV)
+    assert configure_page_map() == PAGE_MAP_PATH and sorted(PAGE_TASK_MAP) == [4]
+
+
+def test_configure_keeps_the_built_in_map_without_a_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    before = dict(PAGE_TASK_MAP)
+    assert configure_page_map() is None
+    assert PAGE_TASK_MAP == before
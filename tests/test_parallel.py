@@ -0,0 +1,35 @@
+"""Worker processes: documents built on a process pool are byte-identical to a serial run."""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from conftest import write_inputs
+from pdf_generator_cli import _close_worker, _generate_one, _init_worker
+from pdf_generator_core import COPY_MODE_CLONE, PAGE_MAP_ENV, TABLE_BACKENDS
+
+JOBS = [(seed, f"variant_{seed}.pdf", None, None) for seed in range(4)]
+
+
+def outputs(results):
+    """(pdf bytes, manifest bytes) of every _generate_one() result."""
+    return [(result[4], result[5]) for result in results]
+
+
+@pytest.mark.parametrize("table_backend", TABLE_BACKENDS)
+def test_pool_output_is_byte_identical_to_serial(tmp_path, source_pdf, monkeypatch, table_backend):
+    tasks_path, pages_path = write_inputs(str(tmp_path))
+    monkeypatch.setenv(PAGE_MAP_ENV, pages_path) # Read by _init_worker in every process
+    initargs = (tasks_path, source_pdf, COPY_MODE_CLONE, None, table_backend)
+
+    _init_worker(*initargs)
+    try:
+        serial = outputs(map(_generate_one, JOBS))
+    finally:
+        _close_worker()
+    # Spawned, not forked: the workers share nothing with this process or each other
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=initargs) as executor:
+        pooled = outputs(executor.map(_generate_one, JOBS))
+    assert pooled == serial
+    assert len(set(pdf for pdf, _ in serial)) == len(JOBS)
@@ -0,0 +1,93 @@
+"""HTTP service: requests are parsed defensively and bad input is a 4xx, never a 500."""
+import asyncio
+import json
+
+import pytest
+
+from pdf_generator_service import GenerationService, HttpError, content_disposition, read_request
+
+
+def read(raw, limit=2 ** 16):
+    async def run():
+        reader = asyncio.StreamReader(limit=limit)
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(run())
+
+
+def test_read_request_parses_method_path_and_body():
+    raw = b'post /generate HTTP/1.1\r\nHost: x\r\nContent-Length: 11\r\n\r\n{"seed": 1}'
+    assert read(raw) == ("POST", "/generate", b'{"seed": 1}')
+
+
+@pytest.mark.parametrize("raw, status", [
+    (b"GARBAGE\r\n\r\n", 400),
+    (b"POST /generate HTTP/1.1\r\nContent-Length: ten\r\n\r\n", 400),
+    (b"POST /generate HTTP/1.1\r\nContent-Length: -5\r\n\r\n", 400),
+    (b"POST /generate HTTP/1.1\r\nContent-Length: 99999999\r\n\r\n", 413),
+    (b"POST /generate HTTP/1.1\r\nX-Padding: " + b"x" * 200 + b"\r\n\r\n", 431),
+    (b"GET /" + b"x" * 200 + b" HTTP/1.1\r\n\r\n", 431),
+    (b"POST /gen", 400),
+    (b"POST /generate HTTP/1.1\r\nHost: x", 400),
+    (b"POST /generate HTTP/1.1\r\nContent-Length: 10\r\n\r\n{}", 400),
+])
+def test_read_request_rejects_malformed_requests(raw, status):
+    with pytest.raises(HttpError) as error:
+        read(raw, limit=128)
+    assert error.value.status == status
+
+
+def test_read_request_lets_an_empty_connection_close_silently():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(b"")
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_a_stalled_client_gets_408():
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"POST /generate HTTP/1.1\r\n") # ... and nothing more
+        writer = FakeWriter()
+        await GenerationService(None, 1, 1, request_timeout=0.05).handle_connection(reader, writer)
+        return writer.data
+    assert asyncio.run(run()).startswith(b"HTTP/1.1 408 Request Timeout\r\n")
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"{", "not JSON"),
+    (b"\xff", "not JSON"),
+    (b'{"seed": ' + b"9" * 5000 + b"}", "not JSON"), # Over Python's int digit limit
+    (b"[]", "JSON object"),
+    (b"{}", "seed, a student_id or both"),
+    (b'{"seed": "1"}', "seed must be an integer"),
+    (b'{"seed": true}', "seed must be an integer"),
+    (b'{"student_id": 5}', "student_id must be a string"),
+    (json.dumps({"student_id": "x\r\nSet-Cookie: a=b"}).encode(), "control characters"),
+])
+def test_generate_rejects_bad_requests(body, message):
+    async def run():
+        return await GenerationService(None, 1, 1).handle_generate(body)
+    with pytest.raises(HttpError, match=message) as error:
+        asyncio.run(run())
+    assert error.value.status == 400
+
+
+def test_content_disposition_is_latin1_safe_for_any_name():
+    header = content_disposition("КН-21-05 \"x\"_17.pdf")
+    header.encode('latin-1')
+    assert header == ("attachment; filename=\"-21-05_x__17.pdf\"; "
+                      "filename*=UTF-8''%D0%9A%D0%9D-21-05%20%22x%22_17.pdf")
@@ -0,0 +1,88 @@
+"""Output sinks: what goes in comes back out, for every kind of --out."""
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from pdf_generator_sinks import DirectorySink, FileSink, StdoutSink, TarSink, ZipSink, open_sink
+
+DOCUMENTS = {"variant_1.pdf": b"%PDF-1.7 first", "variant_2.pdf": b"%PDF-1.7 second"}
+EXTRAS = {"variant_1.pdf.manifest.json": b'{"seed": 1}', "variant_2.pdf.manifest.json": b'{"seed": 2}'}
+
+
+def read_back(target):
+    """{name: bytes} of everything a sink wrote to target."""
+    if target.endswith(".zip"):
+        with zipfile.ZipFile(target) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+    if ".tar" in target or target.endswith(".tgz"):
+        with tarfile.open(target) as archive:
+            return {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+    return {name: open(os.path.join(target, name), 'rb').read() for name in os.listdir(target)}
+
+
+def fill(sink, tmp_path):
+    """Writes the first document as bytes and the second as a finished file, as --window does."""
+    sink.write("variant_1.pdf", DOCUMENTS["variant_1.pdf"])
+    sink.write_extra("variant_1.pdf.manifest.json", EXTRAS["variant_1.pdf.manifest.json"])
+    built = tmp_path / "work" / "variant_2.pdf"
+    built.parent.mkdir(exist_ok=True)
+    built.write_bytes(DOCUMENTS["variant_2.pdf"])
+    sink.write_file("variant_2.pdf", str(built))
+    sink.write_extra("variant_2.pdf.manifest.json", EXTRAS["variant_2.pdf.manifest.json"])
+    assert not built.exists() # write_file consumes the file
+
+
+@pytest.mark.parametrize("target, sink_type", [
+    ("out", DirectorySink), ("out.zip", ZipSink), ("out.tar", TarSink), ("out.tar.gz", TarSink), ("out.tgz", TarSink),
+])
+def test_documents_and_extras_round_trip(tmp_path, target, sink_type):
+    target = str(tmp_path / target)
+    with open_sink(target, len(DOCUMENTS)) as sink:
+        assert isinstance(sink, sink_type)
+        fill(sink, tmp_path)
+    assert read_back(target) == {**DOCUMENTS, **EXTRAS}
+
+
+def test_directory_sink_leaves_no_temp_files(tmp_path):
+    target = str(tmp_path / "out")
+    with open_sink(target, 2) as sink:
+        fill(sink, tmp_path)
+        sink.write("variant_1.pdf", b"%PDF-1.7 replaced")
+    assert sorted(os.listdir(target)) == sorted({**DOCUMENTS, **EXTRAS})
+    assert read_back(target)["variant_1.pdf"] == b"%PDF-1.7 replaced"
+
+
+def test_file_sink_holds_one_document_and_its_extras(tmp_path):
+    target = str(tmp_path / "booklet.pdf")
+    with open_sink(target, 1) as sink:
+        assert isinstance(sink, FileSink)
+        sink.write("variant_7.pdf", b"%PDF-1.7 only")
+        sink.write_extra("variant_7.pdf.manifest.json", b"{}")
+        with pytest.raises(ValueError, match="single document"):
+            sink.write("variant_8.pdf", b"%PDF-1.7 second")
+    assert read_back(str(tmp_path)) == {"booklet.pdf": b"%PDF-1.7 only", "booklet.pdf.manifest.json": b"{}"}
+
+
+def test_single_file_target_refuses_a_batch(tmp_path):
+    with pytest.raises(ValueError, match="for 2 documents"):
+        open_sink(str(tmp_path / "booklet.pdf"), 2)
+
+
+def test_stdout_carries_a_single_document_raw(capfdbinary, tmp_path):
+    with open_sink("-", 1) as sink:
+        assert isinstance(sink, StdoutSink)
+        os.write(1, b"progress goes to stderr\n") # What a pool worker's print() comes down to
+        sink.write("variant_1.pdf", DOCUMENTS["variant_1.pdf"])
+    captured = capfdbinary.readouterr()
+    assert captured.out == DOCUMENTS["variant_1.pdf"]
+    assert b"progress goes to stderr" in captured.err
+
+
+def test_stdout_carries_a_batch_as_a_tar_stream(capfdbinary, tmp_path):
+    with open_sink("-", 2) as sink:
+        fill(sink, tmp_path)
+    with tarfile.open(fileobj=io.BytesIO(capfdbinary.readouterr().out)) as archive:
+        assert {m.name: archive.extractfile(m).read() for m in archive.getmembers()} == {**DOCUMENTS, **EXTRAS}
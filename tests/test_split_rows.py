@@ -0,0 +1,35 @@
+"""Splitting tall tables across continuation pages (DocumentGenerator.split_rows)."""
+from pdf_generator_core import DocumentGenerator
+
+split_rows = DocumentGenerator.split_rows
+
+
+def test_split_rows_keeps_everything_on_one_page_when_it_fits():
+    assert split_rows([10, 20, 20, 20], 100, 100) == [[1, 2, 3]]
+
+
+def test_split_rows_packs_continuations_below_a_repeated_header():
+    assert split_rows([10, 20, 20, 20, 20, 20], 55, 75) == [[1, 2], [3, 4, 5]]
+
+
+def test_split_rows_first_chunk_may_be_empty():
+    assert split_rows([10, 30, 30], 25, 100) == [[], [1, 2]]
+
+
+def test_split_rows_gives_an_oversized_row_its_own_chunk():
+    assert split_rows([10, 20, 500, 20], 100, 100) == [[1], [2], [3]]
+
+
+def test_tall_table_runs_onto_continuation_pages(make_generator):
+    generator = make_generator()
+    output_doc, warnings = generator.generate(seed=1)
+    try:
+        assert warnings == []
+        first, second = generator.last_pages[2], generator.last_pages[4]
+        assert first["count"] == 1 and second["count"] > 1
+        assert second["start"] == 3 and len(output_doc) == 4 + second["count"] - 1
+        # Every continuation page repeats the header row
+        for index in range(second["start"] + 1, second["start"] + second["count"]):
+            assert "Завдання" in output_doc[index].get_text()
+    finally:
+        output_doc.close()
@@ -0,0 +1,132 @@
+"""Task compilation and the task store: bad entries are all reported, a store goes stale with its inputs."""
+import json
+import os
+import re
+
+import pytest
+
+from pdf_generator_core import (
+    TASK_STORE_MAGIC_PREFIX, TaskStoreError, compile_tasks, load_task_store, load_tasks, save_task_store,
+)
+
+# "P" is a pair structure: records of two fields
+PAGE_MAP = {
+    1: ("A", 5, {"type": "description"}, "Table A"),
+    2: ("B", 3, {"type": "description"}, "Table B"),
+    4: ("P", 2, {"type": "function_pair"}, "Table P"),
+}
+TASKS = {"A": ["a < 1", "a2"], "B": ["b1"], "P": [["x = t", "y = t"]]}
+
+
+def test_compile_tasks_builds_escaped_records():
+    compiled = compile_tasks({"A": ["  x < y & z  "], "P": [["x = t", "y = t"], "x = 1\ny = 2",
+                                                           "['x = 3', 'y = 4']"]}, PAGE_MAP)
+    assert compiled["A"] == [("x &lt; y &amp; z",)]
+    assert compiled["P"] == [("x = t", "y = t"), ("x = 1", "y = 2"), ("x = 3", "y = 4")]
+
+
+def test_compile_tasks_rejects_a_non_object():
+    with pytest.raises(TaskStoreError, match="object of task lists"):
+        compile_tasks(["A"], PAGE_MAP)
+
+
+@pytest.mark.parametrize("tasks, expected", [
+    ({"A": "x"}, "A: expected a list of tasks"),
+    ({"A": [""]}, "A[0]: expected non-empty strings"),
+    ({"A": ["ok", 3]}, "A[1]: expected a string"),
+    ({"P": [["only one"]]}, "P[0]: expected 2 strings"),
+    ({"P": ["x = 1\ny = 2\nz = 3"]}, "P[0]: expected 2 strings"),
+    ({"P": ["['x = 1', 'y = 2"]}, "P[0]: expected 2 strings"),
+    ({"P": ["['x = 1', y = 2']"]}, "P[0]: unparsable pair"),
+    ({"P": [["x", "   "]]}, "P[0]: expected non-empty strings"),
+])
+def test_compile_tasks_reports_malformed_entries(tasks, expected):
+    with pytest.raises(TaskStoreError, match=re.escape(expected)):
+        compile_tasks(tasks, PAGE_MAP)
+
+
+def test_compile_tasks_lists_every_bad_entry():
+    with pytest.raises(TaskStoreError) as error:
+        compile_tasks({"A": ["", "ok", 1], "B": None}, PAGE_MAP)
+    assert str(error.value).splitlines()[1:] == ["  A[0]: expected non-empty strings, got ('',)",
+                                                 "  A[2]: expected a string, got 1",
+                                                 "  B: expected a list of tasks, got NoneType"]
+
+
+# --- Task store ---
+
+@pytest.fixture
+def store(tmp_path):
+    """(store path, tasks.json path) of a store compiled from TASKS against PAGE_MAP."""
+    tasks_path = tmp_path / "tasks.json"
+    tasks_path.write_text(json.dumps(TASKS), encoding='utf-8')
+    store_path = str(tmp_path / "tasks.store")
+    save_task_store(store_path, str(tasks_path), tasks_path.read_bytes(), compile_tasks(TASKS, PAGE_MAP), PAGE_MAP)
+    return store_path, tasks_path
+
+
+def test_store_round_trips(store):
+    store_path, _ = store
+    assert load_task_store(store_path, PAGE_MAP) == compile_tasks(TASKS, PAGE_MAP)
+
+
+def test_load_tasks_reads_a_store_or_tasks_json_alike(page_map, tmp_path):
+    tasks_path = tmp_path / "tasks.json"
+    tasks_path.write_text(json.dumps({"FIRST": ["one"], "SECOND": ["two"]}), encoding='utf-8')
+    store_path = str(tmp_path / "tasks.store")
+    compiled = load_tasks(str(tasks_path))
+    save_task_store(store_path, str(tasks_path), tasks_path.read_bytes(), compiled)
+    assert load_tasks(store_path) == compiled == {"FIRST": [("one",)], "SECOND": [("two",)]}
+
+
+def test_touched_but_unchanged_tasks_json_is_still_current(store):
+    store_path, tasks_path = store
+    os.utime(tasks_path, ns=(0, 0))
+    assert load_task_store(store_path, PAGE_MAP) == compile_tasks(TASKS, PAGE_MAP)
+
+
+def test_edited_tasks_json_makes_the_store_stale(store):
+    store_path, tasks_path = store
+    tasks_path.write_text(json.dumps(dict(TASKS, B=["b1", "b2"])), encoding='utf-8')
+    with pytest.raises(TaskStoreError, match="older than"):
+        load_task_store(store_path, PAGE_MAP)
+
+
+def test_store_is_checked_from_any_working_directory(store, tmp_path, monkeypatch):
+    store_path, tasks_path = store
+    monkeypatch.chdir(tmp_path)
+    # Paths relative to the working directory, as `compile` gets them
+    save_task_store("tasks.store", "tasks.json", tasks_path.read_bytes(), compile_tasks(TASKS, PAGE_MAP), PAGE_MAP)
+    tasks_path.write_text(json.dumps(dict(TASKS, B=["b1", "b2"])), encoding='utf-8')
+    elsewhere = tmp_path / "elsewhere"
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    with pytest.raises(TaskStoreError, match="older than"):
+        load_task_store(store_path, PAGE_MAP)
+
+
+def test_store_of_another_page_map_is_stale(store):
+    store_path, _ = store
+    with pytest.raises(TaskStoreError, match="different PAGE_TASK_MAP"):
+        load_task_store(store_path, {**PAGE_MAP, 9: ("C", 1, {"type": "description"}, "Table C")})
+
+
+@pytest.mark.parametrize("content, message", [
+    (TASK_STORE_MAGIC_PREFIX + b"1\n\x80\x05", "older task store format"),
+    (b"{}", "not a task store"),
+])
+def test_foreign_files_are_refused_unread(tmp_path, content, message):
+    path = tmp_path / "tasks.store"
+    path.write_bytes(content)
+    with pytest.raises(TaskStoreError, match=message):
+        load_task_store(str(path), PAGE_MAP)
+
+
+def test_damaged_store_raises_task_store_error(store):
+    store_path, _ = store
+    with open(store_path, 'rb') as f:
+        raw = f.read()
+    with open(store_path, 'wb') as f:
+        f.write(raw[:len(raw) // 2])
+    with pytest.raises(TaskStoreError, match="damaged"):
+        load_task_store(store_path, PAGE_MAP)
@@ -0,0 +1,104 @@
+"""In-place updates: only changed tables are redrawn, and the result matches a fresh build."""
+import fitz  # PyMuPDF
+import pytest
+
+from conftest import SYNTHETIC_TASKS
+from pdf_generator_core import TABLE_BACKENDS, document_bytes
+from pdf_generator_incremental import build_manifest, load_manifest, save_manifest
+
+SEED = 5
+# Same pool sizes, so the seed selects the same items; only SECOND's texts change
+EDITED_TASKS = dict(SYNTHETIC_TASKS, SECOND=[task.replace("variant", "edited variant")
+                                             for task in SYNTHETIC_TASKS["SECOND"]])
+
+
+def build(generator, seed=SEED):
+    """A generated document as update() gets it: saved, then reopened. Returns (doc, last_pages)."""
+    output_doc, warnings = generator.generate(seed=seed)
+    assert warnings == []
+    try:
+        pdf_bytes = document_bytes(output_doc)
+    finally:
+        output_doc.close()
+    return fitz.open("pdf", pdf_bytes), generator.last_pages
+
+
+def page_texts(doc):
+    return [page.get_text() for page in doc]
+
+
+def test_unchanged_inputs_redraw_nothing(make_generator):
+    generator = make_generator()
+    doc, pages = build(generator)
+    try:
+        before = page_texts(doc)
+        changed, warnings = generator.update(doc, pages, seed=SEED)
+        assert (changed, warnings) == ([], [])
+        assert page_texts(doc) == before
+        assert generator.last_pages == pages
+    finally:
+        doc.close()
+
+
+@pytest.mark.parametrize("table_backend", TABLE_BACKENDS)
+def test_only_changed_tables_are_redrawn_and_match_a_fresh_build(make_generator, tmp_path, table_backend):
+    generator = make_generator(table_backend=table_backend)
+    doc, _ = build(generator)
+    # As `update` does it: the page record comes back from the document's manifest
+    path = str(tmp_path / "variant.pdf.manifest.json")
+    save_manifest(path, build_manifest(generator, SEED))
+    pages = load_manifest(path)["pages"]
+    edited = make_generator(tasks=EDITED_TASKS, table_backend=table_backend)
+    fresh_doc, fresh_pages = build(edited)
+    try:
+        first_table = doc[pages[2]["start"]].get_text()
+        changed, warnings = edited.update(doc, pages, seed=SEED)
+        assert (changed, warnings) == ([4], [])
+        assert doc[edited.last_pages[2]["start"]].get_text() == first_table
+        assert edited.last_pages == fresh_pages
+        # Saved and reopened, the patched document reads exactly like the fresh one
+        patched = fitz.open("pdf", document_bytes(doc, clean=False))
+        try:
+            assert page_texts(patched) == page_texts(fresh_doc)
+            assert "edited variant" in patched[fresh_pages[4]["start"]].get_text()
+        finally:
+            patched.close()
+    finally:
+        doc.close()
+        fresh_doc.close()
+
+
+def test_another_seed_redraws_every_table(make_generator):
+    generator = make_generator()
+    doc, pages = build(generator)
+    fresh_doc, _ = build(make_generator(), seed=SEED + 1)
+    try:
+        changed, _ = generator.update(doc, pages, seed=SEED + 1)
+        assert sorted(changed) == [2, 4]
+        assert page_texts(doc) == page_texts(fresh_doc)
+    finally:
+        doc.close()
+        fresh_doc.close()
+
+
+def test_direct_tables_redrawn_by_update_render_like_a_fresh_build(make_generator):
+    # The patched page still lists the old table's subset font; the new
+    # text needs glyphs that subset does not have
+    omega_tasks = dict(SYNTHETIC_TASKS, SECOND=[task.replace("variant", "variant Ω")
+                                                for task in SYNTHETIC_TASKS["SECOND"]])
+    generator = make_generator(table_backend="direct")
+    doc, pages = build(generator)
+    edited = make_generator(tasks=omega_tasks, table_backend="direct")
+    fresh_doc, fresh_pages = build(edited)
+    try:
+        changed, _ = edited.update(doc, pages, seed=SEED)
+        assert changed == [4]
+        patched = fitz.open("pdf", document_bytes(doc, clean=False))
+        try:
+            for index in range(fresh_pages[4]["start"], fresh_pages[4]["start"] + fresh_pages[4]["count"]):
+                assert patched[index].get_pixmap().samples == fresh_doc[index].get_pixmap().samples
+        finally:
+            patched.close()
+    finally:
+        doc.close()
+        fresh_doc.close()
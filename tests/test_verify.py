@@ -0,0 +1,125 @@
+"""Output verification: a good document passes, and each kind of defect is reported as such."""
+import json
+
+import pytest
+
+import fitz  # PyMuPDF
+
+from conftest import SYNTHETIC_TASKS
+from pdf_generator_core import TABLE_BACKENDS, document_bytes
+from pdf_generator_verify import build_report, describe_failures, page_ok, save_report, verify_document
+
+SEED = 3
+
+
+def build(generator, seed=SEED):
+    """The generated document saved and reopened, as batch --verify checks it."""
+    output_doc, _ = generator.generate(seed=seed)
+    try:
+        return fitz.open("pdf", document_bytes(output_doc))
+    finally:
+        output_doc.close()
+
+
+def page_report(report, page_num):
+    return next(page for page in report["pages"] if page["page"] == page_num)
+
+
+@pytest.mark.parametrize("table_backend", TABLE_BACKENDS)
+def test_generated_document_verifies(make_generator, table_backend):
+    generator = make_generator(table_backend=table_backend)
+    doc = build(generator)
+    try:
+        report = verify_document(generator, doc)
+    finally:
+        doc.close()
+    assert report["ok"], describe_failures(report)
+    assert [page["page"] for page in report["pages"]] == [2, 4]
+    assert page_report(report, 4)["items"] == len(generator.last_selection[4])
+    assert describe_failures(report) == []
+
+
+def test_text_outside_the_table_frame_is_clipped(make_generator, monkeypatch):
+    generator = make_generator()
+    doc = build(generator)
+    # A frame one point high: every field is still on the page, none inside it
+    monkeypatch.setattr(generator, "table_frame", lambda page, top: fitz.Rect(0, top, page.rect.width, top + 1))
+    try:
+        report = verify_document(generator, doc)
+    finally:
+        doc.close()
+    first = page_report(report, 2)
+    assert not report["ok"] and first["missing"] == []
+    assert len(first["clipped"]) == sum(len(record) for record in generator.last_selection[2])
+
+
+def test_fields_not_in_the_document_are_missing(make_generator):
+    generator = make_generator()
+    doc = build(generator)
+    selection = dict(generator.last_selection)
+    selection[2] = selection[2][:-1] + [["Never drawn anywhere"]]
+    try:
+        report = verify_document(generator, doc, selected_tasks_for_pages=selection)
+    finally:
+        doc.close()
+    assert page_report(report, 2)["missing"] == ["Never drawn anywhere"]
+    assert page_ok(page_report(report, 4))
+    assert describe_failures(report) == ["page 2 (FIRST): 1 item(s) missing"]
+
+
+@pytest.mark.parametrize("table_backend", TABLE_BACKENDS)
+def test_field_only_inside_a_longer_cell_is_missing(make_generator, table_backend):
+    generator = make_generator(table_backend=table_backend)
+    doc = build(generator)
+    selection = dict(generator.last_selection)
+    # "First task" is part of every drawn cell on page 2, but no cell is just that
+    selection[2] = selection[2][:-1] + [["First task"]]
+    try:
+        report = verify_document(generator, doc, selected_tasks_for_pages=selection)
+    finally:
+        doc.close()
+    assert page_report(report, 2)["missing"] == ["First task"]
+    assert page_report(report, 2)["clipped"] == []
+
+
+def test_short_pool_and_missing_task_key_are_problems(make_generator):
+    generator = make_generator(tasks={"FIRST": SYNTHETIC_TASKS["FIRST"][:2]})
+    doc = build(generator)
+    try:
+        report = verify_document(generator, doc)
+    finally:
+        doc.close()
+    first, second = page_report(report, 2), page_report(report, 4)
+    assert first["placeholders"] > 0
+    assert first["problems"] == [f"pool ran short: {first['placeholders']} placeholder cell(s)"]
+    assert second["problems"] == ["no items selected"]
+
+
+def test_undrawn_table_and_error_cells_are_problems(make_generator):
+    generator = make_generator()
+    doc = build(generator)
+    pages = {page_num: dict(info) for page_num, info in generator.last_pages.items()}
+    pages[4]["table_key"] = None
+    first_page = doc[pages[2]["start"]]
+    first_page.insert_text((80, generator.anchors[2].insert_y + 12), "Error: Unhandled Table Type", fontsize=8)
+    try:
+        report = verify_document(generator, doc, pages=pages)
+    finally:
+        doc.close()
+    assert page_report(report, 2)["problems"] == ["error cell in table"]
+    assert page_report(report, 4)["problems"] == ["table not drawn"]
+
+
+def test_report_lists_failed_documents(make_generator, tmp_path):
+    generator = make_generator()
+    doc = build(generator)
+    try:
+        good = dict(verify_document(generator, doc), document="variant_1.pdf", seed=1)
+        bad = dict(verify_document(generator, doc, selected_tasks_for_pages={}), document="variant_2.pdf", seed=2)
+    finally:
+        doc.close()
+    path = str(tmp_path / "verify.json")
+    save_report(path, build_report([good, bad]))
+    with open(path, encoding='utf-8') as f:
+        report = json.load(f)
+    assert (report["documents"], report["failed"]) == (2, ["variant_2.pdf"])
@@ -0,0 +1,109 @@
+"""Windowed generation: built on disk a few pages at a time, the same document as in memory."""
+import os
+
+import pytest
+
+import fitz  # PyMuPDF
+
+from conftest import SYNTHETIC_TASKS
+from pdf_generator_cli import batch_save_garbage, build_parser
+from pdf_generator_core import (
+    COPY_MODES, SAVE_GARBAGE, TABLE_BACKEND_DIRECT, TABLE_BACKENDS, WINDOW_SAVE_GARBAGE, DocumentGenerator,
+    compile_tasks, document_bytes,
+)
+from pdf_generator_verify import describe_failures, verify_document
+
+SEED = 7
+
+
+def page_texts(doc):
+    return [page.get_text() for page in doc]
+
+
+@pytest.mark.parametrize("copy_mode", COPY_MODES)
+@pytest.mark.parametrize("table_backend", TABLE_BACKENDS)
+def test_windowed_document_matches_the_in_memory_one(make_generator, tmp_path, copy_mode, table_backend):
+    in_memory = make_generator(copy_mode=copy_mode, table_backend=table_backend)
+    output_doc, warnings = in_memory.generate(seed=SEED)
+    assert warnings == []
+    try:
+        expected_bytes = document_bytes(output_doc)
+    finally:
+        output_doc.close()
+    expected = fitz.open("pdf", expected_bytes)
+
+    # One source page per window: every table is drawn in a window of its own
+    windowed = make_generator(copy_mode=copy_mode, table_backend=table_backend, window=1)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    path = str(out_dir / "variant.pdf")
+    # At the in-memory save's level, so the sizes below compare
+    assert windowed.generate_to_file(path, seed=SEED, garbage=SAVE_GARBAGE) == []
+    doc = fitz.open(path)
+    try:
+        assert page_texts(doc) == page_texts(expected)
+        assert windowed.last_pages == in_memory.last_pages
+        report = verify_document(windowed, doc)
+        assert report["ok"], describe_failures(report)
+    finally:
+        doc.close()
+        expected.close()
+    # Compacted once at the end: fonts and source resources are not repeated per window
+    assert os.path.getsize(path) <= len(expected_bytes) * 1.02
+    assert os.listdir(out_dir) == ["variant.pdf"] # No temp file left behind
+
+
+def test_negative_window_is_refused(source_pdf):
+    with pytest.raises(ValueError, match="window"):
+        DocumentGenerator(compile_tasks(SYNTHETIC_TASKS), source_pdf, anchor_index_path=None, window=-1)
+
+
+def test_negative_window_is_a_usage_error(capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        build_parser().parse_args(["batch", "--window", "-2"])
+    assert exit_info.value.code == 2
+    assert "--window" in capsys.readouterr().err
+
+
+def embedded_fonts(doc):
+    return {font[0] for page in doc for font in page.get_fonts() if font[2] == "Type0"}
+
+
+@pytest.mark.parametrize("copy_mode", COPY_MODES)
+def test_windows_share_the_direct_table_fonts(make_generator, tmp_path, copy_mode):
+    in_memory = make_generator(copy_mode=copy_mode, table_backend=TABLE_BACKEND_DIRECT)
+    output_doc, _ = in_memory.generate(seed=SEED)
+    expected = fitz.open("pdf", document_bytes(output_doc))
+    output_doc.close()
+    windowed = make_generator(copy_mode=copy_mode, table_backend=TABLE_BACKEND_DIRECT, window=1)
+    path = str(tmp_path / "variant.pdf")
+    windowed.generate_to_file(path, seed=SEED) # Garbage level 3 does not merge font copies
+    doc = fitz.open(path)
+    try:
+        assert len(embedded_fonts(doc)) == len(embedded_fonts(expected)) > 0
+    finally:
+        doc.close()
+        expected.close()
+
+
+@pytest.mark.parametrize("argv, level", [
+    ([], SAVE_GARBAGE),
+    (["--window", "4"], WINDOW_SAVE_GARBAGE),
+    (["--window", "4", "--garbage", "4"], 4),
+    (["--garbage", "1"], 1),
+])
+def test_window_defaults_to_a_faster_compaction(argv, level):
+    args = build_parser().parse_args(["batch", "--count", "1", "--out", "out/"] + argv)
+    assert batch_save_garbage(args) == level
+
+
+def test_windowed_document_at_the_default_level_verifies(make_generator, tmp_path):
+    generator = make_generator(window=1)
+    path = str(tmp_path / "variant.pdf")
+    assert generator.generate_to_file(path, seed=SEED) == []
+    doc = fitz.open(path)
+    try:
+        report = verify_document(generator, doc)
+    finally:
+        doc.close()
+    assert report["ok"], describe_failures(report)